@@ -19,134 +19,114 @@ Fecha: 2024 - Versión Nueva Estructura
 """
 # python -m pip install -r requirements.txt
 
-from flask import Flask, render_template, jsonify, request, flash, redirect, url_for, send_file
+from flask import Response, render_template, jsonify, request, flash, redirect, url_for, send_file
 from flask_login import LoginManager, login_required, current_user
+import base64
 import json
 import os
 import re
 from datetime import datetime, date
-from pathlib import Path
 from io import BytesIO
 
-# Importar modelos y rutas de autenticación
-from models import db, Usuario, init_db, VisitaPagina
-from auth import auth_bp, init_oauth
+# Importar modelos y servicios (auth, OAuth y reportlab se cargan en create_app o al usarse)
+from models import init_db
+from fabrica import crear_app_base, RegistroRutas
+from catalogo import (catalogo_ejercicios, CODIGOS_MATERIAS, Ejercicio,
+                      obtener_info_materia, obtener_nombre_materia)
+from render_latex import procesar_latex
+from visitas import registro_visitas
+from cuotas import cuota_actual, init_cuotas
+from identidad import cache_identidades
 
-app = Flask(__name__)
-
-# Configuración de la aplicación
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-
-# Configuración de la base de datos
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///plataforma.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Configuración de sesiones
-app.config['SECRET_KEY'] = 'tu_clave_secreta_aqui_cambiala_en_produccion'
-
-# Inicializar extensiones
-db.init_app(app)
-init_oauth(app)  # Inicializar OAuth
+# Rutas de este módulo; create_app las registra en cada aplicación
+rutas = RegistroRutas()
 
 # Configurar Flask-Login
 login_manager = LoginManager()
-login_manager.init_app(app)
 login_manager.login_view = 'auth.login'
 login_manager.login_message = 'Por favor inicia sesión para acceder a esta página.'
 login_manager.login_message_category = 'info'
 
 @login_manager.user_loader
 def load_user(user_id):
-    return Usuario.query.get(int(user_id))
+    # Identidad reducida en caché; el Usuario completo se carga solo si se necesita
+    return cache_identidades.cargar(user_id)
 
-# Registrar blueprints
-app.register_blueprint(auth_bp)
-
-# Mapeo de códigos de materia a nombres amigables
-CODIGOS_MATERIAS = {
-    'MATU': {'nombre': 'Matemáticas Preuniversitaria', 'color': '#2563eb'},
-    'FISU': {'nombre': 'Física Preuniversitaria', 'color': '#dc2626'},
-    'QUIM': {'nombre': 'Química Preuniversitaria', 'color': '#16a34a'},
-    'LENG': {'nombre': 'Lenguaje y Literatura', 'color': '#ea580c'},
-    'CAL2': {'nombre': 'Cálculo 2', 'color': '#7c3aed'},
-    'ALGN': {'nombre': 'Álgebra Lineal', 'color': '#0891b2'},
-    'FIS1': {'nombre': 'Física 1', 'color': '#be123c'},
-    'FIS2': {'nombre': 'Física 2', 'color': '#a21caf'},
-    'HIST': {'nombre': 'Historia', 'color': '#ca8a04'},
-    'EDIF': {'nombre': 'Ecuaciones Diferenciales', 'color': '#059669'}
-}
+def create_app(config_name=None):
+    """
+    Fábrica de la aplicación web completa.
+
+    ``config_name`` es una clave de ``config.config`` (por defecto
+    ``FLASK_CONFIG`` o 'default', ver ``fabrica.nombre_configuracion``).
+    Crea las tablas faltantes y aplica las migraciones pendientes (salvo
+    con ``MIGRAR_AL_INICIAR`` desactivado); no carga el catálogo: se
+    carga en su primer uso, OAuth en el primer inicio de sesión con Google
+    y reportlab al generar el primer PDF.
+    """
+    from auth import auth_bp
+
+    app = crear_app_base(config_name, import_name=__name__)
+
+    # Esquema al día antes de atender solicitudes (idempotente, ver version_esquema)
+    if app.config.get('MIGRAR_AL_INICIAR'):
+        from migraciones import actualizar_esquema
+        with app.app_context():
+            actualizar_esquema()
+
+    # Inicializar extensiones
+    login_manager.init_app(app)
+    catalogo_ejercicios.init_app(app)  # Una instantánea del catálogo por solicitud (y vigilante opcional)
+    registro_visitas.init_app(app)  # Registro de visitas por lotes en segundo plano
+    init_cuotas(app)  # Guardado de la cuota diaria al final de cada solicitud
+    cache_identidades.init_app(app)  # Caché de identidades para Flask-Login
+
+    # Registrar blueprints y rutas
+    app.register_blueprint(auth_bp)
+    rutas.registrar(app)
+    return app
+
+_app = None
+
+def __getattr__(nombre):
+    """``app`` se crea en el primer acceso (``from app import app``, ``gunicorn app:app``)"""
+    global _app
+    if nombre == 'app':
+        if _app is None:
+            _app = create_app()
+        return _app
+    raise AttributeError(f"module {__name__!r} has no attribute {nombre!r}")
 
 def cargar_ejercicios():
-    """Carga todos los ejercicios desde los nuevos archivos JSON"""
-    ejercicios = []
-    
-    # Intentar cargar desde el archivo nuevo primero
-    try:
-        with open('etiquetas/todos_ejercicios_nuevo.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            ejercicios.extend(data['ejercicios'])
-        print(f"✅ Cargados {len(ejercicios)} ejercicios desde estructura nueva")
-    except FileNotFoundError:
-        print("⚠️  Archivo todos_ejercicios_nuevo.json no encontrado")
-        # Fallback al archivo antiguo
-        try:
-            with open('etiquetas/todos_ejercicios.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                ejercicios.extend(data['ejercicios'])
-            print(f"📄 Cargados {len(ejercicios)} ejercicios desde estructura antigua")
-        except FileNotFoundError:
-            print("❌ No se encontraron archivos de ejercicios")
-    
-    # Agregar nombre completo de materia a cada ejercicio
-    for ejercicio in ejercicios:
-        if 'codigo_materia' in ejercicio:
-            ejercicio['nombre_materia'] = obtener_nombre_materia(ejercicio['codigo_materia'])
-    
-    return ejercicios
+    """Devuelve los ejercicios del catálogo en memoria (vistas de solo lectura)"""
+    return list(catalogo_ejercicios.ejercicios)
+
+def renderizar_ejercicio(ejercicio):
+    """Devuelve una copia mutable del ejercicio con el LaTeX ya convertido a HTML"""
+    html = catalogo_ejercicios.html(ejercicio.get('id'))
+    if html:
+        # El LaTeX comprimido no hace falta: se reemplaza por el HTML precalculado
+        ejercicio = ejercicio.sin_textos() if isinstance(ejercicio, Ejercicio) else dict(ejercicio)
+        ejercicio['enunciado'], ejercicio['solucion'] = html
+    else:
+        ejercicio = dict(ejercicio)
+        ejercicio['enunciado'] = procesar_latex(ejercicio.get('enunciado'))
+        ejercicio['solucion'] = procesar_latex(ejercicio.get('solucion'))
+    ejercicio['info_materia'] = obtener_info_materia(ejercicio.get('codigo_materia', ''))
+    return ejercicio
 
 def cargar_metadatos():
-    """Carga los metadatos de ejercicios"""
-    try:
-        with open('etiquetas/metadata_ejercicios_nuevo.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            # Agregar compatibilidad con templates existentes
-            data['materias'] = data.get('codigos_materia', {})
-            # Agregar nombres completos de materias para los filtros
-            data['materias_nombres'] = {}
-            for codigo, count in data.get('codigos_materia', {}).items():
-                data['materias_nombres'][codigo] = obtener_nombre_materia(codigo)
-            # Agregar campos faltantes para estadísticas
-            data['visibles_web'] = data.get('total_ejercicios', 0)  # Por defecto todos visibles
-            data['no_visibles_web'] = 0
-            return data
-    except FileNotFoundError:
-        # Fallback al archivo antiguo
-        try:
-            with open('etiquetas/metadata_ejercicios.json', 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # Agregar compatibilidad con templates existentes
-                data['materias'] = data.get('codigos_materia', {})
-                # Agregar nombres completos de materias para los filtros
-                data['materias_nombres'] = {}
-                for codigo, count in data.get('codigos_materia', {}).items():
-                    data['materias_nombres'][codigo] = obtener_nombre_materia(codigo)
-                # Agregar campos faltantes para estadísticas
-                data['visibles_web'] = data.get('total_ejercicios', 0)
-                data['no_visibles_web'] = 0
-                return data
-        except FileNotFoundError:
-            return {
-                "total_ejercicios": 0, 
-                "materias_principales": {}, 
-                "capitulos": {}, 
-                "niveles": {},
-                "dificultades": {},
-                "codigos_materia": {},
-                "materias": {},  # Para compatibilidad con templates
-                "materias_nombres": {},  # Nombres completos de materias
-                "visibles_web": 0,
-                "no_visibles_web": 0
-            }
+    """Carga los metadatos de ejercicios (conteos calculados desde el catálogo)"""
+    data = catalogo_ejercicios.metadatos()
+    # Agregar compatibilidad con templates existentes
+    data['materias'] = data.get('codigos_materia', {})
+    # Agregar nombres completos de materias para los filtros
+    data['materias_nombres'] = {}
+    for codigo, count in data.get('codigos_materia', {}).items():
+        data['materias_nombres'][codigo] = obtener_nombre_materia(codigo)
+    # Agregar campos faltantes para estadísticas
+    data['visibles_web'] = data.get('total_ejercicios', 0)  # Por defecto todos visibles
+    data['no_visibles_web'] = 0
+    return data
 
 def cargar_teoria():
     """Carga la teoría de los capítulos"""
@@ -164,181 +144,7 @@ def cargar_formularios():
     except FileNotFoundError:
         return {"formularios": {}, "formularios_generales": {}}
 
-def procesar_latex(texto):
-    """Procesa el texto LaTeX para que sea compatible con MathJax y HTML"""
-    if not texto:
-        return texto
-    
-    # Función auxiliar para encontrar la ruta correcta de la imagen
-    def encontrar_ruta_imagen(ruta_imagen):
-        # Buscar en la nueva estructura
-        materias_principales = [
-            'matematicas_preuniversitaria',
-            'fisica_preuniversitaria', 
-            'quimica_preuniversitaria',
-            'lenguaje_literatura'
-        ]
-        
-        for materia in materias_principales:
-            # Buscar en todos los capítulos de la materia
-            materia_path = Path(f'ejercicios_nuevo/{materia}')
-            if materia_path.exists():
-                for capitulo_dir in materia_path.iterdir():
-                    if capitulo_dir.is_dir():
-                        ruta_completa = capitulo_dir / 'imagenes' / ruta_imagen
-                        if ruta_completa.exists():
-                            return f'/static/ejercicios_nuevo/{materia}/{capitulo_dir.name}/imagenes/{ruta_imagen}'
-        
-        # Si no se encuentra en la nueva estructura, devolver ruta por defecto
-        return f'/static/ejercicios_nuevo/{ruta_imagen}'
-    
-    # Eliminar líneas de comentarios de LaTeX (que empiezan con %)
-    lineas = texto.split('\n')
-    lineas_filtradas = []
-    for linea in lineas:
-        linea_limpia = linea.strip()
-        if linea_limpia and not linea_limpia.startswith('%'):
-            lineas_filtradas.append(linea)
-    texto = '\n'.join(lineas_filtradas)
-    
-    # Procesar entornos figure
-    figure_pattern = r'\\begin\{figure\}\[([^\]]*)\](.*?)\\end\{figure\}'
-    
-    def procesar_figure(match):
-        opciones = match.group(1)
-        contenido = match.group(2).strip()
-        
-        # Extraer la imagen y el caption
-        imagen_match = re.search(r'\\includegraphics\[([^\]]*)\]\{([^}]+)\}', contenido)
-        caption_match = re.search(r'\\caption\{([^}]+)\}', contenido)
-        
-        if imagen_match:
-            opciones_img = imagen_match.group(1)
-            ruta_imagen = imagen_match.group(2)
-            
-            # Convertir ruta de imagen para web
-            ruta_web = encontrar_ruta_imagen(ruta_imagen)
-            
-            # Construir HTML para la imagen
-            html_img = f'<img src="{ruta_web}" alt="Diagrama" class="img-fluid rounded shadow-sm" style="max-width: 100%; height: auto;">'
-            
-            # Agregar caption si existe
-            caption_html = ""
-            if caption_match:
-                caption_text = caption_match.group(1)
-                caption_html = f'<figcaption class="text-center mt-2 text-muted"><small><em>{caption_text}</em></small></figcaption>'
-            
-            # Construir figure HTML completo
-            figure_html = f'<figure class="text-center my-4">{html_img}{caption_html}</figure>'
-            
-            return figure_html
-        
-        return match.group(0)
-    
-    # Aplicar procesamiento de figure
-    texto = re.sub(figure_pattern, procesar_figure, texto, flags=re.DOTALL)
-    
-    # Reemplazar \n con <br> para saltos de línea
-    texto = texto.replace('\n', '<br>')
-    
-    # Convertir comandos LaTeX de formato a HTML
-    texto = re.sub(r'\\textbf\{([^}]+)\}', r'<strong>\1</strong>', texto)
-    texto = re.sub(r'\\textit\{([^}]+)\}', r'<em>\1</em>', texto)
-    texto = re.sub(r'\\underline\{([^}]+)\}', r'<u>\1</u>', texto)
-    texto = re.sub(r'\\text\{([^}]+)\}', r'\1', texto)
-    
-    # Convertir listas numeradas con formato
-    texto = re.sub(r'(\d+\))\s*\\textbf\{([^}]+)\}', r'\1 <strong>\2</strong>', texto)
-    
-    # Convertir listas con itemize y enumerate
-    texto = re.sub(r'\\begin\{itemize\}(.*?)\\end\{itemize\}', r'<ul>\1</ul>', texto, flags=re.DOTALL)
-    texto = re.sub(r'\\begin\{enumerate\}(.*?)\\end\{enumerate\}', r'<ol>\1</ol>', texto, flags=re.DOTALL)
-    texto = re.sub(r'\\item\s*', r'<li>', texto)
-    # Cerrar las listas de manera más simple
-    texto = re.sub(r'</ul>\s*<ul>', r'', texto)
-    texto = re.sub(r'</ol>\s*<ol>', r'', texto)
-    
-    # Convertir respuestas y notas
-    texto = re.sub(r'\\textbf\{Respuesta:\}\s*([^<]+)', r'<div class="alert alert-success mt-3"><strong>Respuesta:</strong> \1</div>', texto)
-    texto = re.sub(r'\\textbf\{Nota:\}\s*([^<]+)', r'<div class="alert alert-info mt-2"><strong>Nota:</strong> \1</div>', texto)
-    
-    # Convertir símbolos matemáticos comunes
-    texto = re.sub(r'\\cdot', r'·', texto)
-    texto = re.sub(r'\\div', r'÷', texto)
-    texto = re.sub(r'\\to', r'→', texto)
-    texto = re.sub(r'\\infty', r'∞', texto)
-    
-    # Asegurar que las fórmulas estén bien formateadas
-    texto = re.sub(r'\$([^$]+)\$', r'$\1$', texto)
-    texto = re.sub(r'\$\$([^$]+)\$\$', r'$$\1$$', texto)
-    
-    return texto
-
-def obtener_info_materia(codigo_materia):
-    """Obtiene información amigable de una materia por su código"""
-    return CODIGOS_MATERIAS.get(codigo_materia, {
-        'nombre': codigo_materia,
-        'color': '#6b7280'
-    })
-
-def obtener_nombre_materia(codigo_materia):
-    """Obtiene el nombre completo de una materia por su código"""
-    info = obtener_info_materia(codigo_materia)
-    return info['nombre']
-
-def buscar_ejercicios_por_palabras(ejercicios, palabras_busqueda):
-    """
-    Busca ejercicios que contengan las palabras clave en cualquier atributo
-    
-    Args:
-        ejercicios: Lista de ejercicios
-        palabras_busqueda: String con palabras separadas por espacios
-    
-    Returns:
-        Lista de ejercicios que coinciden con la búsqueda
-    """
-    if not palabras_busqueda or not palabras_busqueda.strip():
-        return ejercicios
-    
-    # Normalizar y dividir las palabras de búsqueda
-    palabras = [palabra.lower().strip() for palabra in palabras_busqueda.split() if palabra.strip()]
-    
-    if not palabras:
-        return ejercicios
-    
-    ejercicios_coincidentes = []
-    
-    for ejercicio in ejercicios:
-        # Crear un texto combinado de todos los atributos relevantes
-        texto_completo = ' '.join([
-            str(ejercicio.get('id', '')),
-            str(ejercicio.get('codigo_materia', '')),
-            str(ejercicio.get('materia_principal', '')),
-            str(ejercicio.get('capitulo', '')),
-            str(ejercicio.get('nivel', '')),
-            str(ejercicio.get('dificultad', '')),
-            str(ejercicio.get('visibilidad', '')),
-            str(ejercicio.get('procedencia', '')),
-            str(ejercicio.get('enunciado', '')),
-            str(ejercicio.get('solucion', '')),
-            str(ejercicio.get('tags', '')),
-            str(ejercicio.get('institucion', '')),
-            str(ejercicio.get('año', '')),
-            str(ejercicio.get('periodo', '')),
-            str(ejercicio.get('tipo_examen', '')),
-            # Agregar información de la materia
-            str(CODIGOS_MATERIAS.get(ejercicio.get('codigo_materia', ''), {}).get('nombre', ''))
-        ]).lower()
-        
-        # Verificar si todas las palabras están presentes
-        todas_palabras_encontradas = all(palabra in texto_completo for palabra in palabras)
-        
-        if todas_palabras_encontradas:
-            ejercicios_coincidentes.append(ejercicio)
-    
-    return ejercicios_coincidentes
-
-@app.before_request
+@rutas.before_request
 def registrar_visita():
     try:
         # Solo registrar solicitudes GET normales (no static ni favicon)
@@ -349,23 +155,20 @@ def registrar_visita():
         # Evitar registrar llamadas a APIs internas si no deseas contarlas
         # if request.path.startswith('/api/'): return
 
-        visita = VisitaPagina(
+        # Solo se encola: el hilo de registro_visitas escribe por lotes
+        registro_visitas.registrar(
             path=request.path,
             usuario_id=(current_user.id if hasattr(current_user, 'is_authenticated') and current_user.is_authenticated else None),
             ip_address=request.headers.get('X-Forwarded-For', request.remote_addr),
             user_agent=request.headers.get('User-Agent')
         )
-        db.session.add(visita)
-        db.session.commit()
     except Exception:
-        db.session.rollback()
         # No bloquear la solicitud por errores de logging
         return
 
-@app.route('/')
+@rutas.route('/')
 def index():
     """Página principal con todos los ejercicios"""
-    ejercicios = cargar_ejercicios()
     metadatos = cargar_metadatos()
     
     # Obtener filtros de la URL
@@ -378,96 +181,51 @@ def index():
     busqueda = request.args.get('busqueda', '')  # Nuevo parámetro de búsqueda
 
     
-    # Aplicar filtros
-    ejercicios_filtrados = ejercicios.copy()
-    
     # Aplicar filtro de materias favoritas del usuario (si está autenticado y tiene materias favoritas)
+    materias_favoritas = []
     mostrar_todas = request.args.get('mostrar_todas', '0') == '1'
     if current_user.is_authenticated and current_user.materias_favoritas and not mostrar_todas:
         materias_favoritas = current_user.materias_favoritas.split(',')
         materias_favoritas = [m.strip() for m in materias_favoritas if m.strip()]
-        if materias_favoritas:
-            ejercicios_filtrados = [e for e in ejercicios_filtrados if e.get('codigo_materia') in materias_favoritas]
-    
-    # Aplicar búsqueda por palabras primero
-    if busqueda:
-        ejercicios_filtrados = buscar_ejercicios_por_palabras(ejercicios_filtrados, busqueda)
-    
-    # Aplicar filtros adicionales
-    if codigo_materia:
-        ejercicios_filtrados = [e for e in ejercicios_filtrados if e.get('codigo_materia') == codigo_materia]
-    if materia_principal:
-        ejercicios_filtrados = [e for e in ejercicios_filtrados if e.get('materia_principal') == materia_principal]
-    if nivel:
-        ejercicios_filtrados = [e for e in ejercicios_filtrados if e.get('nivel') == nivel]
-    if capitulo:
-        ejercicios_filtrados = [e for e in ejercicios_filtrados if e.get('capitulo') == capitulo]
-    if dificultad:
-        ejercicios_filtrados = [e for e in ejercicios_filtrados if str(e.get('dificultad', '')) == dificultad]
-    if visibilidad:
-        ejercicios_filtrados = [e for e in ejercicios_filtrados if e.get('visibilidad') == visibilidad]
-    
-
     
-    # Aplicar límites diarios de visualización
+    # Aplicar búsqueda por palabras y filtros adicionales (intersección de índices)
+    ejercicios_filtrados, facetas = catalogo_ejercicios.filtrar(
+        {'codigo_materia': materias_favoritas},
+        {
+            'codigo_materia': codigo_materia,
+            'materia_principal': materia_principal,
+            'nivel': nivel,
+            'capitulo': capitulo,
+            'dificultad': dificultad,
+            'visibilidad': visibilidad
+        },
+        busqueda=busqueda
+    )
+    
+    
+    # Aplicar límites diarios de visualización (estado decodificado una vez)
+    cuota = cuota_actual()
     ejercicios_mostrables = []
     ejercicios_bloqueados = []
     
     for ejercicio in ejercicios_filtrados:
-        # Procesar LaTeX en el ejercicio
-        ejercicio['enunciado'] = procesar_latex(ejercicio['enunciado'])
-        ejercicio['solucion'] = procesar_latex(ejercicio['solucion'])
-        # Agregar información amigable de la materia
-        ejercicio['info_materia'] = obtener_info_materia(ejercicio.get('codigo_materia', ''))
+        # Copia con LaTeX ya renderizado e información amigable de la materia
+        ejercicio = renderizar_ejercicio(ejercicio)
         
         # Verificar si el usuario puede ver este ejercicio
-        if current_user.is_authenticated:
-            # Usuario registrado
-            if current_user.can_view_exercise(ejercicio['id']):
-                ejercicios_mostrables.append(ejercicio)
-            else:
-                ejercicio['bloqueado'] = True
-                ejercicios_bloqueados.append(ejercicio)
+        if cuota.puede_ver(ejercicio['id']):
+            ejercicios_mostrables.append(ejercicio)
         else:
-            # Usuario sin registro - usar sesión para tracking
-            from flask import session
-            import json
-            
-            # Inicializar tracking de sesión si no existe
-            if 'ejercicios_vistos_hoy' not in session:
-                session['ejercicios_vistos_hoy'] = 0
-                session['ultima_fecha_conteo'] = datetime.now().date().isoformat()
-                session['ejercicios_vistos_ids'] = []
-            
-            # Verificar si es un nuevo día
-            today = datetime.now().date().isoformat()
-            if session.get('ultima_fecha_conteo') != today:
-                session['ejercicios_vistos_hoy'] = 0
-                session['ultima_fecha_conteo'] = today
-                session['ejercicios_vistos_ids'] = []
-            
-            # Verificar límite (5 ejercicios para usuarios sin registro)
-            if (session['ejercicios_vistos_hoy'] < 5 or 
-                ejercicio['id'] in session.get('ejercicios_vistos_ids', [])):
-                ejercicios_mostrables.append(ejercicio)
-            else:
-                ejercicio['bloqueado'] = True
-                ejercicios_bloqueados.append(ejercicio)
+            ejercicio['bloqueado'] = True
+            ejercicios_bloqueados.append(ejercicio)
     
     # Usar ejercicios mostrables como ejercicios filtrados y ordenar aleatoriamente
     import random
     ejercicios_filtrados = ejercicios_mostrables
     random.shuffle(ejercicios_filtrados)
     
-    # Preparar datos para los filtros
-    filtros_datos = {
-        'codigos_materia': metadatos.get('codigos_materia', {}),
-        'materias_principales': metadatos.get('materias_principales', {}),
-        'capitulos': metadatos.get('capitulos', {}),
-        'niveles': metadatos.get('niveles', {}),
-        'dificultades': metadatos.get('dificultades', {}),
-        'visibilidades': metadatos.get('visibilidades', {})
-    }
+    # Preparar datos para los filtros (conteos dentro del resultado filtrado)
+    filtros_datos = facetas
     
     filtros_activos = {
         'codigo_materia': codigo_materia,
@@ -487,23 +245,9 @@ def index():
     }
     
     # Obtener información de límites diarios
-    limites_info = {}
-    if current_user.is_authenticated:
-        limites_info = current_user.get_daily_limit_info()
-    else:
-        from flask import session
-        ejercicios_vistos = session.get('ejercicios_vistos_hoy', 0)
-        limite_diario = 5
-        limites_info = {
-            'limite_diario': limite_diario,
-            'ejercicios_vistos': ejercicios_vistos,
-            'ejercicios_restantes': max(0, limite_diario - ejercicios_vistos),
-            'es_premium': False,
-            'tipo_usuario': 'sin_registro'
-        }
+    limites_info = cuota.info()
     
     return render_template('index.html', 
-                         ejercicios=ejercicios,  # Todos los ejercicios para el JavaScript
                          ejercicios_filtrados=ejercicios_filtrados,  # Ejercicios filtrados para mostrar
                          ejercicios_bloqueados=ejercicios_bloqueados,  # Ejercicios bloqueados por límite
                          metadatos=metadatos,
@@ -511,116 +255,145 @@ def index():
                          filtros_activos=filtros_activos,
                          filtros=filtros,  # Agregar variable filtros
                          codigos_materias=CODIGOS_MATERIAS,
-                         total_ejercicios=len(ejercicios),
+                         total_ejercicios=metadatos['total_ejercicios'],
                          ejercicios_filtrados_count=len(ejercicios_filtrados),
                          limites_info=limites_info)
 
-@app.route('/ejercicio/<ejercicio_id>')
+@rutas.route('/ejercicio/<ejercicio_id>')
 def ejercicio_detalle(ejercicio_id):
     """Página de detalle de un ejercicio específico"""
-    ejercicios = cargar_ejercicios()
-    ejercicio = next((e for e in ejercicios if e['id'] == ejercicio_id), None)
+    ejercicio = catalogo_ejercicios.obtener(ejercicio_id)
     
     if not ejercicio:
         return "Ejercicio no encontrado", 404
     
-    # Verificar si el usuario puede ver este ejercicio
-    puede_ver = True
-    if current_user.is_authenticated:
-        if not current_user.can_view_exercise(ejercicio_id):
-            puede_ver = False
-        else:
-            # Marcar como visto
-            current_user.mark_exercise_as_viewed(ejercicio_id)
-    else:
-        # Usuario sin registro
-        from flask import session
-        import json
-        
-        # Inicializar tracking de sesión si no existe
-        if 'ejercicios_vistos_hoy' not in session:
-            session['ejercicios_vistos_hoy'] = 0
-            session['ultima_fecha_conteo'] = datetime.now().date().isoformat()
-            session['ejercicios_vistos_ids'] = []
-        
-        # Verificar si es un nuevo día
-        today = datetime.now().date().isoformat()
-        if session.get('ultima_fecha_conteo') != today:
-            session['ejercicios_vistos_hoy'] = 0
-            session['ultima_fecha_conteo'] = today
-            session['ejercicios_vistos_ids'] = []
-        
-        # Verificar si ya vio este ejercicio
-        if ejercicio_id not in session.get('ejercicios_vistos_ids', []):
-            # Verificar límite (5 ejercicios para usuarios sin registro)
-            if session['ejercicios_vistos_hoy'] >= 5:
-                puede_ver = False
-            else:
-                # Marcar como visto
-                session['ejercicios_vistos_hoy'] += 1
-                session['ejercicios_vistos_ids'] = session.get('ejercicios_vistos_ids', []) + [ejercicio_id]
+    # Verificar si el usuario puede ver este ejercicio y marcarlo como visto
+    # (se persiste una sola vez al final de la solicitud)
+    cuota = cuota_actual()
+    puede_ver = cuota.marcar_visto(ejercicio_id)
     
     # Procesar LaTeX en el ejercicio
-    ejercicio['enunciado'] = procesar_latex(ejercicio['enunciado'])
-    ejercicio['solucion'] = procesar_latex(ejercicio['solucion'])
-    ejercicio['info_materia'] = obtener_info_materia(ejercicio.get('codigo_materia', ''))
+    ejercicio = renderizar_ejercicio(ejercicio)
     
     # Obtener información de límites diarios
-    limites_info = {}
-    if current_user.is_authenticated:
-        limites_info = current_user.get_daily_limit_info()
-    else:
-        ejercicios_vistos = session.get('ejercicios_vistos_hoy', 0)
-        limite_diario = 5
-        limites_info = {
-            'limite_diario': limite_diario,
-            'ejercicios_vistos': ejercicios_vistos,
-            'ejercicios_restantes': max(0, limite_diario - ejercicios_vistos),
-            'es_premium': False,
-            'tipo_usuario': 'sin_registro'
-        }
+    limites_info = cuota.info()
     
     return render_template('ejercicio_detalle.html', 
                          ejercicio=ejercicio, 
                          puede_ver=puede_ver,
                          limites_info=limites_info)
 
-@app.route('/api/ejercicios')
+# Paginación de /api/ejercicios
+LIMITE_API_DEFECTO = 50
+LIMITE_API_MAXIMO = 500
+
+def codificar_cursor(offset):
+    """Cursor opaco para pedir la siguiente página"""
+    return base64.urlsafe_b64encode(f'o:{offset}'.encode()).decode().rstrip('=')
+
+def decodificar_cursor(cursor):
+    """Devuelve el offset codificado en el cursor (ValueError si es inválido)"""
+    relleno = '=' * (-len(cursor) % 4)
+    texto = base64.urlsafe_b64decode(cursor + relleno).decode()
+    if not texto.startswith('o:'):
+        raise ValueError(cursor)
+    return int(texto[2:])
+
+def proyectar_campos(ejercicio, campos):
+    """Copia serializable del ejercicio con los campos pedidos (todos si campos es None)"""
+    if campos is None:
+        return dict(ejercicio)
+    return {campo: ejercicio[campo] for campo in campos if campo in ejercicio}
+
+@rutas.route('/api/ejercicios')
 def api_ejercicios():
-    """API para obtener ejercicios en formato JSON"""
-    ejercicios = cargar_ejercicios()
+    """
+    API para obtener ejercicios en formato JSON
     
+    Parámetros adicionales a los filtros:
+    - limit / offset: paginación (limit por defecto 50, máximo 500)
+    - cursor: alternativa a offset, tomado de 'siguiente_cursor'
+    - fields: campos a devolver, separados por coma (ej: fields=id,capitulo)
+    - formato=ndjson: un ejercicio por línea en streaming, sin límite por defecto
+    """
     # Aplicar filtros si se proporcionan
     filtros = ['codigo_materia', 'materia_principal', 'nivel', 'capitulo', 'dificultad', 'visibilidad']
     
-    for filtro in filtros:
-        valor = request.args.get(filtro)
-        if valor:
-            if filtro == 'dificultad':
-                ejercicios = [e for e in ejercicios if str(e.get(filtro, '')) == valor]
-            else:
-                ejercicios = [e for e in ejercicios if e.get(filtro) == valor]
+    ndjson = request.args.get('formato') == 'ndjson'
+    campos = request.args.get('fields')
+    campos = [c.strip() for c in campos.split(',') if c.strip()] if campos else None
+    
+    try:
+        cursor = request.args.get('cursor')
+        offset = decodificar_cursor(cursor) if cursor else int(request.args.get('offset', 0))
+        limite = request.args.get('limit')
+        if limite is not None:
+            limite = int(limite)
+        elif not ndjson:
+            limite = LIMITE_API_DEFECTO
+    except ValueError:
+        return jsonify({'error': 'Parámetros de paginación inválidos (limit, offset o cursor)'}), 400
+    
+    if offset < 0 or (limite is not None and limite < 1):
+        return jsonify({'error': 'limit debe ser mayor que 0 y offset no puede ser negativo'}), 400
+    if limite is not None and not ndjson:
+        limite = min(limite, LIMITE_API_MAXIMO)
+    
+    ejercicios, _ = catalogo_ejercicios.filtrar({filtro: request.args.get(filtro) for filtro in filtros})
+    total = len(ejercicios)
+    fin = total if limite is None else offset + limite
+    pagina = ejercicios[offset:fin]
+    
+    if ndjson:
+        # Streaming para consumidores masivos: no se arma el payload completo en memoria
+        def generar():
+            for ejercicio in pagina:
+                yield json.dumps(proyectar_campos(ejercicio, campos), ensure_ascii=False) + '\n'
+        return Response(generar(), mimetype='application/x-ndjson',
+                        headers={'X-Total-Count': str(total)})
     
     return jsonify({
-        'total': len(ejercicios),
-        'ejercicios': ejercicios,
+        'total': total,
+        'limit': limite,
+        'offset': offset,
+        'siguiente_cursor': codificar_cursor(fin) if fin < total else None,
+        'ejercicios': [proyectar_campos(e, campos) for e in pagina],
         'filtros_aplicados': {k: request.args.get(k) for k in filtros if request.args.get(k)}
     })
 
-@app.route('/api/metadatos')
+@rutas.route('/api/metadatos')
 def api_metadatos():
     """API para obtener metadatos"""
     metadatos = cargar_metadatos()
     metadatos['codigos_materias_info'] = CODIGOS_MATERIAS
     return jsonify(metadatos)
 
-@app.route('/teoria')
+@rutas.route('/api/facetas')
+def api_facetas():
+    """
+    API compacta con el mapa materia -> capítulos y los conteos por filtro.
+    
+    Sustituye al volcado del catálogo completo en index.html: su tamaño no
+    crece con el número de ejercicios y se puede cachear por ETag.
+    """
+    estado = catalogo_ejercicios.estado()
+    respuesta = jsonify({
+        'version': estado.version,
+        'materia_capitulos': estado.materia_capitulos,
+        'facetas': estado.facetas
+    })
+    respuesta.set_etag(estado.version)
+    respuesta.cache_control.public = True
+    respuesta.cache_control.max_age = 300
+    return respuesta.make_conditional(request)
+
+@rutas.route('/teoria')
 def teoria():
     """Página principal de teoría"""
     teoria_data = cargar_teoria()
     return render_template('teoria.html', teoria=teoria_data)
 
-@app.route('/teoria/<materia>/<capitulo>')
+@rutas.route('/teoria/<materia>/<capitulo>')
 def teoria_capitulo(materia, capitulo):
     """Página de teoría de un capítulo específico"""
     teoria_data = cargar_teoria()
@@ -639,13 +412,13 @@ def teoria_capitulo(materia, capitulo):
     flash('El capítulo solicitado no existe.', 'error')
     return redirect(url_for('teoria'))
 
-@app.route('/formularios')
+@rutas.route('/formularios')
 def formularios():
     """Página de formularios descargables"""
     formularios_data = cargar_formularios()
     return render_template('formularios.html', formularios=formularios_data)
 
-@app.route('/descargar/teoria/<materia>/<capitulo>')
+@rutas.route('/descargar/teoria/<materia>/<capitulo>')
 def descargar_teoria(materia, capitulo):
     """Descarga un archivo de teoría específico"""
     teoria_data = cargar_teoria()
@@ -665,7 +438,7 @@ def descargar_teoria(materia, capitulo):
     flash('El archivo de teoría no se encuentra disponible.', 'error')
     return redirect(url_for('teoria'))
 
-@app.route('/descargar/<materia>/<capitulo>')
+@rutas.route('/descargar/<materia>/<capitulo>')
 def descargar_formulario(materia, capitulo):
     """Descarga un formulario específico"""
     formularios_data = cargar_formularios()
@@ -688,7 +461,7 @@ def descargar_formulario(materia, capitulo):
     flash('El formulario solicitado no se encuentra disponible.', 'error')
     return redirect(url_for('formularios'))
 
-@app.route('/descargar/<id>')
+@rutas.route('/descargar/<id>')
 def descargar_formulario_completo(id):
     """Descarga un formulario completo"""
     formularios_data = cargar_formularios()
@@ -711,7 +484,7 @@ def descargar_formulario_completo(id):
         flash('El formulario solicitado no existe.', 'error')
         return redirect(url_for('formularios'))
 
-@app.route('/simulacro')
+@rutas.route('/simulacro')
 def simulacro():
     """Página para configurar y generar simulacros"""
     metadatos = cargar_metadatos()
@@ -735,7 +508,7 @@ def simulacro():
                          codigos_materias=CODIGOS_MATERIAS,
                          simulacro_info=simulacro_info)
 
-@app.route('/generar_simulacro', methods=['POST'])
+@rutas.route('/generar_simulacro', methods=['POST'])
 def generar_simulacro():
     """Generar un simulacro con los parámetros especificados"""
     # Verificar límites de simulacros
@@ -768,23 +541,13 @@ def generar_simulacro():
     if tiempo_examen not in tiempos_validos:
         return jsonify({'error': f'Tiempo del examen debe ser uno de: {tiempos_validos} minutos'}), 400
     
-    # Cargar todos los ejercicios
-    ejercicios = cargar_ejercicios()
-    
-    # Aplicar filtros
-    ejercicios_filtrados = ejercicios.copy()
-    
-    if niveles:
-        ejercicios_filtrados = [e for e in ejercicios_filtrados if e.get('nivel') in niveles]
-    
-    if codigos_materia:
-        ejercicios_filtrados = [e for e in ejercicios_filtrados if e.get('codigo_materia') in codigos_materia]
-    
-    if capitulos:
-        ejercicios_filtrados = [e for e in ejercicios_filtrados if e.get('capitulo') in capitulos]
-    
-    if dificultades:
-        ejercicios_filtrados = [e for e in ejercicios_filtrados if str(e.get('dificultad', '')) in dificultades]
+    # Aplicar filtros sobre el índice del catálogo
+    ejercicios_filtrados, _ = catalogo_ejercicios.filtrar({
+        'nivel': niveles,
+        'codigo_materia': codigos_materia,
+        'capitulo': capitulos,
+        'dificultad': dificultades
+    })
     
     # Verificar que hay suficientes ejercicios
     if len(ejercicios_filtrados) < num_preguntas:
@@ -795,13 +558,8 @@ def generar_simulacro():
     # Seleccionar ejercicios aleatorios
     import random
     random.shuffle(ejercicios_filtrados)
-    simulacro_ejercicios = ejercicios_filtrados[:num_preguntas]
-    
     # Procesar LaTeX en los ejercicios
-    for ejercicio in simulacro_ejercicios:
-        ejercicio['enunciado'] = procesar_latex(ejercicio['enunciado'])
-        ejercicio['solucion'] = procesar_latex(ejercicio['solucion'])
-        ejercicio['info_materia'] = obtener_info_materia(ejercicio.get('codigo_materia', ''))
+    simulacro_ejercicios = [renderizar_ejercicio(e) for e in ejercicios_filtrados[:num_preguntas]]
     
     # Marcar el simulacro como realizado
     current_user.mark_simulacro_as_done()
@@ -819,7 +577,7 @@ def generar_simulacro():
         }
     })
 
-@app.route('/generar_simulacro_pdf', methods=['POST'])
+@rutas.route('/generar_simulacro_pdf', methods=['POST'])
 def generar_simulacro_pdf():
     """Generar un simulacro en formato PDF"""
     # Verificar límites de simulacros
@@ -860,23 +618,13 @@ def generar_simulacro_pdf():
         if tiempo_examen not in tiempos_validos:
             return jsonify({'error': f'Tiempo del examen debe ser uno de: {tiempos_validos} minutos'}), 400
         
-        # Cargar todos los ejercicios
-        ejercicios = cargar_ejercicios()
-        
-        # Aplicar filtros
-        ejercicios_filtrados = ejercicios.copy()
-        
-        if niveles:
-            ejercicios_filtrados = [e for e in ejercicios_filtrados if e.get('nivel') in niveles]
-        
-        if codigos_materia:
-            ejercicios_filtrados = [e for e in ejercicios_filtrados if e.get('codigo_materia') in codigos_materia]
-        
-        if capitulos:
-            ejercicios_filtrados = [e for e in ejercicios_filtrados if e.get('capitulo') in capitulos]
-        
-        if dificultades:
-            ejercicios_filtrados = [e for e in ejercicios_filtrados if str(e.get('dificultad', '')) in dificultades]
+        # Aplicar filtros sobre el índice del catálogo
+        ejercicios_filtrados, _ = catalogo_ejercicios.filtrar({
+            'nivel': niveles,
+            'codigo_materia': codigos_materia,
+            'capitulo': capitulos,
+            'dificultad': dificultades
+        })
         
         # Verificar que hay suficientes ejercicios
         if len(ejercicios_filtrados) < num_preguntas:
@@ -1007,7 +755,7 @@ def generar_simulacro_pdf():
     except Exception as e:
         return jsonify({'error': f'Error al generar PDF: {str(e)}'}), 500
 
-@app.route('/estadisticas')
+@rutas.route('/estadisticas')
 @login_required
 def estadisticas():
     """Página de estadísticas avanzadas (solo para administradores)"""
@@ -1084,61 +832,46 @@ def estadisticas():
                          total_ejercicios=len(ejercicios),
                          procedencias=estadisticas_detalladas['procedencias'])
 
-@app.route('/libros')
+@rutas.route('/libros')
 def libros():
     """Página de libros disponibles"""
     return render_template('libros.html')
 
-@app.route('/anuncios')
+@rutas.route('/anuncios')
 def anuncios():
     """Página de anuncios y promociones"""
     return render_template('anuncios.html')
 
-@app.route('/premium')
+@rutas.route('/premium')
 def premium():
     """Página de suscripción premium"""
     # Obtener información de límites diarios
-    limites_info = {}
-    if current_user.is_authenticated:
-        limites_info = current_user.get_daily_limit_info()
-    else:
-        from flask import session
-        ejercicios_vistos = session.get('ejercicios_vistos_hoy', 0)
-        limite_diario = 5
-        limites_info = {
-            'limite_diario': limite_diario,
-            'ejercicios_vistos': ejercicios_vistos,
-            'ejercicios_restantes': max(0, limite_diario - ejercicios_vistos),
-            'es_premium': False,
-            'tipo_usuario': 'sin_registro'
-        }
+    limites_info = cuota_actual().info()
     
     return render_template('premium.html', limites_info=limites_info)
 
 # Rutas adicionales para compatibilidad
-@app.route('/api/teoria')
+@rutas.route('/api/teoria')
 def api_teoria():
     """API para obtener teoría"""
     return jsonify(cargar_teoria())
 
-@app.route('/api/formularios')
+@rutas.route('/api/formularios')
 def api_formularios():
     """API para obtener formularios"""
     return jsonify(cargar_formularios())
 
-@app.route('/api/buscar')
+@rutas.route('/api/buscar')
 def api_buscar():
     """API para búsqueda en tiempo real de ejercicios"""
     busqueda = request.args.get('q', '')
-    ejercicios = cargar_ejercicios()
     
     if not busqueda:
         return jsonify({'ejercicios': [], 'total': 0})
     
-    ejercicios_encontrados = buscar_ejercicios_por_palabras(ejercicios, busqueda)
-    
-    # Limitar resultados para respuesta rápida
-    resultados_limitados = ejercicios_encontrados[:10]
+    # Limitar resultados para respuesta rápida (solo se ordenan los 10 mejores)
+    total, encontrados = catalogo_ejercicios.buscar(busqueda, limite=10)
+    resultados_limitados = [dict(e) for e in encontrados]
     
     # Preparar datos para JSON (sin procesar LaTeX para velocidad)
     for ejercicio in resultados_limitados:
@@ -1146,12 +879,14 @@ def api_buscar():
     
     return jsonify({
         'ejercicios': resultados_limitados,
-        'total': len(ejercicios_encontrados),
+        'total': total,
         'mostrados': len(resultados_limitados),
         'busqueda': busqueda
     })
 
 if __name__ == '__main__':
+    # Servidor de desarrollo: configuración de desarrollo salvo que FLASK_CONFIG diga otra
+    app = create_app()
     print("🚀 Iniciando servidor de ejercicios preuniversitarios (NUEVA ESTRUCTURA)...")
     print("📚 Cargando ejercicios desde nueva estructura jerárquica...")
     
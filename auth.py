@@ -1,30 +1,43 @@
 
 import os
 import json
-from flask import Blueprint, redirect, url_for, flash, render_template, request, session, jsonify
+import threading
+from flask import Blueprint, current_app, redirect, url_for, flash, render_template, request, session, jsonify
 from flask_login import login_user, logout_user, login_required, current_user
-from authlib.integrations.flask_client import OAuth
 from models import db, Usuario, SesionUsuario
-from models import VisitaPagina
+from visitas import contar_visitas
+from gestion_usuarios import (ORDEN_USUARIOS, cambiar_estado_usuarios, consulta_ingresos,
+                              consulta_listado_usuarios, eliminar_usuarios, ids_eliminables,
+                              iniciar_eliminacion, obtener_tarea)
 
 # Blueprint para la autenticación
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
-# Configuración de OAuth
-oauth = OAuth()
-
-def init_oauth(app):
-    """Inicializa el cliente OAuth con la configuración de la app."""
-    oauth.init_app(app)
-    oauth.register(
-        name='google',
-        server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
-        client_id=os.environ.get("GOOGLE_CLIENT_ID"),
-        client_secret=os.environ.get("GOOGLE_CLIENT_SECRET"),
-        client_kwargs={
-            'scope': 'openid email profile'
-        }
-    )
+# Cliente OAuth de Google: se crea en el primer inicio de sesión, no al
+# importar el módulo (authlib y su configuración no se cargan en cada worker)
+_oauth = None
+_oauth_lock = threading.Lock()
+
+def cliente_google():
+    """Devuelve el cliente OAuth de Google, registrándolo la primera vez."""
+    global _oauth
+    if _oauth is None:
+        with _oauth_lock:
+            if _oauth is None:
+                from authlib.integrations.flask_client import OAuth
+
+                oauth = OAuth(current_app._get_current_object())
+                oauth.register(
+                    name='google',
+                    server_metadata_url='https://accounts.google.com/.well-known/openid-configuration',
+                    client_id=os.environ.get("GOOGLE_CLIENT_ID"),
+                    client_secret=os.environ.get("GOOGLE_CLIENT_SECRET"),
+                    client_kwargs={
+                        'scope': 'openid email profile'
+                    }
+                )
+                _oauth = oauth
+    return _oauth.google
 
 @auth_bp.route('/login')
 def login():
@@ -47,7 +60,7 @@ def login_google():
     
     # El redirect_uri debe ser la URL absoluta de la ruta 'authorize'
     redirect_uri = url_for('auth.authorize', _external=True)
-    return oauth.google.authorize_redirect(redirect_uri)
+    return cliente_google().authorize_redirect(redirect_uri)
 
 @auth_bp.route('/authorize')
 def authorize():
@@ -57,10 +70,10 @@ def authorize():
     """
     try:
         # Intercambia el código de autorización por un token de acceso
-        token = oauth.google.authorize_access_token()
+        token = cliente_google().authorize_access_token()
         
         # Obtiene la información del usuario desde Google usando el endpoint de userinfo
-        resp = oauth.google.get('https://www.googleapis.com/oauth2/v2/userinfo')
+        resp = cliente_google().get('https://www.googleapis.com/oauth2/v2/userinfo')
         user_info = resp.json()
         
         if not user_info:
@@ -136,10 +149,8 @@ def logout():
                 db.session.commit()
         else:
             # Fallback: cerrar la última sesión abierta del usuario
-            sesion_abierta = (SesionUsuario.query
-                              .filter_by(usuario_id=current_user.id, fecha_fin=None)
-                              .order_by(SesionUsuario.fecha_inicio.desc())
-                              .first())
+            sesion_abierta = db.session.scalars(
+                SesionUsuario.consulta_sesion_abierta(current_user.id)).first()
             if sesion_abierta:
                 from datetime import datetime
                 sesion_abierta.fecha_fin = datetime.utcnow()
@@ -196,35 +207,62 @@ def profile():
     now = datetime.now()
     return render_template('auth/profile.html', usuario=current_user, now=now)
 
+USUARIOS_POR_PAGINA = 50
+USUARIOS_POR_PAGINA_MAXIMO = 200
+
 @auth_bp.route('/admin/users')
 @login_required
 def admin_users():
     """
     Página para administrar usuarios (solo para administradores).
+    
+    El listado se pagina, ordena y filtra en la base de datos; los totales
+    salen de una sola consulta agregada.
     """
     if not current_user.es_admin:
         flash("No tienes permisos para acceder a esta página.", "danger")
         return redirect(url_for('index'))
     
-    usuarios = Usuario.query.all()
+    busqueda = request.args.get('q', '').strip()
+    orden = request.args.get('orden', 'registro')
+    if orden not in ORDEN_USUARIOS:
+        orden = 'registro'
+    direccion = 'asc' if request.args.get('dir') == 'asc' else 'desc'
+    pagina = request.args.get('pagina', 1, type=int)
+    por_pagina = min(max(request.args.get('por_pagina', USUARIOS_POR_PAGINA, type=int), 1),
+                     USUARIOS_POR_PAGINA_MAXIMO)
+    
+    paginacion = db.paginate(consulta_listado_usuarios(busqueda, orden, direccion),
+                             page=pagina, per_page=por_pagina, error_out=False)
+    usuarios = paginacion.items
     
-    # Estadísticas adicionales
-    total_usuarios = len(usuarios)
-    usuarios_activos = len([u for u in usuarios if u.es_activo])
-    usuarios_premium = len([u for u in usuarios if u.is_premium_active()])
-    usuarios_google = len([u for u in usuarios if u.auth_provider == 'google'])
-
-    # Métricas de visitas
-    from datetime import date
-    visitas_totales = VisitaPagina.query.count()
-    visitas_hoy = VisitaPagina.query.filter(VisitaPagina.fecha >= date.today()).count()
+    # Ingresos (sesiones) solo de los usuarios de esta página, en una consulta
+    ids = [u.id for u in usuarios]
+    ingresos = {}
+    if ids:
+        ingresos = dict(db.session.execute(consulta_ingresos(ids)).all())
+    
+    # Estadísticas generales
+    resumen = Usuario.resumen_estadisticas()
+
+    # Métricas de visitas (desde los resúmenes diarios, no desde la tabla cruda)
+    from datetime import datetime
+    visitas_totales = contar_visitas()
+    visitas_hoy = contar_visitas(desde=datetime.utcnow().date())
     
     return render_template('auth/admin_users.html', 
                          usuarios=usuarios,
-                         total_usuarios=total_usuarios,
-                         usuarios_activos=usuarios_activos,
-                         usuarios_premium=usuarios_premium,
-                         usuarios_google=usuarios_google,
+                         paginacion=paginacion,
+                         ingresos=ingresos,
+                         busqueda=busqueda,
+                         orden=orden,
+                         direccion=direccion,
+                         por_pagina=por_pagina,
+                         total_usuarios=resumen['total'],
+                         usuarios_activos=resumen['activos'],
+                         usuarios_premium=resumen['premium'],
+                         usuarios_admin=resumen['admin'],
+                         usuarios_google=resumen['google'],
                          visitas_totales=visitas_totales,
                          visitas_hoy=visitas_hoy)
 
@@ -325,14 +363,8 @@ def delete_account():
         # Obtener el ID del usuario antes de eliminarlo
         user_id = current_user.id
         
-        # Eliminar todas las sesiones del usuario
-        sesiones = SesionUsuario.query.filter_by(usuario_id=user_id).all()
-        for sesion in sesiones:
-            db.session.delete(sesion)
-        
-        # Eliminar el usuario
-        db.session.delete(current_user)
-        db.session.commit()
+        # Eliminar el usuario junto con sus sesiones, ejercicios vistos y visitas
+        eliminar_usuarios([user_id])
         
         # Cerrar sesión
         logout_user()
@@ -443,18 +475,13 @@ def admin_delete_user(user_id):
         if usuario.es_admin:
             return jsonify({'success': False, 'message': 'No puedes eliminar cuentas de administrador.'})
         
-        # Eliminar sesiones del usuario
-        sesiones = SesionUsuario.query.filter_by(usuario_id=user_id).all()
-        for sesion in sesiones:
-            db.session.delete(sesion)
-        
-        # Eliminar usuario
-        db.session.delete(usuario)
-        db.session.commit()
+        # Eliminar usuario con sus filas dependientes
+        username = usuario.username
+        eliminar_usuarios([usuario.id])
         
         return jsonify({
             'success': True, 
-            'message': f'Usuario {usuario.username} eliminado exitosamente.'
+            'message': f'Usuario {username} eliminado exitosamente.'
         })
         
     except Exception as e:
@@ -477,36 +504,30 @@ def admin_bulk_actions():
         if not user_ids:
             return jsonify({'success': False, 'message': 'No se seleccionaron usuarios.'})
         
-        usuarios = Usuario.query.filter(Usuario.id.in_(user_ids)).all()
-        
         if action == 'activate':
-            for usuario in usuarios:
-                if not usuario.es_admin or usuario.id != current_user.id:
-                    usuario.es_activo = True
-            db.session.commit()
-            return jsonify({'success': True, 'message': f'{len(usuarios)} usuarios activados.'})
+            actualizados = cambiar_estado_usuarios(user_ids, True, admin_id=current_user.id)
+            return jsonify({'success': True, 'message': f'{actualizados} usuarios activados.'})
             
         elif action == 'deactivate':
-            for usuario in usuarios:
-                if not usuario.es_admin or usuario.id != current_user.id:
-                    usuario.es_activo = False
-            db.session.commit()
-            return jsonify({'success': True, 'message': f'{len(usuarios)} usuarios desactivados.'})
+            actualizados = cambiar_estado_usuarios(user_ids, False, admin_id=current_user.id)
+            return jsonify({'success': True, 'message': f'{actualizados} usuarios desactivados.'})
             
         elif action == 'delete':
             # Solo eliminar usuarios no admin
-            usuarios_a_eliminar = [u for u in usuarios if not u.es_admin and u.id != current_user.id]
+            ids = ids_eliminables(user_ids, admin_id=current_user.id)
             
-            for usuario in usuarios_a_eliminar:
-                # Eliminar sesiones
-                sesiones = SesionUsuario.query.filter_by(usuario_id=usuario.id).all()
-                for sesion in sesiones:
-                    db.session.delete(sesion)
-                # Eliminar usuario
-                db.session.delete(usuario)
+            # Eliminaciones grandes: en segundo plano con progreso consultable
+            if len(ids) > current_app.config.get('ELIMINACION_SEGUNDO_PLANO', 100):
+                tarea = iniciar_eliminacion(current_app._get_current_object(), ids)
+                return jsonify({
+                    'success': True,
+                    'tarea': tarea.id,
+                    'progreso_url': url_for('auth.admin_estado_tarea', tarea_id=tarea.id),
+                    'message': f'Eliminando {len(ids)} usuarios en segundo plano...'
+                })
             
-            db.session.commit()
-            return jsonify({'success': True, 'message': f'{len(usuarios_a_eliminar)} usuarios eliminados.'})
+            eliminados = eliminar_usuarios(ids)
+            return jsonify({'success': True, 'message': f'{eliminados} usuarios eliminados.'})
             
         else:
             return jsonify({'success': False, 'message': 'Acción no válida.'})
@@ -514,3 +535,18 @@ def admin_bulk_actions():
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': f'Error en acción masiva: {str(e)}'})
+
+@auth_bp.route('/admin/tareas/<tarea_id>')
+@login_required
+def admin_estado_tarea(tarea_id):
+    """
+    Progreso de una eliminación masiva en segundo plano (solo para administradores).
+    """
+    if not current_user.es_admin:
+        return jsonify({'success': False, 'message': 'No tienes permisos para realizar esta acción.'}), 403
+    
+    tarea = obtener_tarea(current_app._get_current_object(), tarea_id)
+    if tarea is None:
+        return jsonify({'success': False, 'message': 'Tarea no encontrada.'}), 404
+    
+    return jsonify({'success': True, **tarea.to_dict()})
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Buscador de Ejercicios - Plataforma Preuniversitaria
+===================================================
+
+Índice invertido por palabra para la búsqueda de ejercicios.
+
+- Normaliza mayúsculas y acentos ("Física" y "fisica" son la misma palabra)
+- Todas las palabras de la consulta deben aparecer (búsqueda AND)
+- La última palabra se busca por prefijo, para la búsqueda en vivo mientras
+  el usuario escribe
+- Los resultados se ordenan por relevancia según el campo donde aparece
+  cada palabra
+
+Autor: Plataforma Preuniversitaria
+Fecha: 2025
+"""
+
+import heapq
+import re
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+
+# Peso de cada campo al calcular la relevancia de un ejercicio
+PESOS_CAMPOS = {
+    'id': 8,
+    'tags': 5,
+    'capitulo': 4,
+    'subtema': 4,
+    'codigo_materia': 3,
+    'nombre_materia': 3,
+    'materia_principal': 3,
+    'procedencia': 3,
+    'institucion': 3,
+    'tipo_examen': 3,
+    'año': 2,
+    'periodo': 2,
+    'nivel': 2,
+    'dificultad': 1,
+    'visibilidad': 1,
+    'enunciado': 2,
+    'solucion': 1,
+}
+
+_patron_palabra = re.compile(r'[a-z0-9]+')
+
+# Incrementar cuando cambie tokenizar (invalida las palabras guardadas en el catálogo binario)
+VERSION_TOKENIZADOR = 1
+
+def normalizar(texto):
+    """Pasa a minúsculas y elimina acentos (á -> a, ñ -> n)"""
+    texto = str(texto).lower()
+    if texto.isascii():
+        return texto
+    # NFKD separa letra y tilde; al codificar a ASCII se descartan las tildes
+    return unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+
+def tokenizar(texto):
+    """Divide un texto normalizado en palabras alfanuméricas"""
+    return _patron_palabra.findall(normalizar(texto))
+
+def _texto_campo(valor):
+    """Convierte el valor de un campo (texto, número o lista) en texto"""
+    if isinstance(valor, (list, tuple)):
+        return ' '.join(str(v) for v in valor)
+    return '' if valor is None else str(valor)
+
+def contar_palabras(valor):
+    """{palabra: veces} de un campo (texto, número o lista)"""
+    return Counter(tokenizar(_texto_campo(valor)))
+
+class IndiceBusqueda:
+    """
+    Índice invertido palabra -> {ordinal: puntaje} sobre una lista de ejercicios.
+
+    Los ordinales son posiciones en la lista original, de modo que los
+    resultados se pueden convertir a ejercicios sin otra búsqueda.
+
+    ``conteos`` ({campo: función(ordinal) -> {palabra: veces}}) entrega las
+    palabras ya contadas de un campo sin leer su valor (el catálogo binario
+    las trae para el enunciado y la solución).
+    """
+
+    def __init__(self, ejercicios, pesos=PESOS_CAMPOS, conteos=None):
+        self.ids = [e.get('id') for e in ejercicios]
+        self.postings = {}
+
+        for ordinal, ejercicio in enumerate(ejercicios):
+            puntajes = Counter()
+            for campo, peso in pesos.items():
+                if conteos is not None and campo in conteos:
+                    palabras = conteos[campo](ordinal)
+                else:
+                    valor = ejercicio.get(campo)
+                    if valor is None or valor == '':
+                        continue
+                    palabras = contar_palabras(valor)
+                for palabra, veces in palabras.items():
+                    puntajes[palabra] += peso * veces
+            for palabra, puntaje in puntajes.items():
+                posting = self.postings.get(palabra)
+                if posting is None:
+                    posting = self.postings[palabra] = {}
+                posting[ordinal] = puntaje
+
+        # Vocabulario ordenado para resolver prefijos con búsqueda binaria
+        self.vocabulario = sorted(self.postings)
+
+    def _por_prefijo(self, prefijo):
+        """Une los postings de todas las palabras que empiezan con el prefijo"""
+        combinado = {}
+        i = bisect_left(self.vocabulario, prefijo)
+        while i < len(self.vocabulario) and self.vocabulario[i].startswith(prefijo):
+            for ordinal, puntaje in self.postings[self.vocabulario[i]].items():
+                if puntaje > combinado.get(ordinal, 0):
+                    combinado[ordinal] = puntaje
+            i += 1
+        return combinado
+
+    def buscar_ordinales(self, consulta, limite=None):
+        """
+        Devuelve los ordinales que contienen todas las palabras de la consulta,
+        ordenados por relevancia (mayor puntaje primero).
+
+        Con ``limite`` solo se ordenan los mejores resultados (heap parcial).
+        """
+        return self.ordenar(self.coincidencias(consulta), limite)
+
+    def coincidencias(self, consulta):
+        """Devuelve {ordinal: puntaje} de los ejercicios que coinciden (sin ordenar)"""
+        palabras = tokenizar(consulta)
+        if not palabras:
+            return {}
+
+        listas = [self.postings.get(p, {}) for p in palabras[:-1]]
+        listas.append(self._por_prefijo(palabras[-1]))
+        if not all(listas):
+            return {}
+
+        if len(listas) == 1:
+            return listas[0]
+
+        # Intersectar empezando por la lista más corta
+        listas.sort(key=len)
+        candidatos = set(listas[0])
+        for posting in listas[1:]:
+            candidatos.intersection_update(posting)
+            if not candidatos:
+                return {}
+
+        return {o: sum(posting[o] for posting in listas) for o in candidatos}
+
+    @staticmethod
+    def ordenar(puntajes, limite=None):
+        """Ordena ordinales por puntaje descendente (desempate por ordinal)"""
+        clave = lambda o: (-puntajes[o], o)
+        if limite is not None and limite < len(puntajes):
+            return heapq.nsmallest(limite, puntajes, key=clave)
+        return sorted(puntajes, key=clave)
+
+    def buscar(self, consulta, limite=None):
+        """Devuelve los IDs de ejercicios que coinciden, ordenados por relevancia"""
+        return [self.ids[o] for o in self.buscar_ordinales(consulta, limite)]
@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Catálogo de Ejercicios - Plataforma Preuniversitaria
+===================================================
+
+Catálogo en memoria de los ejercicios exportados a JSON.
+
+El archivo se lee una sola vez por proceso (worker) y solo se vuelve a
+cargar cuando cambia su fecha de modificación o su tamaño. Los ejercicios
+se entregan como vistas de solo lectura, de modo que las rutas no pueden
+alterar el catálogo compartido por accidente.
+
+Cada solicitud trabaja sobre una única instantánea del catálogo. Con el
+vigilante activado (``CATALOGO_VIGILAR``) un hilo revisa los archivos cada
+pocos segundos y reemplaza la instantánea en segundo plano, así que las
+solicitudes no hacen ninguna llamada al sistema de archivos.
+
+Cada ejercicio es un registro ``Ejercicio`` con ``__slots__``: los valores
+categóricos (materia, capítulo, nivel, ...) se comparten entre ejercicios
+y los textos grandes se guardan comprimidos hasta que se leen.
+
+Autor: Plataforma Preuniversitaria
+Fecha: 2025
+"""
+
+import contextvars
+import hashlib
+import json
+import os
+import sys
+import threading
+import zlib
+from collections.abc import Mapping
+from functools import partial
+
+from buscador import VERSION_TOKENIZADOR, IndiceBusqueda
+from catalogo_binario import CatalogoBinario, TextoMapeado
+from filtros import IndiceFiltros
+from render_latex import CacheRenderizado, firma_render, indice_imagenes, ruta_cache_render
+
+# Mapeo de códigos de materia a nombres amigables
+CODIGOS_MATERIAS = {
+    'MATU': {'nombre': 'Matemáticas Preuniversitaria', 'color': '#2563eb'},
+    'FISU': {'nombre': 'Física Preuniversitaria', 'color': '#dc2626'},
+    'QUIM': {'nombre': 'Química Preuniversitaria', 'color': '#16a34a'},
+    'LENG': {'nombre': 'Lenguaje y Literatura', 'color': '#ea580c'},
+    'CAL2': {'nombre': 'Cálculo 2', 'color': '#7c3aed'},
+    'ALGN': {'nombre': 'Álgebra Lineal', 'color': '#0891b2'},
+    'FIS1': {'nombre': 'Física 1', 'color': '#be123c'},
+    'FIS2': {'nombre': 'Física 2', 'color': '#a21caf'},
+    'HIST': {'nombre': 'Historia', 'color': '#ca8a04'},
+    'EDIF': {'nombre': 'Ecuaciones Diferenciales', 'color': '#059669'}
+}
+
+# Archivos de ejercicios en orden de preferencia (binario o consolidado del
+# exportador si existen, luego el JSON nuevo y el antiguo como fallback)
+ARCHIVOS_EJERCICIOS = (
+    'etiquetas/todos_ejercicios_nuevo.bin',
+    'etiquetas/todos_ejercicios_nuevo.consolidado',
+    'etiquetas/todos_ejercicios_nuevo.json',
+    'etiquetas/todos_ejercicios.json',
+)
+
+def obtener_info_materia(codigo_materia):
+    """Obtiene información amigable de una materia por su código"""
+    return CODIGOS_MATERIAS.get(codigo_materia, {
+        'nombre': codigo_materia,
+        'color': '#6b7280'
+    })
+
+def obtener_nombre_materia(codigo_materia):
+    """Obtiene el nombre completo de una materia por su código"""
+    info = obtener_info_materia(codigo_materia)
+    return info['nombre']
+
+# Campos de un ejercicio exportado; cada uno es un atributo con __slots__
+CAMPOS_EJERCICIO = (
+    'id', 'materia_principal', 'codigo_materia', 'nombre_materia', 'capitulo', 'subtema',
+    'nivel', 'dificultad', 'tiempo_estimado', 'procedencia', 'visibilidad', 'libros', 'tags',
+    'enunciado', 'solucion', 'archivo_origen', 'fecha_procesado', 'youtube_url',
+    'mostrar_solucion', 'libro_promocion',
+)
+
+# Campos con pocos valores distintos: se internan para compartir una sola cadena
+CAMPOS_CATEGORICOS = frozenset((
+    'materia_principal', 'codigo_materia', 'nombre_materia', 'capitulo', 'subtema',
+    'nivel', 'visibilidad', 'procedencia', 'libros', 'tags', 'libro_promocion',
+))
+
+# Textos grandes: se guardan comprimidos (o como referencia al catálogo
+# binario mapeado) y se decodifican solo al leerlos
+TEXTOS_GRANDES = ('enunciado', 'solucion')
+MIN_BYTES_COMPRIMIR = 256
+
+_CAMPOS = frozenset(CAMPOS_EJERCICIO)
+_FALTA = object()
+
+def _congelar(valor, internar=False):
+    """Convierte listas anidadas en tuplas (e interna sus cadenas si se pide)"""
+    if isinstance(valor, list):
+        return tuple(_congelar(v, internar) for v in valor)
+    if internar and isinstance(valor, str):
+        return sys.intern(valor)
+    return valor
+
+def _comprimir(texto):
+    """Texto grande como bytes zlib (los textos cortos se guardan tal cual)"""
+    if isinstance(texto, str):
+        datos = texto.encode('utf-8')
+        if len(datos) >= MIN_BYTES_COMPRIMIR:
+            return zlib.compress(datos)
+    return texto
+
+def _descomprimir(valor):
+    if isinstance(valor, bytes):
+        return zlib.decompress(valor).decode('utf-8')
+    if isinstance(valor, TextoMapeado):
+        return valor.leer()
+    return valor
+
+class Ejercicio(Mapping):
+    """
+    Ejercicio del catálogo: registro compacto de solo lectura.
+
+    Los campos conocidos (``CAMPOS_EJERCICIO``) son atributos con
+    ``__slots__``, los categóricos se internan y el enunciado y la solución
+    se guardan comprimidos (o, desde el catálogo binario, como referencia al
+    archivo mapeado). Los campos desconocidos van a ``_extra``.
+
+    Se comporta como un ``Mapping`` (``e['id']``, ``e.get('nivel')``,
+    ``'tags' in e``), así que las rutas y templates no cambian; para
+    anotarlo o serializarlo con ``jsonify`` se usa una copia:
+    ``dict(ejercicio)``.
+    """
+    __slots__ = tuple('_' + campo if campo in TEXTOS_GRANDES else campo
+                      for campo in CAMPOS_EJERCICIO) + ('_extra',)
+
+    def __init__(self, datos):
+        extra = None
+        for clave, valor in datos.items():
+            if clave in TEXTOS_GRANDES:
+                object.__setattr__(self, '_' + clave, _comprimir(valor))
+            elif clave in _CAMPOS:
+                object.__setattr__(self, clave, _congelar(valor, clave in CAMPOS_CATEGORICOS))
+            else:
+                if extra is None:
+                    extra = {}
+                extra[sys.intern(clave)] = _congelar(valor)
+        object.__setattr__(self, '_extra', extra)
+
+    @property
+    def enunciado(self):
+        return _descomprimir(self._enunciado)
+
+    @property
+    def solucion(self):
+        return _descomprimir(self._solucion)
+
+    def __setattr__(self, nombre, valor):
+        raise TypeError("Los ejercicios del catálogo son de solo lectura; usa dict(ejercicio) para modificarlos")
+
+    __delattr__ = __setattr__
+
+    def get(self, clave, defecto=None):
+        if clave in _CAMPOS:
+            return getattr(self, clave, defecto)
+        if self._extra is None:
+            return defecto
+        return self._extra.get(clave, defecto)
+
+    def __getitem__(self, clave):
+        valor = self.get(clave, _FALTA)
+        if valor is _FALTA:
+            raise KeyError(clave)
+        return valor
+
+    def _tiene(self, campo):
+        """Indica si el campo conocido está presente (sin descomprimir los textos)"""
+        if campo in TEXTOS_GRANDES:
+            return hasattr(self, '_' + campo)
+        return hasattr(self, campo)
+
+    def __contains__(self, clave):
+        if clave in _CAMPOS:
+            return self._tiene(clave)
+        return self._extra is not None and clave in self._extra
+
+    def __iter__(self):
+        for campo in CAMPOS_EJERCICIO:
+            if self._tiene(campo):
+                yield campo
+        if self._extra is not None:
+            yield from self._extra
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def copy(self):
+        """Devuelve una copia mutable del ejercicio"""
+        return dict(self)
+
+    def sin_textos(self):
+        """
+        Copia mutable con todos los campos menos el enunciado y la solución,
+        que no se descomprimen (para reemplazarlos por el HTML renderizado).
+        """
+        return {campo: self[campo] for campo in self if campo not in TEXTOS_GRANDES}
+
+    def __repr__(self):
+        return f'<Ejercicio {self.get("id")}>'
+
+class _EstadoCatalogo:
+    """Instantánea inmutable del catálogo (se reemplaza completa al recargar)"""
+    __slots__ = ('firma', 'version', 'ejercicios', 'por_id', 'html', 'busqueda', 'filtros',
+                 'facetas', 'materia_capitulos', 'metadatos')
+
+    def __init__(self, firma, ejercicios, html=None, metadatos=None, conteos=None):
+        self.firma = firma
+        # Identificador corto de la instantánea (sirve como ETag)
+        self.version = hashlib.sha1(repr(firma).encode()).hexdigest()[:16]
+        self.ejercicios = ejercicios
+        self.por_id = {e.get('id'): e for e in ejercicios}
+        # {id: (enunciado_html, solucion_html)}; del catálogo binario son TextoMapeado
+        self.html = html or {}
+        self.busqueda = IndiceBusqueda(ejercicios, conteos=conteos)
+        self.filtros = IndiceFiltros(ejercicios)
+        # Conteos por valor de todo el catálogo (reemplazan a los del JSON)
+        self.facetas = self.filtros.facetas()
+        # Capítulos disponibles por código de materia (para los filtros de la UI)
+        self.materia_capitulos = self.filtros.valores_por('codigo_materia', 'capitulo')
+        # Metadatos del exportador (fecha de generación, versión, ...)
+        self.metadatos = metadatos or {}
+
+def leer_consolidado(ruta, materias=None):
+    """
+    Lee el artefacto consolidado del exportador (``--consolidado``).
+
+    La primera línea es una cabecera JSON con los metadatos y, por materia,
+    el offset y la longitud en bytes de su arreglo de ejercicios. Con
+    ``materias`` solo se parsean los bloques de esas materias. Devuelve el
+    mismo dict que el JSON principal: {'metadatos': ..., 'ejercicios': [...]}.
+    """
+    with open(ruta, 'rb') as f:
+        cabecera = json.loads(f.readline())
+        datos = f.read()
+
+    ejercicios = []
+    for materia, bloque in cabecera['materias'].items():
+        if materias is not None and materia not in materias:
+            continue
+        inicio = bloque['offset']
+        ejercicios.extend(json.loads(datos[inicio:inicio + bloque['longitud']]))
+    return {'metadatos': cabecera.get('metadatos'), 'ejercicios': ejercicios}
+
+class CatalogoEjercicios:
+    """
+    Catálogo de ejercicios cargado una vez por proceso.
+
+    Sin vigilante, cada acceso fuera de una solicitud (y el primero de cada
+    solicitud) hace un ``os.stat`` sobre el archivo de origen; el JSON solo
+    se vuelve a parsear cuando cambian ``mtime`` o tamaño. Con vigilante,
+    la revisión y la recarga se hacen en un hilo aparte.
+    """
+
+    def __init__(self, archivos=ARCHIVOS_EJERCICIOS):
+        self.archivos = tuple(archivos)
+        self._lock = threading.Lock()
+        self._estado = _EstadoCatalogo(firma=False, ejercicios=())
+        # Segundos entre revisiones del vigilante (None: revisar en cada acceso)
+        self.intervalo = None
+        self._hilo = None
+        self._pid = None
+        self._detener = threading.Event()
+        # Instantánea fijada para la solicitud en curso
+        self._fijada = contextvars.ContextVar(f'catalogo_{id(self)}', default=None)
+
+    def init_app(self, app):
+        """
+        Fija una instantánea por solicitud y, si ``CATALOGO_VIGILAR`` está
+        activo, recarga el catálogo en segundo plano.
+        """
+        if app.config.get('CATALOGO_VIGILAR'):
+            self.intervalo = app.config.get('CATALOGO_INTERVALO', 2)
+        app.before_request(self._fijar_instantanea)
+        app.teardown_request(self._liberar_instantanea)
+        app.extensions['catalogo_ejercicios'] = self
+
+    def _fijar_instantanea(self):
+        self._fijada.set(None)
+        self._fijada.set(self.estado())
+
+    def _liberar_instantanea(self, excepcion=None):
+        self._fijada.set(None)
+
+    def _firma_actual(self):
+        """Devuelve (ruta, mtime, tamaño) del primer archivo existente o None"""
+        for ruta in self.archivos:
+            try:
+                st = os.stat(ruta)
+            except FileNotFoundError:
+                continue
+            return (ruta, st.st_mtime_ns, st.st_size)
+        return None
+
+    def _leer(self, firma):
+        """Parsea el archivo indicado por la firma y anota cada ejercicio"""
+        if firma is None:
+            print("❌ No se encontraron archivos de ejercicios")
+            return _EstadoCatalogo(firma, ())
+
+        ruta = firma[0]
+        binario = None
+        if ruta.endswith('.bin'):
+            binario = CatalogoBinario(ruta)
+            data = {'metadatos': binario.metadatos, 'ejercicios': binario.registros()}
+        elif ruta.endswith('.consolidado'):
+            data = leer_consolidado(ruta)
+        else:
+            with open(ruta, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+
+        ejercicios = []
+        for ejercicio in data.get('ejercicios', []):
+            if 'codigo_materia' in ejercicio:
+                ejercicio['nombre_materia'] = obtener_nombre_materia(ejercicio['codigo_materia'])
+            ejercicios.append(Ejercicio(ejercicio))
+
+        if len(self.archivos) == 1 or ruta != self.archivos[-1]:
+            print(f"✅ Cargados {len(ejercicios)} ejercicios desde estructura nueva")
+        else:
+            print(f"📄 Cargados {len(ejercicios)} ejercicios desde estructura antigua")
+
+        # Una nueva exportación puede traer imágenes nuevas: refrescar el índice
+        indice_imagenes.reconstruir()
+        html = None
+        hashes = None
+        conteos = None
+        if binario is not None:
+            # HTML del exportador: referencias al mapa, sin leer ni renderizar el LaTeX
+            html = binario.html(firma_render())
+            if html is None:
+                hashes = binario.hashes()
+            if binario.tiene_palabras(VERSION_TOKENIZADOR):
+                conteos = {campo: partial(binario.palabras, campo) for campo in TEXTOS_GRANDES}
+        if html is None:
+            # HTML precalculado: solo se renderiza lo que cambió desde la última carga
+            html = CacheRenderizado(ruta_cache_render(ruta)).cargar().renderizar(ejercicios, hashes)
+        return _EstadoCatalogo(firma, tuple(ejercicios), html, data.get('metadatos'), conteos)
+
+    def estado(self):
+        """
+        Devuelve la instantánea vigente.
+
+        Dentro de una solicitud siempre es la misma (la fijada al inicio).
+        Con vigilante se devuelve sin consultar el archivo; sin vigilante se
+        recarga aquí si el archivo cambió.
+        """
+        fijada = self._fijada.get()
+        if fijada is not None:
+            return fijada
+        if self.intervalo is not None and self._estado.firma is not False:
+            self._asegurar_vigilante()
+            return self._estado
+        return self._recargar_si_cambio()
+
+    def _recargar_si_cambio(self):
+        """Compara la firma del archivo y recarga la instantánea si cambió"""
+        firma = self._firma_actual()
+        estado = self._estado
+        if estado.firma == firma:
+            return estado
+
+        with self._lock:
+            # Otro hilo pudo haber recargado mientras esperábamos el lock
+            if self._estado.firma != firma:
+                try:
+                    self._estado = self._leer(firma)
+                except (OSError, ValueError) as e:
+                    # Archivo a medio escribir o ilegible: se conserva la versión anterior
+                    print(f"⚠️  No se pudo recargar {firma[0]}: {e}")
+            return self._estado
+
+    def _asegurar_vigilante(self):
+        """Arranca el hilo vigilante en este proceso (también tras un fork)"""
+        if self._pid == os.getpid() and self._hilo is not None and self._hilo.is_alive():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid() and self._hilo is not None and self._hilo.is_alive():
+                return
+            self._pid = os.getpid()
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._vigilar, name='vigilante-catalogo', daemon=True)
+            self._hilo.start()
+
+    def _vigilar(self):
+        """Bucle del vigilante: la nueva instantánea se arma aparte y se reemplaza de una vez"""
+        while not self._detener.wait(self.intervalo):
+            try:
+                self._recargar_si_cambio()
+            except Exception as e:
+                print(f"❌ Error en el vigilante del catálogo: {e}")
+
+    def detener_vigilante(self):
+        """Detiene el hilo vigilante (las solicitudes vuelven a revisar el archivo)"""
+        self._detener.set()
+        if self._hilo is not None and self._hilo is not threading.current_thread():
+            self._hilo.join(timeout=5)
+        self.intervalo = None
+
+    @property
+    def ejercicios(self):
+        """Tupla de ejercicios de solo lectura"""
+        return self.estado().ejercicios
+
+    def obtener(self, ejercicio_id):
+        """Busca un ejercicio por ID en O(1); devuelve None si no existe"""
+        return self.estado().por_id.get(ejercicio_id)
+
+    def html(self, ejercicio_id):
+        """Devuelve (enunciado_html, solucion_html) precalculados o None"""
+        html = self.estado().html.get(ejercicio_id)
+        if html is None:
+            return None
+        return tuple(_descomprimir(texto) for texto in html)
+
+    def buscar(self, consulta, limite=None):
+        """
+        Ejercicios que contienen todas las palabras, ordenados por relevancia.
+
+        Devuelve (total_coincidencias, ejercicios); con ``limite`` solo se
+        devuelven los mejores resultados.
+        """
+        estado = self.estado()
+        indice = estado.busqueda
+        puntajes = indice.coincidencias(consulta)
+        ordinales = indice.ordenar(puntajes, limite)
+        return len(puntajes), [estado.ejercicios[o] for o in ordinales]
+
+    def filtrar(self, *grupos, busqueda=None):
+        """
+        Filtra el catálogo con el índice de atributos.
+
+        Cada grupo es un dict atributo -> valor (o lista de valores) y todos los
+        grupos se combinan con AND; así se pueden encadenar, por ejemplo, las
+        materias favoritas y el ``codigo_materia`` de la URL. Los valores vacíos
+        se ignoran.
+
+        Devuelve (ejercicios en orden del catálogo, facetas del resultado).
+        """
+        estado = self.estado()
+        indice = estado.filtros
+        mapa = indice.todos
+        for criterios in grupos:
+            mapa = indice.filtrar(mapa, **criterios)
+        if busqueda and busqueda.strip() and mapa:
+            mapa &= indice.desde_ordinales(estado.busqueda.coincidencias(busqueda))
+
+        ejercicios = [estado.ejercicios[o] for o in indice.ordinales(mapa)]
+        return ejercicios, indice.facetas(mapa)
+
+    def metadatos(self):
+        """Metadatos del catálogo con conteos calculados en memoria (copia nueva)"""
+        estado = self.estado()
+        data = dict(estado.metadatos)
+        data.update({clave: dict(conteos) for clave, conteos in estado.facetas.items()})
+        data['total_ejercicios'] = len(estado.ejercicios)
+        return data
+
+    def precargar(self):
+        """
+        Carga el catálogo, sus índices y el HTML renderizado ahora mismo.
+
+        Pensado para el proceso maestro de gunicorn (``preload_app``): los
+        workers heredan la instantánea por copy-on-write en lugar de
+        parsear el JSON cada uno. Devuelve la cantidad de ejercicios.
+        """
+        estado = self.estado()
+        return len(estado.ejercicios)
+
+    def invalidar(self):
+        """Fuerza la recarga del archivo en el próximo acceso"""
+        with self._lock:
+            self._estado = _EstadoCatalogo(firma=False, ejercicios=())
+
+# Catálogo compartido por todas las solicitudes del proceso
+catalogo_ejercicios = CatalogoEjercicios()
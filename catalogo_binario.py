@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Catálogo Binario - Plataforma Preuniversitaria
+=============================================
+
+Formato binario del catálogo de ejercicios, pensado para abrirse con
+``mmap`` sin parsear JSON.
+
+- Campos categóricos (materia, capítulo, nivel, ...): una columna de
+  códigos enteros por campo y el diccionario de valores en la cabecera
+- Campos de texto (id, enunciado, solución, ...): una tabla de offsets y
+  longitudes por campo hacia un único bloque de texto UTF-8
+- El enunciado y la solución no se decodifican al cargar: cada ejercicio
+  guarda una referencia (``TextoMapeado``) que lee los bytes del mapa
+  solo cuando se muestra el ejercicio
+- El HTML renderizado (``enunciado_html``, ``solucion_html``), el hash del
+  contenido y las palabras del enunciado y la solución (para el índice de
+  búsqueda) se escriben al exportar, así que al cargar no hace falta leer
+  el LaTeX para hashearlo, renderizarlo ni tokenizarlo
+
+Estructura del archivo::
+
+    MAGIA (8 bytes) | largo de la cabecera (uint32) | cabecera JSON | relleno
+    columnas categóricas | tablas de offsets/longitudes | bloque de texto
+
+Los offsets de la cabecera se cuentan desde el inicio de la zona de datos
+(después del relleno). Todos los enteros son little-endian.
+
+Lo escribe ``exportador/exportar_json_nuevo.py --binario`` y lo lee
+``catalogo.CatalogoEjercicios``.
+
+Autor: Plataforma Preuniversitaria
+Fecha: 2025
+"""
+
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+MAGIA = b'PPCATB01'
+VERSION_BINARIO = 1
+
+# Campos con pocos valores distintos: columna de códigos + diccionario
+CAMPOS_CATEGORICOS = (
+    'materia_principal', 'codigo_materia', 'nombre_materia', 'capitulo', 'subtema',
+    'nivel', 'dificultad', 'tiempo_estimado', 'procedencia', 'visibilidad',
+    'libros', 'tags', 'mostrar_solucion', 'libro_promocion',
+)
+
+# Campos de texto: offsets hacia el bloque de texto
+CAMPOS_TEXTO = ('id', 'enunciado', 'solucion', 'archivo_origen', 'fecha_procesado', 'youtube_url')
+
+# Calculados al exportar (no son campos del ejercicio): hash del LaTeX, HTML
+# renderizado y palabras de los textos como "palabra veces palabra veces ..."
+CAMPOS_PRECALCULADOS = ('hash_contenido', 'enunciado_html', 'solucion_html',
+                        'enunciado_palabras', 'solucion_palabras')
+
+# Textos que se leen del mapa solo al usarlos
+CAMPOS_DIFERIDOS = frozenset(('enunciado', 'solucion'))
+
+# Campos que no encajan en las columnas (otros nombres o tipos): JSON por ejercicio
+CAMPO_EXTRA = '_extra'
+
+_LARGO_CABECERA = struct.Struct('<I')
+
+def _alinear(buffer, multiplo=8):
+    """Agrega ceros hasta que el largo sea múltiplo de ``multiplo``"""
+    buffer.extend(b'\0' * (-len(buffer) % multiplo))
+
+def _clave_valor(valor):
+    return json.dumps(valor, ensure_ascii=False, sort_keys=True)
+
+def serializar_catalogo(ejercicios, metadatos=None, render=None, palabras=None):
+    """
+    Devuelve los bytes del catálogo binario para una lista de ejercicios (dicts).
+
+    Los ejercicios pueden traer también los campos de ``CAMPOS_PRECALCULADOS``;
+    ``render`` es la ``firma_render`` con la que se generó el HTML y
+    ``palabras`` la versión del tokenizador del buscador.
+    """
+    total = len(ejercicios)
+    datos = bytearray()
+    cabecera = {
+        'version': VERSION_BINARIO,
+        'total': total,
+        'metadatos': metadatos or {},
+        'render': render,
+        'palabras': palabras,
+        'categoricos': {},
+        'textos': {},
+    }
+
+    extras = [None] * total
+    for i, ejercicio in enumerate(ejercicios):
+        for clave, valor in ejercicio.items():
+            if clave in CAMPOS_CATEGORICOS:
+                continue
+            if clave in CAMPOS_TEXTO and isinstance(valor, str):
+                continue
+            if clave in CAMPOS_PRECALCULADOS:
+                continue
+            if extras[i] is None:
+                extras[i] = {}
+            extras[i][clave] = valor
+
+    # Columnas categóricas
+    for campo in CAMPOS_CATEGORICOS:
+        valores = []
+        codigos_por_clave = {}
+        codigos = []
+        for ejercicio in ejercicios:
+            if campo not in ejercicio:
+                codigos.append(None)
+                continue
+            valor = ejercicio[campo]
+            clave = _clave_valor(valor)
+            codigo = codigos_por_clave.get(clave)
+            if codigo is None:
+                codigo = codigos_por_clave[clave] = len(valores)
+                valores.append(valor)
+            codigos.append(codigo)
+        if not valores:
+            continue
+
+        tipo = 'H' if len(valores) < 0xFFFF else 'I'
+        ausente = 0xFFFF if tipo == 'H' else 0xFFFFFFFF
+        columna = array(tipo, (ausente if c is None else c for c in codigos))
+        if sys.byteorder != 'little':
+            columna.byteswap()
+        cabecera['categoricos'][campo] = {'tipo': tipo, 'offset': len(datos), 'valores': valores}
+        datos.extend(columna.tobytes())
+        _alinear(datos)
+
+    # Tablas de offsets y bloque de texto
+    bloque = bytearray()
+    tablas = {}
+    for campo in CAMPOS_TEXTO + CAMPOS_PRECALCULADOS + (CAMPO_EXTRA,):
+        inicios = array('q')
+        longitudes = array('i')
+        hay_valores = False
+        for i, ejercicio in enumerate(ejercicios):
+            if campo == CAMPO_EXTRA:
+                valor = None if extras[i] is None else json.dumps(extras[i], ensure_ascii=False)
+            else:
+                valor = ejercicio.get(campo)
+                if not isinstance(valor, str):
+                    valor = None
+            if valor is None:
+                inicios.append(0)
+                longitudes.append(-1)  # Campo ausente
+                continue
+            codificado = valor.encode('utf-8')
+            inicios.append(len(bloque))
+            longitudes.append(len(codificado))
+            bloque.extend(codificado)
+            hay_valores = True
+        if hay_valores:
+            tablas[campo] = (inicios, longitudes)
+
+    for campo, (inicios, longitudes) in tablas.items():
+        if sys.byteorder != 'little':
+            inicios.byteswap()
+            longitudes.byteswap()
+        entrada = {'inicios': len(datos)}
+        datos.extend(inicios.tobytes())
+        _alinear(datos)
+        entrada['longitudes'] = len(datos)
+        datos.extend(longitudes.tobytes())
+        _alinear(datos)
+        cabecera['textos'][campo] = entrada
+
+    cabecera['bloque'] = {'offset': len(datos), 'longitud': len(bloque)}
+    datos.extend(bloque)
+
+    texto_cabecera = json.dumps(cabecera, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    inicio = bytearray(MAGIA)
+    inicio.extend(_LARGO_CABECERA.pack(len(texto_cabecera)))
+    inicio.extend(texto_cabecera)
+    _alinear(inicio)
+    return bytes(inicio) + bytes(datos)
+
+def _congelar(valor):
+    """Listas del diccionario como tuplas y cadenas internadas (compartidas)"""
+    if isinstance(valor, list):
+        return tuple(_congelar(v) for v in valor)
+    if isinstance(valor, str):
+        return sys.intern(valor)
+    return valor
+
+class TextoMapeado:
+    """Referencia a un texto del catálogo binario; se decodifica al leerlo"""
+    __slots__ = ('catalogo', 'campo', 'indice')
+
+    def __init__(self, catalogo, campo, indice):
+        self.catalogo = catalogo
+        self.campo = campo
+        self.indice = indice
+
+    def leer(self):
+        return self.catalogo.texto(self.campo, self.indice)
+
+class CatalogoBinario:
+    """
+    Catálogo binario abierto con ``mmap`` (solo lectura).
+
+    En Windows el archivo se lee a memoria en lugar de mapearse, para que
+    el exportador pueda reemplazarlo mientras la aplicación está corriendo.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        with open(ruta, 'rb') as f:
+            if os.name == 'nt':
+                self._mapa = f.read()
+            else:
+                self._mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        vista = memoryview(self._mapa)
+
+        if bytes(vista[:len(MAGIA)]) != MAGIA:
+            raise ValueError(f"{ruta} no es un catálogo binario")
+        inicio = len(MAGIA)
+        (largo,) = _LARGO_CABECERA.unpack_from(vista, inicio)
+        inicio += _LARGO_CABECERA.size
+        cabecera = json.loads(bytes(vista[inicio:inicio + largo]))
+        if cabecera.get('version') != VERSION_BINARIO:
+            raise ValueError(f"Versión de catálogo binario no soportada: {cabecera.get('version')}")
+        inicio += largo
+        base = inicio + (-inicio % 8)
+
+        self.total = cabecera['total']
+        self.metadatos = cabecera.get('metadatos') or {}
+        self.render = cabecera.get('render')
+        self.version_palabras = cabecera.get('palabras')
+
+        # Columnas categóricas: (códigos, valores, código de ausente)
+        self._categoricos = {}
+        for campo, info in cabecera['categoricos'].items():
+            tamano = 2 if info['tipo'] == 'H' else 4
+            desde = base + info['offset']
+            codigos = vista[desde:desde + tamano * self.total].cast(info['tipo'])
+            ausente = 0xFFFF if info['tipo'] == 'H' else 0xFFFFFFFF
+            self._categoricos[campo] = (codigos, [_congelar(v) for v in info['valores']], ausente)
+
+        self._textos = {}
+        for campo, info in cabecera['textos'].items():
+            desde = base + info['inicios']
+            inicios = vista[desde:desde + 8 * self.total].cast('q')
+            desde = base + info['longitudes']
+            longitudes = vista[desde:desde + 4 * self.total].cast('i')
+            self._textos[campo] = (inicios, longitudes)
+
+        desde = base + cabecera['bloque']['offset']
+        self._bloque = vista[desde:desde + cabecera['bloque']['longitud']]
+
+    def __len__(self):
+        return self.total
+
+    def texto(self, campo, indice):
+        """Texto del campo para el ejercicio ``indice`` (None si no lo tiene)"""
+        tabla = self._textos.get(campo)
+        if tabla is None:
+            return None
+        inicios, longitudes = tabla
+        longitud = longitudes[indice]
+        if longitud < 0:
+            return None
+        inicio = inicios[indice]
+        return str(self._bloque[inicio:inicio + longitud], 'utf-8')
+
+    def registro(self, indice):
+        """
+        Campos del ejercicio ``indice`` como dict: categóricos compartidos,
+        textos cortos decodificados y ``TextoMapeado`` para los diferidos.
+        """
+        registro = {}
+        ejercicio_id = self.texto('id', indice)
+        if ejercicio_id is not None:
+            registro['id'] = ejercicio_id
+        for campo, (codigos, valores, ausente) in self._categoricos.items():
+            codigo = codigos[indice]
+            if codigo != ausente:
+                registro[campo] = valores[codigo]
+        for campo, (_, longitudes) in self._textos.items():
+            if campo == 'id' or campo in CAMPOS_PRECALCULADOS or longitudes[indice] < 0:
+                continue
+            if campo in CAMPOS_DIFERIDOS:
+                registro[campo] = TextoMapeado(self, campo, indice)
+            elif campo == CAMPO_EXTRA:
+                registro.update(json.loads(self.texto(campo, indice)))
+            else:
+                registro[campo] = self.texto(campo, indice)
+        return registro
+
+    def registros(self):
+        """Lista de registros de todos los ejercicios, en orden"""
+        return [self.registro(i) for i in range(self.total)]
+
+    def html(self, render):
+        """
+        {id: (enunciado_html, solucion_html)} como ``TextoMapeado``, sin leer
+        ningún texto del mapa. Devuelve None si el archivo no trae HTML o si
+        se renderizó con otra ``render`` (versión o índice de imágenes).
+        """
+        if self.render != render or 'enunciado_html' not in self._textos:
+            return None
+        html = {}
+        for indice in range(self.total):
+            ejercicio_id = self.texto('id', indice)
+            if ejercicio_id is not None:
+                html[ejercicio_id] = (TextoMapeado(self, 'enunciado_html', indice),
+                                      TextoMapeado(self, 'solucion_html', indice))
+        return html
+
+    def tiene_palabras(self, version):
+        """True si el archivo trae las palabras contadas con esa versión del tokenizador"""
+        return self.version_palabras == version and 'enunciado_palabras' in self._textos
+
+    def palabras(self, campo, indice):
+        """{palabra: veces} del campo de texto ``campo`` del ejercicio ``indice``"""
+        texto = self.texto(campo + '_palabras', indice)
+        if not texto:
+            return {}
+        partes = texto.split(' ')
+        return {partes[i]: int(partes[i + 1]) for i in range(0, len(partes), 2)}
+
+    def hashes(self):
+        """{id: hash del contenido} guardado al exportar (vacío si no lo trae)"""
+        if 'hash_contenido' not in self._textos:
+            return {}
+        hashes = {}
+        for indice in range(self.total):
+            ejercicio_id = self.texto('id', indice)
+            if ejercicio_id is not None:
+                hashes[ejercicio_id] = self.texto('hash_contenido', indice)
+        return hashes
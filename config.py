@@ -13,6 +13,26 @@ Fecha: 2025
 import os
 from datetime import timedelta
 
+def _url_base_datos():
+    """URL de la base de datos (DATABASE_URL o SQLite local)"""
+    url = os.environ.get('DATABASE_URL') or 'sqlite:///plataforma.db'
+    # Algunos proveedores entregan el esquema antiguo 'postgres://'
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+def _opciones_motor(url):
+    """Opciones del pool de conexiones según el motor"""
+    if url.startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': int(os.environ.get('DB_POOL_SIZE') or 5),
+        'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW') or 10),
+        'pool_timeout': int(os.environ.get('DB_POOL_TIMEOUT') or 30),
+        'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE') or 1800),  # Evita conexiones cortadas por el servidor
+        'pool_pre_ping': True,
+    }
+
 class Config:
     """Configuración base de la aplicación"""
     
@@ -20,8 +40,20 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'tu_clave_secreta_aqui_cambiala_en_produccion'
     
     # Configuración de la base de datos
-    SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///plataforma.db'
+    SQLALCHEMY_DATABASE_URI = _url_base_datos()
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = _opciones_motor(SQLALCHEMY_DATABASE_URI)
+    
+    # PRAGMAs aplicados a cada conexión SQLite: WAL permite lecturas durante
+    # las escrituras y busy_timeout espera el bloqueo en vez de fallar con
+    # "database is locked" cuando hay varios workers
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT') or 5000),  # milisegundos
+        'mmap_size': 64 * 1024 * 1024,
+        'temp_store': 'MEMORY',
+    }
     
     # Configuración de sesiones
     PERMANENT_SESSION_LIFETIME = timedelta(days=30)
@@ -47,6 +79,16 @@ class Config:
     MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     
+    # Recarga del catálogo: con CATALOGO_VIGILAR un hilo revisa etiquetas/ cada
+    # CATALOGO_INTERVALO segundos y cambia el catálogo en segundo plano; las
+    # solicitudes ya no consultan el archivo en cada acceso
+    CATALOGO_VIGILAR = os.environ.get('CATALOGO_VIGILAR', 'false').lower() in ['true', 'on', '1']
+    CATALOGO_INTERVALO = float(os.environ.get('CATALOGO_INTERVALO') or 2)
+    
+    # Migraciones: create_app crea las tablas faltantes y aplica las migraciones
+    # pendientes al arrancar (gunicorn.conf.py lo hace una vez en el maestro)
+    MIGRAR_AL_INICIAR = os.environ.get('MIGRAR_AL_INICIAR', 'true').lower() in ['true', 'on', '1']
+    
     # Configuración de la aplicación
     APP_NAME = 'Plataforma Preuniversitaria'
     APP_VERSION = '2.0.0'
@@ -96,6 +138,7 @@ class TestingConfig(Config):
     """Configuración para testing"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_ENGINE_OPTIONS = {}
     WTF_CSRF_ENABLED = False
 
 # Diccionario de configuraciones
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cuotas Diarias - Plataforma Preuniversitaria
+===========================================
+
+Límite diario de ejercicios visibles por usuario.
+
+El estado del día (contador e IDs vistos) se decodifica una sola vez por
+solicitud y se guarda en ``g``; las consultas usan un ``set`` y los cambios
+se acumulan en memoria. Al final de la solicitud se persisten con una única
+escritura: un commit para usuarios registrados o la sesión para visitantes.
+
+Para usuarios registrados el contador inicial sale de la identidad en caché
+(puede tener unos segundos de atraso si otro worker lo cambió) y solo sirve
+para decidir rápido mientras sobra cuota. Al decodificar la lista de IDs
+se leen la fecha y la lista de la fila actual del usuario y el contador
+pasa a ser el largo de la lista, de modo que lo que se guarda nunca mezcla
+datos de la caché con datos de la base.
+
+Autor: Plataforma Preuniversitaria
+Fecha: 2025
+"""
+
+import json
+from datetime import date
+
+from flask import g, session
+from flask_login import current_user
+
+from models import db
+
+# Ejercicios distintos que se pueden ver por día
+LIMITE_DIARIO_REGISTRADO = 15
+LIMITE_DIARIO_ANONIMO = 5
+
+def _decodificar_ids(valor):
+    """Lista de IDs vistos a partir del texto JSON guardado (tolerante a errores)"""
+    if isinstance(valor, list):
+        return list(valor)
+    if not valor:
+        return []
+    try:
+        ids = json.loads(valor)
+    except (TypeError, ValueError):
+        return []
+    return ids if isinstance(ids, list) else []
+
+class CuotaDiaria:
+    """Estado diario de ejercicios vistos de un usuario o de una sesión anónima"""
+
+    def __init__(self, usuario=None, sesion=None):
+        self.usuario = usuario if usuario is not None and usuario.is_authenticated else None
+        self.sesion = sesion
+        self.hoy = date.today()
+        self.modificada = False
+
+        if self.usuario is not None:
+            self.limite = LIMITE_DIARIO_REGISTRADO
+            self.es_premium = self.usuario.is_premium_active()
+            self._vigente = self.usuario.ultima_fecha_conteo == self.hoy
+            self.vistos = (self.usuario.ejercicios_vistos_hoy or 0) if self._vigente else 0
+        else:
+            self.limite = LIMITE_DIARIO_ANONIMO
+            self.es_premium = False
+            sesion = sesion if sesion is not None else {}
+            self._vigente = sesion.get('ultima_fecha_conteo') == self.hoy.isoformat()
+            self.vistos = sesion.get('ejercicios_vistos_hoy', 0) if self._vigente else 0
+
+        # Lista para conservar el orden al guardar, set para consultas O(1);
+        # se decodifican solo si hacen falta
+        self._ids = None
+        self._conjunto = None
+
+    def _decodificar(self):
+        """Decodifica el texto JSON de IDs vistos la primera vez que se necesita"""
+        if self._ids is None:
+            crudo = None
+            if self.usuario is not None:
+                # Fecha e IDs de la fila actual, nunca de la identidad en caché
+                modelo = getattr(self.usuario, 'modelo', self.usuario)
+                self._vigente = modelo.ultima_fecha_conteo == self.hoy
+                if self._vigente:
+                    crudo = modelo.ejercicios_vistos_ids
+            elif self._vigente and self.sesion is not None:
+                crudo = self.sesion.get('ejercicios_vistos_ids')
+            self._ids = _decodificar_ids(crudo)
+            self._conjunto = set(self._ids)
+            if self.usuario is not None:
+                self.vistos = len(self._ids)
+
+    @property
+    def ids_vistos(self):
+        """IDs vistos hoy, en orden"""
+        self._decodificar()
+        return self._ids
+
+    def ya_visto(self, ejercicio_id):
+        """Verifica si el ejercicio ya se contó hoy"""
+        self._decodificar()
+        return ejercicio_id in self._conjunto
+
+    def puede_ver(self, ejercicio_id):
+        """Verifica si el ejercicio se puede mostrar sin consumir cuota"""
+        # Mientras quede cuota no hace falta decodificar la lista de vistos
+        if self.es_premium or self.vistos < self.limite:
+            return True
+        return self.ya_visto(ejercicio_id)
+
+    def marcar_visto(self, ejercicio_id):
+        """
+        Cuenta el ejercicio como visto hoy (una sola vez por ejercicio).
+
+        Devuelve False si se alcanzó el límite. El cambio queda en memoria
+        hasta ``guardar``.
+        """
+        if self.es_premium or self.ya_visto(ejercicio_id):
+            return True
+        if self.vistos >= self.limite:
+            return False
+
+        self.ids_vistos.append(ejercicio_id)
+        self._conjunto.add(ejercicio_id)
+        self.vistos += 1
+        self.modificada = True
+        return True
+
+    def info(self):
+        """Información de límites diarios para los templates"""
+        return {
+            'limite_diario': self.limite,
+            'ejercicios_vistos': self.vistos,
+            'ejercicios_restantes': max(0, self.limite - self.vistos),
+            'es_premium': self.es_premium,
+            'tipo_usuario': 'registrado' if self.usuario is not None else 'sin_registro'
+        }
+
+    def guardar(self):
+        """Persiste los cambios pendientes con una única escritura"""
+        if not self.modificada:
+            return False
+
+        if self.usuario is not None:
+            self.usuario.ejercicios_vistos_hoy = len(self.ids_vistos)
+            self.usuario.ultima_fecha_conteo = self.hoy
+            self.usuario.ejercicios_vistos_ids = json.dumps(self.ids_vistos)
+            db.session.commit()
+        elif self.sesion is not None:
+            self.sesion['ejercicios_vistos_hoy'] = self.vistos
+            self.sesion['ultima_fecha_conteo'] = self.hoy.isoformat()
+            self.sesion['ejercicios_vistos_ids'] = list(self.ids_vistos)
+
+        self.modificada = False
+        return True
+
+def cuota_actual():
+    """Cuota del usuario de la solicitud en curso (se decodifica una sola vez)"""
+    cuota = g.get('cuota_diaria')
+    if cuota is None:
+        cuota = g.cuota_diaria = CuotaDiaria(current_user, session)
+    return cuota
+
+def _guardar_cuota(response):
+    """Persiste la cuota al terminar la solicitud (antes de guardar la sesión)"""
+    cuota = g.get('cuota_diaria')
+    if cuota is not None:
+        try:
+            cuota.guardar()
+        except Exception as e:
+            db.session.rollback()
+            print(f"⚠️  No se pudo guardar la cuota diaria: {e}")
+    return response
+
+def init_cuotas(app):
+    """Registra el guardado de la cuota al final de cada solicitud"""
+    app.after_request(_guardar_cuota)
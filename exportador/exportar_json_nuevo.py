@@ -19,23 +19,185 @@ ejercicios_nuevo/
 │   └── ...
 └── ...
 
+Los archivos se recorren con un tokenizador de una sola pasada
+(``tokenizar_ejercicios``): lee línea por línea, entrega cada entorno
+``ejercicio`` apenas se cierra e informa su número de línea, así que los
+archivos grandes (libros combinados) se procesan en tiempo lineal. Al
+leer un archivo solo se guarda el ejercicio en curso, pero la memoria
+total no es constante: los ejercicios extraídos se acumulan en una lista
+(se necesitan completos para los metadatos y los JSON por materia), y el
+modo incremental lee entero cada archivo nuevo o modificado para calcular
+su hash y enviarlo al pool.
+
+Modo incremental (--incremental): un manifiesto guarda, por archivo .tex,
+su hash de contenido y los ejercicios extraídos. Solo se vuelven a parsear
+los archivos nuevos o modificados, en paralelo con un pool de procesos.
+``fecha_procesado`` es la fecha de modificación del archivo de origen, de
+modo que dos exportaciones del mismo árbol producen el mismo JSON.
+
+Los archivos se publican de forma atómica (temporal + renombrado) en
+formato compacto; --legible los escribe con sangría. Con --consolidado se
+genera además ``todos_ejercicios_nuevo.consolidado``: una línea de cabecera
+JSON (metadatos y, por materia, offset y longitud en bytes de su bloque)
+seguida de un arreglo JSON de ejercicios por materia. Con --binario se
+genera ``todos_ejercicios_nuevo.bin`` (ver ``catalogo_binario.py``), que la
+aplicación abre con mmap sin parsear JSON; trae también el HTML de cada
+ejercicio renderizado con ``render_latex.procesar_latex``.
+
 Autor: Plataforma Preuniversitaria
 Fecha: 2024 - Versión Nueva Estructura
 """
 
+import io
 import os
 import re
 import json
+import hashlib
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Iterable, Iterator, NamedTuple, Optional
 import logging
+import sys
 from datetime import datetime
 
 # Configurar logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Raíz del proyecto: catalogo_binario, render_latex y buscador viven junto a la aplicación
+RAIZ_PROYECTO = Path(__file__).resolve().parent.parent
+if str(RAIZ_PROYECTO) not in sys.path:
+    sys.path.append(str(RAIZ_PROYECTO))
+
+# Versión del formato del manifiesto incremental (cambiarla fuerza un reprocesado completo)
+VERSION_MANIFIESTO = 1
+
+# Con menos archivos modificados que esto no compensa arrancar procesos
+MIN_ARCHIVOS_PARALELO = 32
+
+def hash_archivo(contenido: bytes) -> str:
+    """Hash del contenido de un archivo .tex"""
+    return hashlib.sha256(contenido).hexdigest()
+
+# Delimitadores de los entornos LaTeX que reconoce el tokenizador
+INICIO_EJERCICIO = '\\begin{ejercicio}['
+FIN_EJERCICIO = '\\end{ejercicio}'
+INICIO_SOLUCION = '\\begin{solucion}'
+FIN_SOLUCION = '\\end{solucion}'
+
+class BloqueEjercicio(NamedTuple):
+    """Entorno ``ejercicio`` encontrado por el tokenizador"""
+    metadatos: str      # Texto entre los corchetes de \begin{ejercicio}[...]
+    contenido: str      # Texto hasta \end{ejercicio} (enunciado y solución)
+    linea_inicio: int   # Línea de \begin{ejercicio} (desde 1)
+    linea_fin: int      # Línea de \end{ejercicio}
+
+# Estados del tokenizador
+_FUERA, _METADATOS, _CUERPO = range(3)
+
+def tokenizar_ejercicios(lineas: Iterable[str], origen: str = '') -> Iterator[BloqueEjercicio]:
+    """
+    Recorre las líneas una sola vez y entrega cada entorno ``ejercicio``.
+    
+    Los metadatos terminan en el primer ``]`` y el contenido en el primer
+    ``\\end{ejercicio}``, igual que la expresión regular que reemplaza. Un
+    entorno sin cerrar al final del archivo se descarta con una advertencia.
+    """
+    estado = _FUERA
+    partes = []
+    metadatos = ''
+    linea_inicio = 0
+    numero = 0
+    
+    for numero, linea in enumerate(lineas, 1):
+        pos = 0
+        while True:
+            if estado == _FUERA:
+                i = linea.find(INICIO_EJERCICIO, pos)
+                if i == -1:
+                    break
+                linea_inicio = numero
+                partes = []
+                pos = i + len(INICIO_EJERCICIO)
+                estado = _METADATOS
+            elif estado == _METADATOS:
+                i = linea.find(']', pos)
+                if i == -1:
+                    partes.append(linea[pos:])
+                    break
+                partes.append(linea[pos:i])
+                metadatos = ''.join(partes)
+                partes = []
+                pos = i + 1
+                estado = _CUERPO
+            else:
+                i = linea.find(FIN_EJERCICIO, pos)
+                if i == -1:
+                    partes.append(linea[pos:])
+                    break
+                partes.append(linea[pos:i])
+                yield BloqueEjercicio(metadatos, ''.join(partes), linea_inicio, numero)
+                partes = []
+                pos = i + len(FIN_EJERCICIO)
+                estado = _FUERA
+    
+    if estado != _FUERA:
+        falta = ']' if estado == _METADATOS else FIN_EJERCICIO
+        logger.warning(f"Ejercicio sin cerrar en {origen}:{linea_inicio} (falta {falta} antes de la línea {numero})")
+
+def _bloques_solucion(texto: str) -> Iterator[tuple]:
+    """(inicio, fin del contenido, fin) de cada entorno ``solucion``, de izquierda a derecha"""
+    pos = 0
+    while True:
+        inicio = texto.find(INICIO_SOLUCION, pos)
+        if inicio == -1:
+            return
+        fin_contenido = texto.find(FIN_SOLUCION, inicio + len(INICIO_SOLUCION))
+        if fin_contenido == -1:
+            return
+        pos = fin_contenido + len(FIN_SOLUCION)
+        yield inicio, fin_contenido, pos
+
+# Versión del formato consolidado
+VERSION_CONSOLIDADO = 1
+
+def escribir_atomico(ruta: Path, contenido):
+    """
+    Escribe en un temporal del mismo directorio y lo renombra sobre ``ruta``:
+    quien lea el archivo ve la versión anterior o la nueva completa.
+    """
+    if isinstance(contenido, str):
+        contenido = contenido.encode('utf-8')
+    temporal = ruta.with_name(f".{ruta.name}.tmp")
+    try:
+        with open(temporal, 'wb') as f:
+            f.write(contenido)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+    except BaseException:
+        temporal.unlink(missing_ok=True)
+        raise
+
+def a_json(valor, legible: bool = False) -> str:
+    """Serializa a JSON (compacto por defecto; el compacto usa el codificador en C)"""
+    if legible:
+        return json.dumps(valor, ensure_ascii=False, indent=2)
+    return json.dumps(valor, ensure_ascii=False, separators=(',', ':'))
+
+# Exportador de cada proceso del pool (se crea una vez por proceso)
+_exportador_proceso = None
+
+def _iniciar_proceso(ejercicios_dir: str, output_dir: str):
+    global _exportador_proceso
+    _exportador_proceso = EjercicioExporterNuevo(ejercicios_dir, output_dir)
+
+def _procesar_en_proceso(tarea):
+    """Procesa un archivo en un proceso del pool: (ruta, materia, capitulo, contenido, fecha)"""
+    file_path, materia_principal, capitulo, content, fecha = tarea
+    return _exportador_proceso.parse_tex_content(content, Path(file_path), materia_principal, capitulo, fecha)
+
 class EjercicioExporterNuevo:
     """Clase para exportar ejercicios de la nueva estructura LaTeX a JSON."""
     
@@ -44,24 +206,12 @@ class EjercicioExporterNuevo:
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(exist_ok=True)
         
-        # Patrón regex para extraer ejercicios
-        self.ejercicio_pattern = re.compile(
-            r'\\begin\{ejercicio\}\[(.*?)\](.*?)\\end\{ejercicio\}',
-            re.DOTALL
-        )
-        
         # Patrón mejorado para extraer metadatos con comentarios
         self.metadata_pattern = re.compile(
             r'(\w+)=([^,\n%]+(?:{[^}]*})?)',
             re.DOTALL
         )
         
-        # Patrón para extraer solución
-        self.solucion_pattern = re.compile(
-            r'\\begin\{solucion\}(.*?)\\end\{solucion\}',
-            re.DOTALL
-        )
-        
         # Mapeo de códigos de materia a nombres completos
         self.mapeo_materias = {
             'MATU': 'matematicas_preuniversitaria',
@@ -136,12 +286,29 @@ class EjercicioExporterNuevo:
     
     def extract_ejercicio_content(self, content: str) -> str:
         """Extrae el contenido del ejercicio (sin metadatos ni solución)."""
-        # Remover metadatos
-        content = re.sub(r'\\begin\{ejercicio\}\[.*?\]', '', content, flags=re.DOTALL)
-        content = re.sub(r'\\end\{ejercicio\}', '', content)
+        # Remover metadatos (solo aparecen si el archivo trae entornos anidados)
+        if INICIO_EJERCICIO in content:
+            partes = []
+            pos = 0
+            while True:
+                inicio = content.find(INICIO_EJERCICIO, pos)
+                fin = content.find(']', inicio + len(INICIO_EJERCICIO)) if inicio != -1 else -1
+                if fin == -1:
+                    break
+                partes.append(content[pos:inicio])
+                pos = fin + 1
+            partes.append(content[pos:])
+            content = ''.join(partes)
+        content = content.replace(FIN_EJERCICIO, '')
         
         # Remover solución
-        content = re.sub(r'\\begin\{solucion\}.*?\\end\{solucion\}', '', content, flags=re.DOTALL)
+        partes = []
+        pos = 0
+        for inicio, _, fin in _bloques_solucion(content):
+            partes.append(content[pos:inicio])
+            pos = fin
+        partes.append(content[pos:])
+        content = ''.join(partes)
         
         # Remover comentarios de LaTeX
         lines = content.split('\n')
@@ -155,9 +322,8 @@ class EjercicioExporterNuevo:
     
     def extract_solucion(self, content: str) -> str:
         """Extrae la solución del ejercicio."""
-        match = self.solucion_pattern.search(content)
-        if match:
-            solucion = match.group(1).strip()
+        for inicio, fin_contenido, _ in _bloques_solucion(content):
+            solucion = content[inicio + len(INICIO_SOLUCION):fin_contenido].strip()
             # Limpiar comentarios de la solución
             lines = solucion.split('\n')
             clean_lines = []
@@ -167,32 +333,45 @@ class EjercicioExporterNuevo:
             return '\n'.join(clean_lines).strip()
         return ""
     
+    def fecha_archivo(self, file_path: Path) -> str:
+        """Fecha de modificación del archivo (``fecha_procesado`` determinista)"""
+        return datetime.fromtimestamp(file_path.stat().st_mtime).isoformat()
+    
     def process_tex_file(self, file_path: Path, materia_principal: str, capitulo: str) -> List[Dict[str, Any]]:
-        """Procesa un archivo .tex y extrae todos los ejercicios."""
-        ejercicios = []
-        
+        """Procesa un archivo .tex y devuelve la lista de sus ejercicios."""
         try:
+            fecha = self.fecha_archivo(file_path)
+            # El archivo se lee línea por línea, sin cargarlo completo; la lista
+            # resultante sí tiene todos sus ejercicios
             with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+                return list(self.iter_ejercicios(f, file_path, materia_principal, capitulo, fecha))
         except Exception as e:
             logger.error(f"Error al leer {file_path}: {e}")
-            return ejercicios
-        
-        # Buscar todos los ejercicios en el archivo
-        matches = self.ejercicio_pattern.findall(content)
-        
-        for metadata_str, ejercicio_content in matches:
+            return []
+    
+    def parse_tex_content(self, content: str, file_path: Path, materia_principal: str,
+                          capitulo: str, fecha_procesado: str) -> List[Dict[str, Any]]:
+        """Extrae los ejercicios del contenido de un archivo .tex ya leído."""
+        # newline=None: mismos saltos de línea que al abrir el archivo en modo texto
+        lineas = io.StringIO(content, newline=None)
+        return list(self.iter_ejercicios(lineas, file_path, materia_principal, capitulo, fecha_procesado))
+    
+    def iter_ejercicios(self, lineas: Iterable[str], file_path: Path, materia_principal: str,
+                        capitulo: str, fecha_procesado: str) -> Iterator[Dict[str, Any]]:
+        """Genera los ejercicios de un archivo .tex a medida que el tokenizador los encuentra."""
+        for bloque in tokenizar_ejercicios(lineas, str(file_path)):
+            ubicacion = f"{file_path}:{bloque.linea_inicio}"
             try:
                 # Parsear metadatos
-                metadata = self.parse_metadata(metadata_str)
+                metadata = self.parse_metadata(bloque.metadatos)
                 
                 # Extraer contenido y solución
-                enunciado = self.extract_ejercicio_content(ejercicio_content)
-                solucion = self.extract_solucion(ejercicio_content)
+                enunciado = self.extract_ejercicio_content(bloque.contenido)
+                solucion = self.extract_solucion(bloque.contenido)
                 
                 # Validar que tenga ID
                 if 'id' not in metadata:
-                    logger.warning(f"Ejercicio sin ID en {file_path}")
+                    logger.warning(f"Ejercicio sin ID en {ubicacion}")
                     continue
                 
                 # Crear objeto ejercicio con estructura expandida
@@ -213,7 +392,7 @@ class EjercicioExporterNuevo:
                     'enunciado': enunciado,
                     'solucion': solucion,
                     'archivo_origen': str(file_path.relative_to(self.ejercicios_dir)),
-                    'fecha_procesado': datetime.now().isoformat()
+                    'fecha_procesado': fecha_procesado
                 }
                 
                 # Agregar campos opcionales si existen
@@ -222,55 +401,156 @@ class EjercicioExporterNuevo:
                     if campo in metadata:
                         ejercicio[campo] = metadata[campo]
                 
-                ejercicios.append(ejercicio)
                 logger.info(f"Procesado ejercicio: {ejercicio['id']}")
                 
             except Exception as e:
-                logger.error(f"Error al procesar ejercicio en {file_path}: {e}")
+                logger.error(f"Error al procesar ejercicio en {ubicacion}: {e}")
                 continue
-        
-        return ejercicios
+            
+            yield ejercicio
     
-    def scan_ejercicios_directory(self) -> List[Dict[str, Any]]:
-        """Escanea todo el directorio de ejercicios y extrae todos los ejercicios."""
-        todos_ejercicios = []
+    def listar_archivos_tex(self) -> List[tuple]:
+        """Lista (archivo, materia_principal, capitulo) de toda la estructura, en orden estable."""
+        archivos = []
         
         if not self.ejercicios_dir.exists():
             logger.error(f"Directorio no encontrado: {self.ejercicios_dir}")
-            return todos_ejercicios
+            return archivos
         
         # Recorrer estructura jerárquica: materia_principal/capitulo/*.tex
-        for materia_dir in self.ejercicios_dir.iterdir():
+        for materia_dir in sorted(self.ejercicios_dir.iterdir()):
             if not materia_dir.is_dir():
                 continue
                 
             materia_principal = materia_dir.name
-            logger.info(f"Procesando materia principal: {materia_principal}")
             
             # Recorrer capítulos dentro de la materia
-            for capitulo_dir in materia_dir.iterdir():
+            for capitulo_dir in sorted(materia_dir.iterdir()):
                 if not capitulo_dir.is_dir():
                     continue
                     
                 capitulo = capitulo_dir.name
                 if capitulo == 'imagenes':  # Saltar directorio de imágenes
                     continue
-                    
-                logger.info(f"  Procesando capítulo: {capitulo}")
                 
-                # Procesar archivos .tex en el capítulo
-                for tex_file in capitulo_dir.glob("*.tex"):
-                    logger.info(f"    Procesando archivo: {tex_file.name}")
-                    ejercicios = self.process_tex_file(tex_file, materia_principal, capitulo)
-                    todos_ejercicios.extend(ejercicios)
+                for tex_file in sorted(capitulo_dir.glob("*.tex")):
+                    archivos.append((tex_file, materia_principal, capitulo))
+        
+        return archivos
+    
+    def scan_ejercicios_directory(self) -> List[Dict[str, Any]]:
+        """Escanea todo el directorio de ejercicios y extrae todos los ejercicios."""
+        todos_ejercicios = []
+        
+        for tex_file, materia_principal, capitulo in self.listar_archivos_tex():
+            logger.info(f"Procesando archivo: {tex_file.relative_to(self.ejercicios_dir)}")
+            ejercicios = self.process_tex_file(tex_file, materia_principal, capitulo)
+            todos_ejercicios.extend(ejercicios)
+        
+        return todos_ejercicios
+    
+    @property
+    def archivo_manifiesto(self) -> Path:
+        """Manifiesto del modo incremental (junto al JSON principal)"""
+        return self.output_dir / "todos_ejercicios_nuevo.manifest.json"
+    
+    def cargar_manifiesto(self) -> Dict[str, Any]:
+        """Devuelve {ruta relativa: entrada} del manifiesto anterior (vacío si no sirve)"""
+        try:
+            with open(self.archivo_manifiesto, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if data.get('version') != VERSION_MANIFIESTO:
+            return {}
+        return data.get('archivos', {})
+    
+    def guardar_manifiesto(self, archivos: Dict[str, Any]):
+        """Guarda el manifiesto de forma atómica"""
+        escribir_atomico(self.archivo_manifiesto, a_json({'version': VERSION_MANIFIESTO, 'archivos': archivos}))
+    
+    def scan_incremental(self, procesos: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Como ``scan_ejercicios_directory``, pero reutiliza los ejercicios del
+        manifiesto para los archivos sin cambios.
+        
+        Un archivo con el mismo tamaño y mtime no se vuelve a leer; los demás
+        se leen completos en memoria para calcular el hash. Si cambió
+        la fecha pero no el hash, se reutiliza sin parsear (actualizando su
+        ``fecha_procesado``). Los demás se
+        parsean en un pool de ``procesos`` procesos (por defecto, uno por CPU).
+        """
+        anterior = self.cargar_manifiesto()
+        nuevo = {}
+        pendientes = []  # (ruta relativa, tarea para el pool)
+        
+        for tex_file, materia_principal, capitulo in self.listar_archivos_tex():
+            relativa = tex_file.relative_to(self.ejercicios_dir).as_posix()
+            try:
+                st = tex_file.stat()
+                entrada = anterior.get(relativa)
+                if (entrada and entrada['mtime_ns'] == st.st_mtime_ns and entrada['tamano'] == st.st_size
+                        and entrada['materia_principal'] == materia_principal and entrada['capitulo'] == capitulo):
+                    nuevo[relativa] = entrada
+                    continue
+                
+                contenido = tex_file.read_bytes()
+                texto = contenido.decode('utf-8')
+            except (OSError, UnicodeDecodeError) as e:
+                logger.error(f"Error al leer {tex_file}: {e}")
+                continue
+            
+            digest = hash_archivo(contenido)
+            if entrada and entrada['hash'] == digest and entrada['materia_principal'] == materia_principal \
+                    and entrada['capitulo'] == capitulo:
+                # Solo cambió la fecha de modificación: mismos ejercicios, con la
+                # fecha nueva para que el JSON coincida con una exportación completa
+                fecha = datetime.fromtimestamp(st.st_mtime).isoformat()
+                nuevo[relativa] = dict(entrada, mtime_ns=st.st_mtime_ns, tamano=st.st_size,
+                                       ejercicios=[dict(e, fecha_procesado=fecha)
+                                                   for e in entrada['ejercicios']])
+                continue
+            
+            nuevo[relativa] = {
+                'hash': digest,
+                'mtime_ns': st.st_mtime_ns,
+                'tamano': st.st_size,
+                'materia_principal': materia_principal,
+                'capitulo': capitulo,
+                'ejercicios': None
+            }
+            fecha = datetime.fromtimestamp(st.st_mtime).isoformat()
+            pendientes.append((relativa, (str(tex_file), materia_principal, capitulo, texto, fecha)))
         
+        logger.info(f"Archivos .tex: {len(nuevo)} ({len(pendientes)} nuevos o modificados, "
+                    f"{len(set(anterior) - set(nuevo))} eliminados)")
+        
+        tareas = [tarea for _, tarea in pendientes]
+        if len(tareas) >= MIN_ARCHIVOS_PARALELO and procesos != 1:
+            with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso,
+                                     initargs=(str(self.ejercicios_dir), str(self.output_dir))) as pool:
+                resultados = list(pool.map(_procesar_en_proceso, tareas, chunksize=16))
+        else:
+            resultados = [self.parse_tex_content(content, Path(ruta), materia, capitulo, fecha)
+                          for ruta, materia, capitulo, content, fecha in tareas]
+        
+        for (relativa, _), ejercicios in zip(pendientes, resultados):
+            nuevo[relativa]['ejercicios'] = ejercicios
+        
+        self.guardar_manifiesto(nuevo)
+        
+        # Mismo orden que un escaneo completo
+        todos_ejercicios = []
+        for entrada in nuevo.values():
+            todos_ejercicios.extend(entrada['ejercicios'])
         return todos_ejercicios
     
     def generar_metadatos(self, ejercicios: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Genera metadatos estadísticos de los ejercicios."""
         metadatos = {
             'total_ejercicios': len(ejercicios),
-            'fecha_generacion': datetime.now().isoformat(),
+            # Fecha del ejercicio más reciente: la misma entrada produce la misma salida
+            'fecha_generacion': max((e['fecha_procesado'] for e in ejercicios), default=None),
             'version_estructura': '2.0_jerarquica',
             'materias_principales': {},
             'capitulos': {},
@@ -324,12 +604,34 @@ class EjercicioExporterNuevo:
         
         return metadatos
     
-    def export_to_json(self) -> bool:
-        """Exporta todos los ejercicios a archivos JSON."""
+    @property
+    def archivo_binario(self) -> Path:
+        """Catálogo binario para la aplicación (opcional)"""
+        return self.output_dir / "todos_ejercicios_nuevo.bin"
+    
+    @property
+    def archivo_consolidado(self) -> Path:
+        """Artefacto único con offsets por materia (opcional)"""
+        return self.output_dir / "todos_ejercicios_nuevo.consolidado"
+    
+    def export_to_json(self, incremental: bool = False, procesos: Optional[int] = None,
+                       legible: bool = False, consolidado: bool = False, binario: bool = False) -> bool:
+        """
+        Exporta todos los ejercicios a archivos JSON.
+        
+        Con ``incremental`` solo se parsean los archivos que cambiaron desde
+        la última exportación incremental (ver ``scan_incremental``). Cada
+        archivo se publica de forma atómica; ``legible`` usa sangría en lugar
+        del formato compacto, ``consolidado`` genera también el artefacto
+        único con offsets por materia y ``binario`` el catálogo binario.
+        """
         logger.info("Iniciando exportación a JSON...")
         
         # Escanear todos los ejercicios
-        todos_ejercicios = self.scan_ejercicios_directory()
+        if incremental:
+            todos_ejercicios = self.scan_incremental(procesos)
+        else:
+            todos_ejercicios = self.scan_ejercicios_directory()
         
         if not todos_ejercicios:
             logger.warning("No se encontraron ejercicios para exportar")
@@ -338,44 +640,111 @@ class EjercicioExporterNuevo:
         # Generar metadatos
         metadatos = self.generar_metadatos(todos_ejercicios)
         
-        # Exportar archivo principal con todos los ejercicios
-        archivo_principal = self.output_dir / "todos_ejercicios_nuevo.json"
-        data_principal = {
-            'metadatos': metadatos,
-            'ejercicios': todos_ejercicios
-        }
-        
-        with open(archivo_principal, 'w', encoding='utf-8') as f:
-            json.dump(data_principal, f, ensure_ascii=False, indent=2)
-        logger.info(f"Exportado: {archivo_principal}")
-        
-        # Exportar metadatos por separado
-        archivo_metadatos = self.output_dir / "metadata_ejercicios_nuevo.json"
-        with open(archivo_metadatos, 'w', encoding='utf-8') as f:
-            json.dump(metadatos, f, ensure_ascii=False, indent=2)
-        logger.info(f"Exportado: {archivo_metadatos}")
-        
-        # Exportar por materia principal
+        # Agrupar por materia principal
         ejercicios_por_materia = {}
         for ejercicio in todos_ejercicios:
-            materia = ejercicio['materia_principal']
-            if materia not in ejercicios_por_materia:
-                ejercicios_por_materia[materia] = []
-            ejercicios_por_materia[materia].append(ejercicio)
+            ejercicios_por_materia.setdefault(ejercicio['materia_principal'], []).append(ejercicio)
+        
+        if legible:
+            def archivo_ejercicios(cabecera, ejercicios):
+                return a_json(dict(cabecera, ejercicios=ejercicios), legible=True)
+        else:
+            # Cada ejercicio se serializa una sola vez y se reutiliza en todos los archivos
+            textos = {id(e): a_json(e) for e in todos_ejercicios}
+            
+            def archivo_ejercicios(cabecera, ejercicios):
+                inicio = a_json(cabecera)[:-1]
+                separador = ',' if cabecera else ''
+                lista = ','.join(textos[id(e)] for e in ejercicios)
+                return f'{inicio}{separador}"ejercicios":[{lista}]}}'
         
+        # Por materia y metadatos primero; el archivo principal (el que lee la app) al final
         for materia, ejercicios in ejercicios_por_materia.items():
             archivo_materia = self.output_dir / f"{materia}_nuevo.json"
-            data_materia = {
-                'materia_principal': materia,
-                'total_ejercicios': len(ejercicios),
-                'ejercicios': ejercicios
-            }
-            with open(archivo_materia, 'w', encoding='utf-8') as f:
-                json.dump(data_materia, f, ensure_ascii=False, indent=2)
+            escribir_atomico(archivo_materia, archivo_ejercicios(
+                {'materia_principal': materia, 'total_ejercicios': len(ejercicios)}, ejercicios))
             logger.info(f"Exportado: {archivo_materia}")
         
+        archivo_metadatos = self.output_dir / "metadata_ejercicios_nuevo.json"
+        escribir_atomico(archivo_metadatos, a_json(metadatos, legible))
+        logger.info(f"Exportado: {archivo_metadatos}")
+        
+        archivo_principal = self.output_dir / "todos_ejercicios_nuevo.json"
+        escribir_atomico(archivo_principal, archivo_ejercicios({'metadatos': metadatos}, todos_ejercicios))
+        logger.info(f"Exportado: {archivo_principal}")
+        
+        if consolidado:
+            self.exportar_consolidado(metadatos, ejercicios_por_materia,
+                                      textos if not legible else None)
+        elif self.archivo_consolidado.exists():
+            # La app prefiere el consolidado: no dejar uno desactualizado
+            self.archivo_consolidado.unlink()
+            logger.info(f"Eliminado consolidado desactualizado: {self.archivo_consolidado}")
+        
+        if binario:
+            self.exportar_binario(metadatos, todos_ejercicios)
+        elif self.archivo_binario.exists():
+            self.archivo_binario.unlink()
+            logger.info(f"Eliminado catálogo binario desactualizado: {self.archivo_binario}")
+        
         logger.info(f"✅ Exportación completada: {len(todos_ejercicios)} ejercicios procesados")
         return True
+    
+    def exportar_consolidado(self, metadatos: Dict[str, Any], ejercicios_por_materia: Dict[str, List],
+                             textos: Optional[Dict[int, str]] = None):
+        """
+        Escribe el artefacto consolidado: cabecera JSON en la primera línea y
+        un arreglo compacto por materia. Los offsets de la cabecera se cuentan
+        en bytes desde el fin de la línea de cabecera.
+        """
+        bloques = []
+        materias = {}
+        offset = 0
+        for materia, ejercicios in ejercicios_por_materia.items():
+            lista = ','.join(textos[id(e)] if textos else a_json(e) for e in ejercicios)
+            bloque = f'[{lista}]\n'.encode('utf-8')
+            materias[materia] = {'offset': offset, 'longitud': len(bloque) - 1, 'total': len(ejercicios)}
+            bloques.append(bloque)
+            offset += len(bloque)
+        
+        cabecera = a_json({
+            'formato': 'consolidado',
+            'version': VERSION_CONSOLIDADO,
+            'metadatos': metadatos,
+            'materias': materias
+        })
+        escribir_atomico(self.archivo_consolidado, cabecera.encode('utf-8') + b'\n' + b''.join(bloques))
+        logger.info(f"Exportado: {self.archivo_consolidado}")
+
+    def exportar_binario(self, metadatos: Dict[str, Any], ejercicios: List[Dict[str, Any]]):
+        """
+        Escribe el catálogo binario (formato definido en catalogo_binario.py)
+        con el HTML de cada ejercicio ya renderizado, el hash de su LaTeX y
+        las palabras del enunciado y la solución para el buscador, de modo
+        que la aplicación no tenga que leer los textos al cargarlo.
+        """
+        # Módulos de la aplicación (RAIZ_PROYECTO); solo se importan al generar el binario
+        from buscador import VERSION_TOKENIZADOR, contar_palabras
+        from catalogo_binario import serializar_catalogo
+        from render_latex import IndiceImagenes, firma_render, hash_contenido, procesar_latex
+        
+        indice = IndiceImagenes(self.ejercicios_dir).reconstruir()
+        filas = []
+        for ejercicio in ejercicios:
+            fila = dict(ejercicio)
+            fila['hash_contenido'] = hash_contenido(ejercicio)
+            fila['enunciado_html'] = procesar_latex(ejercicio.get('enunciado'), indice)
+            fila['solucion_html'] = procesar_latex(ejercicio.get('solucion'), indice)
+            for campo in ('enunciado', 'solucion'):
+                if ejercicio.get(campo) is not None:
+                    fila[f'{campo}_palabras'] = ' '.join(
+                        f'{palabra} {veces}' for palabra, veces in contar_palabras(ejercicio[campo]).items())
+            filas.append(fila)
+        
+        contenido = serializar_catalogo(filas, metadatos, render=firma_render(indice),
+                                        palabras=VERSION_TOKENIZADOR)
+        escribir_atomico(self.archivo_binario, contenido)
+        logger.info(f"Exportado: {self.archivo_binario}")
 
 def main():
     """Función principal."""
@@ -383,6 +752,16 @@ def main():
     parser.add_argument('--input', '-i', default='ejercicios_nuevo', help='Directorio de ejercicios (default: ejercicios_nuevo)')
     parser.add_argument('--output', '-o', default='etiquetas', help='Directorio de salida (default: etiquetas)')
     parser.add_argument('--verbose', '-v', action='store_true', help='Salida detallada')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Reprocesar solo los archivos .tex modificados (usa un manifiesto de hashes)')
+    parser.add_argument('--procesos', '-j', type=int, default=None,
+                        help='Procesos para parsear en modo incremental (default: uno por CPU)')
+    parser.add_argument('--legible', action='store_true',
+                        help='Escribir los JSON con sangría (por defecto: formato compacto)')
+    parser.add_argument('--consolidado', action='store_true',
+                        help='Generar también todos_ejercicios_nuevo.consolidado (un solo archivo con offsets por materia)')
+    parser.add_argument('--binario', action='store_true',
+                        help='Generar también todos_ejercicios_nuevo.bin (catálogo binario para la aplicación)')
     
     args = parser.parse_args()
     
@@ -391,7 +770,9 @@ def main():
     
     # Crear exportador y ejecutar
     exporter = EjercicioExporterNuevo(args.input, args.output)
-    success = exporter.export_to_json()
+    success = exporter.export_to_json(incremental=args.incremental, procesos=args.procesos,
+                                      legible=args.legible, consolidado=args.consolidado,
+                                      binario=args.binario)
     
     if success:
         print("🎉 Exportación exitosa!")
@@ -400,6 +781,10 @@ def main():
         print("   - todos_ejercicios_nuevo.json")
         print("   - metadata_ejercicios_nuevo.json")
         print("   - [materia]_nuevo.json (por materia)")
+        if args.consolidado:
+            print("   - todos_ejercicios_nuevo.consolidado")
+        if args.binario:
+            print("   - todos_ejercicios_nuevo.bin")
     else:
         print("❌ Error en la exportación")
         return 1
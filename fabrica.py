@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Fábrica Base de la Aplicación - Plataforma Preuniversitaria
+==========================================================
+
+Aplicación Flask mínima: configuración y base de datos, sin rutas, OAuth
+ni catálogo. La usan los scripts de administración (``hacer_admin.py``,
+``otorgar_premium.py``, ``mantenimiento.py``) para arrancar en milisegundos,
+y ``app.create_app`` la completa con el resto de subsistemas.
+
+Autor: Plataforma Preuniversitaria
+Fecha: 2025
+"""
+
+import os
+
+from flask import Flask
+
+from config import config
+from models import db, configurar_sqlite
+
+def nombre_configuracion(config_name=None):
+    """
+    Clave de ``config.config`` a usar: la indicada, ``FLASK_CONFIG`` o
+    'default' (desarrollo). ``gunicorn.conf.py`` fija ``FLASK_CONFIG=production``
+    si no está definida; los scripts de administración usan 'default'.
+    """
+    return config_name or os.environ.get('FLASK_CONFIG') or 'default'
+
+def crear_app_base(config_name=None, import_name='app'):
+    """
+    Crea una aplicación con la configuración indicada (ver
+    ``nombre_configuracion``) y la base de datos lista para usar dentro de
+    ``app.app_context()``.
+    """
+    config_name = nombre_configuracion(config_name)
+
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    app = Flask(import_name, root_path=raiz, instance_path=os.path.join(raiz, 'instance'))
+    app.config.from_object(config[config_name])
+    config[config_name].init_app(app)
+
+    db.init_app(app)
+    configurar_sqlite(app)  # WAL, busy_timeout y mmap en cada conexión SQLite
+    return app
+
+class RegistroRutas:
+    """
+    Colecciona rutas y hooks de un módulo para registrarlos en la aplicación
+    que cree la fábrica. Se usa como ``app``: ``@rutas.route('/')`` y
+    ``@rutas.before_request``; los endpoints conservan el nombre de la
+    función (``url_for('index')``), a diferencia de un Blueprint.
+    """
+
+    def __init__(self):
+        self._rutas = []
+        self._antes = []
+
+    def route(self, regla, **opciones):
+        def decorador(funcion):
+            self._rutas.append((regla, funcion, opciones))
+            return funcion
+        return decorador
+
+    def before_request(self, funcion):
+        self._antes.append(funcion)
+        return funcion
+
+    def registrar(self, app):
+        """Registra en ``app`` todas las rutas y hooks colectados"""
+        for funcion in self._antes:
+            app.before_request(funcion)
+        for regla, funcion, opciones in self._rutas:
+            opciones = dict(opciones)
+            endpoint = opciones.pop('endpoint', funcion.__name__)
+            app.add_url_rule(regla, endpoint, funcion, **opciones)
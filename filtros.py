@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Índice de Filtros - Plataforma Preuniversitaria
+==============================================
+
+Índice por atributo de los ejercicios del catálogo.
+
+Para cada atributo filtrable (materia, capítulo, nivel, ...) y cada valor se
+guarda un mapa de bits con los ordinales de los ejercicios que lo tienen.
+Una combinación de filtros se resuelve con operaciones AND/OR entre enteros,
+sin copiar listas, y los conteos por valor (facetas) salen de contar bits.
+
+Autor: Plataforma Preuniversitaria
+Fecha: 2025
+"""
+
+# Atributo del ejercicio -> clave usada en los metadatos y en los templates
+ATRIBUTOS_FILTRO = {
+    'codigo_materia': 'codigos_materia',
+    'materia_principal': 'materias_principales',
+    'capitulo': 'capitulos',
+    'nivel': 'niveles',
+    'dificultad': 'dificultades',
+    'visibilidad': 'visibilidades',
+}
+
+def _valor_filtro(ejercicio, atributo):
+    """Valor normalizado de un atributo (la dificultad se compara como texto)"""
+    valor = ejercicio.get(atributo)
+    if atributo == 'dificultad':
+        return str(valor if valor is not None else '')
+    return valor
+
+def _mapa_de_bits(ordinales, total):
+    """Construye un entero con los bits de ``ordinales`` activos en O(total)"""
+    buffer = bytearray((total + 7) // 8)
+    for ordinal in ordinales:
+        buffer[ordinal >> 3] |= 1 << (ordinal & 7)
+    return int.from_bytes(buffer, 'little')
+
+def _contar_bits(mapa):
+    """Bits activos de un mapa (``int.bit_count`` solo existe desde Python 3.10)"""
+    return bin(mapa).count('1')
+
+if hasattr(int, 'bit_count'):
+    _contar_bits = int.bit_count
+
+class IndiceFiltros:
+    """
+    Mapas de bits atributo -> valor -> entero, donde el bit ``i`` indica que
+    el ejercicio con ordinal ``i`` tiene ese valor.
+    """
+
+    def __init__(self, ejercicios, atributos=ATRIBUTOS_FILTRO):
+        self.total = len(ejercicios)
+        self.todos = (1 << self.total) - 1
+        self.mapas = {atributo: {} for atributo in atributos}
+
+        for atributo, por_valor in self.mapas.items():
+            agrupados = {}
+            for ordinal, ejercicio in enumerate(ejercicios):
+                agrupados.setdefault(_valor_filtro(ejercicio, atributo), []).append(ordinal)
+            for valor, ordinales in agrupados.items():
+                por_valor[valor] = _mapa_de_bits(ordinales, self.total)
+
+    def mapa(self, atributo, valores):
+        """
+        Mapa de bits de los ejercicios cuyo atributo está en ``valores``.
+
+        ``valores`` puede ser un único valor o una lista (se unen con OR).
+        """
+        por_valor = self.mapas[atributo]
+        if isinstance(valores, (list, tuple, set, frozenset)):
+            resultado = 0
+            for valor in valores:
+                resultado |= por_valor.get(valor, 0)
+            return resultado
+        return por_valor.get(valores, 0)
+
+    def filtrar(self, base=None, **criterios):
+        """
+        Intersecta los criterios (AND entre atributos, OR dentro de una lista).
+
+        Los criterios vacíos se ignoran, igual que un filtro no seleccionado
+        en la URL. ``base`` permite partir de un mapa ya filtrado.
+        """
+        resultado = self.todos if base is None else base
+        for atributo, valores in criterios.items():
+            if not valores:
+                continue
+            resultado &= self.mapa(atributo, valores)
+            if not resultado:
+                break
+        return resultado
+
+    def desde_ordinales(self, ordinales):
+        """Construye un mapa de bits a partir de ordinales"""
+        return _mapa_de_bits(ordinales, self.total)
+
+    @staticmethod
+    def ordinales(mapa):
+        """Ordinales activos de un mapa de bits, en orden ascendente"""
+        bits = bin(mapa)[:1:-1]  # bit menos significativo primero
+        resultado = []
+        i = bits.find('1')
+        while i != -1:
+            resultado.append(i)
+            i = bits.find('1', i + 1)
+        return resultado
+
+    def valores_por(self, atributo, sub_atributo):
+        """
+        Para cada valor de ``atributo``, lista ordenada de valores de
+        ``sub_atributo`` presentes (ej: materia -> capítulos).
+        """
+        resultado = {}
+        for valor, bits in self.mapas[atributo].items():
+            if valor is None:
+                continue
+            resultado[valor] = sorted(
+                sub_valor for sub_valor, sub_bits in self.mapas[sub_atributo].items()
+                if sub_valor is not None and bits & sub_bits
+            )
+        return resultado
+
+    def facetas(self, mapa=None):
+        """
+        Conteo de ejercicios por valor de cada atributo dentro del mapa dado
+        (por defecto todo el catálogo), con las claves de los metadatos.
+        """
+        mapa = self.todos if mapa is None else mapa
+        facetas = {}
+        for atributo, por_valor in self.mapas.items():
+            conteos = {}
+            for valor, bits in por_valor.items():
+                if valor is None:
+                    continue
+                cantidad = _contar_bits(bits & mapa)
+                if cantidad:
+                    conteos[valor] = cantidad
+            facetas[ATRIBUTOS_FILTRO[atributo]] = conteos
+        return facetas
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Gestión Masiva de Usuarios - Plataforma Preuniversitaria
+=======================================================
+
+Acciones de administración sobre muchos usuarios a la vez.
+
+- Activar / desactivar: un único ``UPDATE ... WHERE id IN (...)`` por bloque
+- Eliminar: borrado por bloques de las tablas dependientes (sesiones,
+  ejercicios vistos, visitas) y luego de los usuarios, con un commit por
+  bloque para no retener el bloqueo de escritura
+- Las eliminaciones grandes pueden ejecutarse en un hilo en segundo plano
+  y consultar su progreso con ``obtener_tarea``. El estado se guarda en la
+  tabla ``tareas_admin``, así que cualquier worker responde el progreso y
+  una tarea cuyo worker se reinició se retoma desde el último bloque
+
+Autor: Plataforma Preuniversitaria
+Fecha: 2025
+"""
+
+import json
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+from models import db, Usuario, SesionUsuario, EjercicioVisto, VisitaPagina, TareaAdmin
+from visitas import resumir_visitas_de_usuarios
+
+# Cantidad de usuarios por sentencia (SQLite limita los parámetros por consulta)
+TAM_BLOQUE = 500
+
+# Reintentos de un bloque cuando otro proceso resume sus visitas a la vez
+REINTENTOS_BLOQUE = 3
+
+# Tablas con filas que dependen de un usuario, en orden de borrado
+MODELOS_DEPENDIENTES = (SesionUsuario, EjercicioVisto, VisitaPagina)
+
+# Columnas por las que se puede ordenar el listado de administración
+ORDEN_USUARIOS = {
+    'registro': Usuario.fecha_registro,
+    'acceso': Usuario.ultimo_acceso,
+    'nombre': Usuario.nombre_completo,
+    'usuario': Usuario.username,
+    'email': Usuario.email,
+}
+
+def _bloques(ids, tam_bloque):
+    """Divide una lista de IDs en bloques"""
+    for i in range(0, len(ids), tam_bloque):
+        yield ids[i:i + tam_bloque]
+
+def _normalizar_ids(ids):
+    """Convierte los IDs recibidos (texto del formulario) a enteros únicos"""
+    resultado = set()
+    for valor in ids:
+        try:
+            resultado.add(int(valor))
+        except (TypeError, ValueError):
+            continue
+    return sorted(resultado)
+
+def consulta_listado_usuarios(busqueda='', orden='registro', direccion='desc'):
+    """SELECT del listado de administración (filtrado y ordenado en la base de datos)"""
+    consulta = db.select(Usuario)
+    if busqueda:
+        patron = f"%{busqueda}%"
+        consulta = consulta.where(db.or_(
+            Usuario.username.ilike(patron),
+            Usuario.email.ilike(patron),
+            Usuario.nombre_completo.ilike(patron),
+            Usuario.ultima_unidad_educativa.ilike(patron)
+        ))
+    columna = ORDEN_USUARIOS[orden]
+    return consulta.order_by(columna.asc() if direccion == 'asc' else columna.desc(), Usuario.id.desc())
+
+def consulta_ingresos(ids):
+    """SELECT (usuario_id, cantidad de sesiones) de los usuarios indicados"""
+    return (db.select(SesionUsuario.usuario_id, db.func.count(SesionUsuario.id))
+            .where(SesionUsuario.usuario_id.in_(ids))
+            .group_by(SesionUsuario.usuario_id))
+
+def sentencia_borrar_dependientes(modelo, ids):
+    """DELETE de las filas de ``modelo`` que pertenecen a los usuarios indicados"""
+    return (db.delete(modelo)
+            .where(modelo.usuario_id.in_(ids))
+            .execution_options(synchronize_session=False))
+
+def ids_eliminables(ids, admin_id=None):
+    """IDs existentes que se pueden eliminar (ni administradores ni el propio admin)"""
+    ids = _normalizar_ids(ids)
+    resultado = []
+    for bloque in _bloques(ids, TAM_BLOQUE):
+        filas = (db.session.query(Usuario.id)
+                 .filter(Usuario.id.in_(bloque), Usuario.es_admin.isnot(True))
+                 .all())
+        resultado.extend(fila.id for fila in filas if fila.id != admin_id)
+    return resultado
+
+def cambiar_estado_usuarios(ids, activo, admin_id=None):
+    """
+    Activa o desactiva usuarios con UPDATEs por bloque en una transacción.
+
+    El administrador que ejecuta la acción nunca se modifica a sí mismo.
+    Devuelve la cantidad de usuarios actualizados.
+    """
+    ids = [i for i in _normalizar_ids(ids) if i != admin_id]
+    actualizados = 0
+    for bloque in _bloques(ids, TAM_BLOQUE):
+        actualizados += (Usuario.query
+                         .filter(Usuario.id.in_(bloque))
+                         .update({Usuario.es_activo: bool(activo)}, synchronize_session=False))
+    db.session.commit()
+    return actualizados
+
+def eliminar_usuarios(ids, tam_bloque=TAM_BLOQUE, progreso=None):
+    """
+    Elimina usuarios y todas sus filas dependientes por bloques.
+
+    Antes de borrar las visitas crudas de cada bloque se resumen las que
+    estaban pendientes, en la misma transacción, para que los totales de
+    visitas no cambien. ``progreso(procesados, total, eliminados)`` se llama
+    después de cada bloque confirmado. Devuelve la cantidad de usuarios
+    eliminados.
+    """
+    ids = _normalizar_ids(ids)
+    total = len(ids)
+    if not total:
+        return 0
+
+    eliminados = 0
+    procesados = 0
+    for bloque in _bloques(ids, tam_bloque):
+        try:
+            for _ in range(REINTENTOS_BLOQUE):
+                if resumir_visitas_de_usuarios(bloque) is not None:
+                    break
+                db.session.rollback()
+            else:
+                raise RuntimeError("No se pudieron resumir las visitas de los usuarios a eliminar")
+            for modelo in MODELOS_DEPENDIENTES:
+                db.session.execute(sentencia_borrar_dependientes(modelo, bloque))
+            eliminados += (Usuario.query
+                           .filter(Usuario.id.in_(bloque))
+                           .delete(synchronize_session=False))
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        procesados += len(bloque)
+        if progreso is not None:
+            progreso(procesados, total, eliminados)
+
+    return eliminados
+
+# Segundos sin avance tras los que una tarea en progreso se considera
+# abandonada (worker reiniciado) y se retoma en el worker que la consulta
+SEGUNDOS_SIN_PROGRESO = 300
+
+# Días que se conservan las tareas terminadas
+DIAS_CONSERVAR_TAREAS = 7
+
+def _actualizar_tarea(tarea_id, **valores):
+    """Actualiza la fila de la tarea y confirma (marca también el avance)"""
+    valores.setdefault('actualizada', datetime.utcnow())
+    TareaAdmin.query.filter_by(id=tarea_id).update(valores, synchronize_session=False)
+    db.session.commit()
+
+def _ejecutar_eliminacion(app, tarea_id):
+    """Cuerpo del hilo: elimina los IDs pendientes de la tarea por bloques"""
+    with app.app_context():
+        tarea = db.session.get(TareaAdmin, tarea_id)
+        ids = json.loads(tarea.ids)
+        base, previos = tarea.procesados, tarea.eliminados
+
+        def progreso(procesados, total, eliminados):
+            _actualizar_tarea(tarea_id, procesados=base + procesados, eliminados=previos + eliminados)
+
+        try:
+            # Los bloques ya confirmados quedan fuera: se sigue desde el siguiente
+            eliminados = eliminar_usuarios(ids[base:], progreso=progreso)
+            _actualizar_tarea(tarea_id, estado='completada', procesados=len(ids),
+                              eliminados=previos + eliminados, fin=datetime.utcnow())
+        except Exception as e:
+            db.session.rollback()
+            _actualizar_tarea(tarea_id, estado='error', error=str(e), fin=datetime.utcnow())
+            print(f"❌ Error al eliminar usuarios en segundo plano: {e}")
+
+def _lanzar(app, tarea_id):
+    hilo = threading.Thread(target=_ejecutar_eliminacion, args=(app, tarea_id),
+                            name=f'eliminar-usuarios-{tarea_id[:8]}', daemon=True)
+    hilo.start()
+    return hilo
+
+def iniciar_eliminacion(app, ids):
+    """Registra una eliminación en la base de datos, la lanza en segundo plano y devuelve la tarea"""
+    ids = _normalizar_ids(ids)
+    ahora = datetime.utcnow()
+
+    # Conservar solo las tareas recientes
+    (TareaAdmin.query
+     .filter(TareaAdmin.fin.isnot(None), TareaAdmin.fin < ahora - timedelta(days=DIAS_CONSERVAR_TAREAS))
+     .delete(synchronize_session=False))
+
+    tarea = TareaAdmin(id=uuid.uuid4().hex, estado='en_progreso', ids=json.dumps(ids),
+                       total=len(ids), inicio=ahora, actualizada=ahora)
+    db.session.add(tarea)
+    db.session.commit()
+    _lanzar(app, tarea.id)
+    return tarea
+
+def _retomar_si_abandonada(app, tarea):
+    """
+    Retoma una tarea en progreso que no avanza hace ``SEGUNDOS_SIN_PROGRESO``.
+
+    La tarea se reclama con un UPDATE condicionado a su último avance, así
+    que si varios workers la consultan a la vez solo uno la retoma.
+    """
+    limite = datetime.utcnow() - timedelta(seconds=SEGUNDOS_SIN_PROGRESO)
+    if tarea.estado != 'en_progreso' or tarea.actualizada is None or tarea.actualizada >= limite:
+        return False
+
+    reclamada = (TareaAdmin.query
+                 .filter_by(id=tarea.id, estado='en_progreso', actualizada=tarea.actualizada)
+                 .update({TareaAdmin.actualizada: datetime.utcnow()}, synchronize_session=False))
+    db.session.commit()
+    if reclamada != 1:
+        return False
+
+    print(f"🔁 Retomando eliminación {tarea.id} desde {tarea.procesados}/{tarea.total}")
+    _lanzar(app, tarea.id)
+    return True
+
+def obtener_tarea(app, tarea_id):
+    """Devuelve la tarea indicada (de cualquier worker) o None"""
+    tarea = db.session.get(TareaAdmin, tarea_id)
+    if tarea is not None and _retomar_si_abandonada(app, tarea):
+        db.session.refresh(tarea)
+    return tarea
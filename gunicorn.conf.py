@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Configuración de Gunicorn - Plataforma Preuniversitaria
+======================================================
+
+Gunicorn lee este archivo automáticamente al ejecutar ``gunicorn app:app``
+desde la raíz del proyecto.
+
+Antes de crear los workers el maestro crea las tablas faltantes y aplica
+las migraciones pendientes una sola vez (``MIGRAR_AL_INICIAR=false`` lo
+desactiva); los workers no migran.
+
+Con ``PRECARGAR_CATALOGO=1`` el proceso maestro crea la aplicación y carga
+el catálogo (ejercicios, índices de búsqueda y filtros, HTML renderizado)
+antes de crear los workers. Los workers comparten esas páginas de memoria
+por copy-on-write y atienden la primera solicitud sin arranque en frío.
+
+Después de la precarga se llama a ``gc.freeze()``: los objetos ya creados
+pasan a la generación permanente y el recolector de basura de cada worker
+no los recorre, así que no escribe en sus cabeceras ni duplica esas páginas.
+
+Autor: Plataforma Preuniversitaria
+Fecha: 2025
+"""
+
+import gc
+import os
+
+# Configuración de producción salvo que FLASK_CONFIG indique otra. Debe
+# fijarse antes de importar config. ProductionConfig exige HTTPS para la
+# cookie de sesión; detrás de HTTP plano usar FLASK_CONFIG=default.
+os.environ.setdefault('FLASK_CONFIG', 'production')
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('GUNICORN_WORKERS') or 4)
+
+# El maestro aplica las migraciones una sola vez en when_ready, antes de crear
+# los workers; los workers (y la app precargada) no migran para no competir
+# por el esquema. Debe fijarse antes de importar config.
+migrar_en_maestro = os.environ.get('MIGRAR_AL_INICIAR', 'true').lower() in ['true', 'on', '1']
+os.environ['MIGRAR_AL_INICIAR'] = 'false'
+
+# Precarga en el maestro (opcional)
+preload_app = os.environ.get('PRECARGAR_CATALOGO', 'false').lower() in ['true', 'on', '1']
+
+def when_ready(server):
+    """Maestro listo: migrar el esquema y precargar el catálogo antes del fork"""
+    if migrar_en_maestro:
+        from fabrica import crear_app_base
+        from migraciones import actualizar_esquema
+        from models import db
+
+        app = crear_app_base()
+        with app.app_context():
+            aplicadas = actualizar_esquema()
+            db.engine.dispose()  # Los workers abren sus propias conexiones
+        server.log.info("🛠️  Esquema al día (%s migraciones aplicadas)", len(aplicadas))
+
+    if not preload_app:
+        return
+
+    from catalogo import catalogo_ejercicios
+
+    total = catalogo_ejercicios.precargar()
+    gc.collect()
+    gc.freeze()
+    server.log.info("📚 Catálogo precargado en el maestro: %s ejercicios (%s objetos congelados)",
+                    total, gc.get_freeze_count())
+
+def post_fork(server, worker):
+    """Worker nuevo: no reutilizar conexiones de base de datos del maestro"""
+    if not preload_app:
+        return
+
+    from app import app
+    from models import db
+
+    with app.app_context():
+        db.engine.dispose(close=False)
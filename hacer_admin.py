@@ -17,8 +17,10 @@ from datetime import datetime
 # Agregar el directorio actual al path para importar los módulos
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+from fabrica import crear_app_base
 from models import db, Usuario
-from app import app
+
+app = crear_app_base()
 
 def hacer_admin_google(email):
     """
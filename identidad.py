@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Identidad de Usuario - Plataforma Preuniversitaria
+=================================================
+
+Carga liviana del usuario de la sesión para Flask-Login.
+
+En lugar de leer la fila completa de ``usuarios`` en cada solicitud, se
+guarda por proceso (worker) una identidad reducida (ID, permisos, ventana
+premium y contadores de la cuota diaria) con un TTL corto. La identidad se
+comporta como el modelo: cualquier atributo o método que no esté en caché
+carga el ``Usuario`` completo de forma perezosa, y las asignaciones se
+aplican sobre el modelo.
+
+Las entradas se invalidan al confirmar cambios sobre un usuario (perfil,
+premium, administración), así que el TTL solo acota cuánto tarda en verse
+un cambio hecho por otro worker.
+
+Autor: Plataforma Preuniversitaria
+Fecha: 2025
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask_login import UserMixin
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, undefer_group
+
+from models import db, Usuario
+
+# Columnas que se guardan en caché (sin los campos de texto grandes)
+CAMPOS_IDENTIDAD = (
+    'id', 'username', 'email', 'nombre_completo', 'es_activo', 'es_admin',
+    'auth_provider', 'google_picture', 'profile_completed', 'materias_favoritas',
+    'es_premium', 'tipo_premium', 'fecha_premium_fin',
+    'ejercicios_vistos_hoy', 'ultima_fecha_conteo',
+    'simulacros_realizados_hoy', 'ultima_fecha_simulacro',
+)
+
+class IdentidadUsuario(UserMixin):
+    """
+    Vista reducida de un ``Usuario`` para ``current_user``.
+
+    Los campos de ``CAMPOS_IDENTIDAD`` se leen de la caché; el resto (y los
+    métodos del modelo) se delegan al ``Usuario`` completo, que se carga solo
+    si hace falta.
+    """
+
+    def __init__(self, datos):
+        object.__setattr__(self, '_datos', datos)
+        object.__setattr__(self, '_modelo', None)
+
+    @property
+    def modelo(self):
+        """Instancia completa de ``Usuario`` en la sesión actual (carga perezosa)"""
+        if self._modelo is None:
+            # Si se llega al modelo completo, se trae en una sola consulta
+            modelo = db.session.get(Usuario, self._datos['id'], options=[undefer_group('textos')])
+            object.__setattr__(self, '_modelo', modelo)
+        return self._modelo
+
+    def __getattr__(self, nombre):
+        datos = object.__getattribute__(self, '_datos')
+        if nombre in datos:
+            return datos[nombre]
+        return getattr(self.modelo, nombre)
+
+    def __setattr__(self, nombre, valor):
+        setattr(self.modelo, nombre, valor)
+        if nombre in self._datos:
+            self._datos[nombre] = valor
+
+    def is_premium_active(self):
+        """Verifica si el usuario tiene premium activo (sin consultar la base de datos)"""
+        if not self.es_premium:
+            return False
+        if self.tipo_premium == 'permanente':
+            return True
+        if self.fecha_premium_fin and datetime.utcnow() > self.fecha_premium_fin:
+            return False
+        return True
+
+    def __repr__(self):
+        return f'<IdentidadUsuario {self._datos.get("username")}>'
+
+class CacheIdentidades:
+    """Caché LRU con TTL de identidades de usuario, por proceso"""
+
+    def __init__(self, ttl=30, capacidad=2048):
+        self.ttl = ttl
+        self.capacidad = capacidad
+        self.aciertos = 0
+        self.fallos = 0
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Lee la configuración de la caché desde la aplicación"""
+        self.ttl = app.config.get('IDENTIDAD_TTL', self.ttl)
+        self.capacidad = app.config.get('IDENTIDAD_CAPACIDAD', self.capacidad)
+        app.extensions['cache_identidades'] = self
+
+    def _obtener(self, usuario_id):
+        """Datos en caché vigentes o None"""
+        with self._lock:
+            entrada = self._entradas.get(usuario_id)
+            if entrada is None:
+                return None
+            expira, datos = entrada
+            if expira < time.monotonic():
+                del self._entradas[usuario_id]
+                return None
+            self._entradas.move_to_end(usuario_id)
+            return datos
+
+    def _guardar(self, usuario_id, datos):
+        with self._lock:
+            self._entradas[usuario_id] = (time.monotonic() + self.ttl, datos)
+            self._entradas.move_to_end(usuario_id)
+            while len(self._entradas) > self.capacidad:
+                self._entradas.popitem(last=False)
+
+    def cargar(self, usuario_id):
+        """Devuelve la identidad del usuario (o None si no existe)"""
+        try:
+            usuario_id = int(usuario_id)
+        except (TypeError, ValueError):
+            return None
+
+        datos = self._obtener(usuario_id)
+        if datos is None:
+            self.fallos += 1
+            columnas = [getattr(Usuario, campo) for campo in CAMPOS_IDENTIDAD]
+            fila = db.session.execute(select(*columnas).where(Usuario.id == usuario_id)).first()
+            if fila is None:
+                return None
+            datos = dict(fila._mapping)
+            self._guardar(usuario_id, datos)
+        else:
+            self.aciertos += 1
+
+        # Copia por solicitud: las asignaciones no alteran la caché compartida
+        return IdentidadUsuario(dict(datos))
+
+    def invalidar(self, *usuario_ids):
+        """Elimina de la caché los usuarios indicados"""
+        with self._lock:
+            for usuario_id in usuario_ids:
+                self._entradas.pop(usuario_id, None)
+
+    def limpiar(self):
+        """Vacía la caché (tras actualizaciones masivas)"""
+        with self._lock:
+            self._entradas.clear()
+
+    def estadisticas(self):
+        """Contadores de la caché para monitoreo"""
+        return {
+            'entradas': len(self._entradas),
+            'aciertos': self.aciertos,
+            'fallos': self.fallos
+        }
+
+# Caché compartida por todas las solicitudes del proceso
+cache_identidades = CacheIdentidades()
+
+# Invalidación automática: se anotan los usuarios modificados en cada flush y
+# se eliminan de la caché cuando la transacción se confirma.
+_TODOS = object()
+
+@event.listens_for(Session, 'after_flush')
+def _anotar_usuarios_modificados(session, flush_context):
+    modificados = [obj.id for obj in (*session.new, *session.dirty, *session.deleted)
+                   if isinstance(obj, Usuario) and obj.id is not None]
+    if modificados:
+        session.info.setdefault('usuarios_modificados', set()).update(modificados)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _anotar_actualizacion_masiva(orm_execute_state):
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    mapper = orm_execute_state.bind_mapper
+    tabla = getattr(orm_execute_state.statement, 'table', None)
+    if (mapper is not None and mapper.class_ is Usuario) or tabla is Usuario.__table__:
+        orm_execute_state.session.info.setdefault('usuarios_modificados', set()).add(_TODOS)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_usuarios_modificados(session):
+    modificados = session.info.pop('usuarios_modificados', None)
+    if not modificados:
+        return
+    if _TODOS in modificados:
+        cache_identidades.limpiar()
+    else:
+        cache_identidades.invalidar(*modificados)
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_usuarios_modificados(session):
+    session.info.pop('usuarios_modificados', None)
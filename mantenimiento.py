@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script de Mantenimiento - Plataforma Preuniversitaria
+====================================================
+
+Tareas periódicas de base de datos (pensadas para cron).
+
+Autor: Plataforma Preuniversitaria
+Fecha: 2025
+"""
+
+import os
+import sys
+
+# Agregar el directorio actual al path para importar los módulos
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from fabrica import crear_app_base
+from models import db, Usuario
+from visitas import resumir_visitas, compactar_visitas
+from migraciones import actualizar_esquema, verificar_planes, version_actual
+
+# Aplicación mínima: solo configuración y base de datos
+app = crear_app_base()
+
+def tarea_resumir_visitas():
+    """Agrega las visitas crudas pendientes a los resúmenes por hora y día"""
+    with app.app_context():
+        resumidas = resumir_visitas()
+        print(f"✅ Visitas resumidas: {resumidas}")
+        return resumidas
+
+def tarea_compactar_visitas(dias=90):
+    """Elimina las visitas crudas antiguas que ya están resumidas"""
+    with app.app_context():
+        resumidas, eliminadas = compactar_visitas(dias)
+        print(f"✅ Visitas resumidas: {resumidas}")
+        print(f"🗑️  Visitas crudas con más de {dias} días eliminadas: {eliminadas}")
+        return eliminadas
+
+def tarea_expirar_premium():
+    """Marca como no premium a los usuarios cuyo premium ya venció"""
+    with app.app_context():
+        expirados = Usuario.expirar_premium_vencidos()
+        print(f"✅ Premium vencidos desactivados: {expirados}")
+        return expirados
+
+def tarea_diaria():
+    """
+    Mantenimiento de medianoche en una sola transacción: expira los premium
+    vencidos y reinicia los límites diarios de ejercicios y simulacros.
+    """
+    with app.app_context():
+        try:
+            expirados = Usuario.expirar_premium_vencidos(commit=False)
+            cuotas, simulacros = Usuario.reiniciar_limites_diarios(commit=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error en el mantenimiento diario: {e}")
+            return None
+
+        print("✅ Mantenimiento diario completado")
+        print(f"   Premium vencidos desactivados: {expirados}")
+        print(f"   Límites de ejercicios reiniciados: {cuotas}")
+        print(f"   Límites de simulacros reiniciados: {simulacros}")
+        return {
+            'premium_expirados': expirados,
+            'cuotas_reiniciadas': cuotas,
+            'simulacros_reiniciados': simulacros
+        }
+
+def tarea_migrar():
+    """Crea las tablas faltantes y aplica las migraciones pendientes"""
+    with app.app_context():
+        aplicadas = actualizar_esquema()
+        print(f"✅ Esquema en la versión {version_actual()} ({len(aplicadas)} migraciones aplicadas)")
+        return aplicadas
+
+def tarea_verificar_indices():
+    """Verifica que las consultas frecuentes usen índices (sale con error si no)"""
+    with app.app_context():
+        resultados = verificar_planes()
+
+    if not resultados:
+        print("ℹ️  La verificación de planes solo está disponible con SQLite")
+        return True
+
+    correcto = True
+    for nombre, (usa_indice, detalle) in resultados.items():
+        print(f"{'✅' if usa_indice else '❌'} {nombre}: {detalle}")
+        correcto = correcto and usa_indice
+
+    if not correcto:
+        print("❌ Hay consultas frecuentes que recorren tablas completas")
+        sys.exit(1)
+    return True
+
+def main():
+    """Función principal del script"""
+    if len(sys.argv) < 2:
+        print("🔧 Script de Mantenimiento - Plataforma Preuniversitaria")
+        print("=" * 60)
+        print("Uso:")
+        print("  python mantenimiento.py resumir_visitas")
+        print("  python mantenimiento.py compactar_visitas [dias]")
+        print("  python mantenimiento.py expirar_premium")
+        print("  python mantenimiento.py diario")
+        print("  python mantenimiento.py migrar")
+        print("  python mantenimiento.py verificar_indices")
+        print("\nEjemplos:")
+        print("  python mantenimiento.py resumir_visitas")
+        print("  python mantenimiento.py compactar_visitas 90")
+        print("  python mantenimiento.py expirar_premium")
+        print("  python mantenimiento.py diario   # cron: 0 0 * * *")
+        return
+
+    comando = sys.argv[1].lower()
+
+    if comando == "resumir_visitas":
+        tarea_resumir_visitas()
+
+    elif comando == "compactar_visitas":
+        dias = int(sys.argv[2]) if len(sys.argv) > 2 else 90
+        tarea_compactar_visitas(dias)
+
+    elif comando == "expirar_premium":
+        tarea_expirar_premium()
+
+    elif comando == "diario":
+        tarea_diaria()
+
+    elif comando == "migrar":
+        tarea_migrar()
+
+    elif comando == "verificar_indices":
+        tarea_verificar_indices()
+
+    else:
+        print(f"❌ Comando '{comando}' no reconocido")
+        print("Usa 'python mantenimiento.py' para ver la ayuda")
+
+if __name__ == "__main__":
+    main()
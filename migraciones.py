@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Migraciones de Esquema - Plataforma Preuniversitaria
+===================================================
+
+Migraciones versionadas para bases de datos ya existentes.
+
+``db.create_all()`` crea las tablas nuevas con sus índices, pero no agrega
+índices a tablas que ya existen. Cada migración se aplica una sola vez y
+la versión aplicada se guarda en la tabla ``version_esquema``.
+
+También incluye una verificación de planes de consulta (SQLite): las
+sentencias frecuentes, construidas con las mismas funciones que usa la
+aplicación, deben resolverse con un índice y no recorriendo la tabla
+completa.
+
+Autor: Plataforma Preuniversitaria
+Fecha: 2025
+"""
+
+from datetime import date, datetime
+
+from sqlalchemy import Column, Index, MetaData, Table, inspect, text
+from sqlalchemy.exc import OperationalError
+
+from models import db, Usuario, SesionUsuario
+
+# Índices de la migración 1 tal como se definieron entonces (nombre, tabla,
+# columnas). Están copiados aquí a propósito: si los modelos cambian, la
+# versión 1 sigue significando lo mismo; un índice nuevo va en otra migración.
+INDICES_V1 = (
+    ('ix_usuarios_premium_fin', 'usuarios', ('es_premium', 'fecha_premium_fin')),
+    ('ix_usuarios_ultima_fecha_conteo', 'usuarios', ('ultima_fecha_conteo',)),
+    ('ix_usuarios_ultima_fecha_simulacro', 'usuarios', ('ultima_fecha_simulacro',)),
+    ('ix_usuarios_fecha_registro', 'usuarios', ('fecha_registro',)),
+    ('ix_sesiones_usuario_usuario_fin', 'sesiones_usuario', ('usuario_id', 'fecha_fin', 'fecha_inicio')),
+    ('ix_ejercicios_vistos_usuario_fecha', 'ejercicios_vistos', ('usuario_id', 'fecha_visto')),
+    ('ix_visitas_pagina_fecha', 'visitas_pagina', ('fecha',)),
+    ('ix_visitas_pagina_usuario', 'visitas_pagina', ('usuario_id',)),
+)
+
+def _crear_indices(conexion, indices):
+    """Crea los índices (nombre, tabla, columnas) que aún no existan"""
+    for nombre, tabla, columnas in indices:
+        # Tabla mínima solo con las columnas del índice: no depende de los modelos actuales
+        definicion = Table(tabla, MetaData(), *(Column(columna) for columna in columnas))
+        Index(nombre, *(definicion.c[columna] for columna in columnas)).create(bind=conexion, checkfirst=True)
+
+def _migracion_indices_consultas(conexion):
+    _crear_indices(conexion, INDICES_V1)
+
+INDICES_V2 = (
+    ('ix_visitas_pagina_resumida', 'visitas_pagina', ('resumida', 'id')),
+)
+
+def _migracion_visitas_resumidas(conexion):
+    """
+    Agrega la columna ``visitas_pagina.resumida``. Las visitas existentes
+    quedan sin resumir (DEFAULT FALSE) y ``resumir_visitas`` las suma.
+    """
+    inspector = inspect(conexion)
+    if 'visitas_pagina' not in inspector.get_table_names():
+        return
+    if 'resumida' not in {columna['name'] for columna in inspector.get_columns('visitas_pagina')}:
+        conexion.execute(text(
+            "ALTER TABLE visitas_pagina ADD COLUMN resumida BOOLEAN NOT NULL DEFAULT FALSE"
+        ))
+    _crear_indices(conexion, INDICES_V2)
+
+def _migracion_totales_por_dia(conexion):
+    """Llena ``visitas_total_dia`` con los totales de ``visitas_por_dia`` ya resumidos"""
+    tablas = inspect(conexion).get_table_names()
+    if 'visitas_total_dia' not in tablas or 'visitas_por_dia' not in tablas:
+        return
+    conexion.execute(text("DELETE FROM visitas_total_dia"))
+    conexion.execute(text(
+        "INSERT INTO visitas_total_dia (fecha, visitas) "
+        "SELECT fecha, SUM(visitas) FROM visitas_por_dia GROUP BY fecha"
+    ))
+
+# (versión, descripción, función) en orden de aplicación
+MIGRACIONES = (
+    (1, 'Índices para consultas frecuentes', _migracion_indices_consultas),
+    (2, 'Marca de visitas resumidas por fila', _migracion_visitas_resumidas),
+    (3, 'Totales de visitas por día', _migracion_totales_por_dia),
+)
+
+def _asegurar_tabla_version(conexion):
+    conexion.execute(text(
+        "CREATE TABLE IF NOT EXISTS version_esquema (version INTEGER NOT NULL)"
+    ))
+    if conexion.execute(text("SELECT COUNT(*) FROM version_esquema")).scalar() == 0:
+        conexion.execute(text("INSERT INTO version_esquema (version) VALUES (0)"))
+
+def version_actual():
+    """Versión de esquema aplicada (0 si nunca se migró). Requiere app_context."""
+    with db.engine.begin() as conexion:
+        _asegurar_tabla_version(conexion)
+        return conexion.execute(text("SELECT MAX(version) FROM version_esquema")).scalar()
+
+def aplicar_migraciones():
+    """
+    Aplica las migraciones pendientes, cada una en su propia transacción.
+
+    Devuelve la lista de versiones aplicadas. Requiere app_context.
+    """
+    aplicadas = []
+    actual = version_actual()
+    for version, descripcion, migracion in MIGRACIONES:
+        if version <= actual:
+            continue
+        with db.engine.begin() as conexion:
+            migracion(conexion)
+            conexion.execute(text("UPDATE version_esquema SET version = :version"), {'version': version})
+        print(f"🛠️  Migración {version} aplicada: {descripcion}")
+        aplicadas.append(version)
+    return aplicadas
+
+def actualizar_esquema():
+    """
+    Crea las tablas que falten y aplica las migraciones pendientes.
+
+    Es idempotente: con el esquema al día solo consulta ``version_esquema``
+    y el catálogo de tablas. Devuelve las versiones aplicadas. Requiere
+    app_context.
+    """
+    db.create_all()
+    return aplicar_migraciones()
+
+def consultas_frecuentes():
+    """
+    Sentencias frecuentes de la aplicación, con valores de ejemplo.
+
+    Se construyen con las mismas funciones que usa la aplicación, así que
+    si una consulta cambia y deja de usar su índice la verificación lo ve.
+    """
+    from gestion_usuarios import (MODELOS_DEPENDIENTES, consulta_ingresos,
+                                  consulta_listado_usuarios, sentencia_borrar_dependientes)
+    from visitas import (consulta_total_visitas, consulta_visitas_compactables,
+                         consulta_visitas_pendientes, consulta_visitas_pendientes_usuarios)
+
+    ahora = datetime(2025, 1, 1)
+    hoy = ahora.date()
+    ids = [1, 2, 3]
+    reinicio_cuotas, reinicio_simulacros = Usuario.sentencias_reiniciar_limites(hoy)
+
+    consultas = {
+        'premium_vencidos': Usuario.sentencia_expirar_premium(ahora),
+        'reinicio_cuotas': reinicio_cuotas,
+        'reinicio_simulacros': reinicio_simulacros,
+        'sesion_abierta': SesionUsuario.consulta_sesion_abierta(1),
+        # Primera página del listado de administración con el orden por defecto
+        'listado_usuarios': consulta_listado_usuarios().limit(50),
+        'ingresos_usuarios': consulta_ingresos(ids),
+        'visitas_pendientes': consulta_visitas_pendientes(5000),
+        'visitas_pendientes_usuarios': consulta_visitas_pendientes_usuarios(ids),
+        'compactar_visitas': consulta_visitas_compactables(ahora, 5000),
+        'visitas_por_fecha': consulta_total_visitas(hoy),
+    }
+    for modelo in MODELOS_DEPENDIENTES:
+        consultas[f'borrar_{modelo.__tablename__}'] = sentencia_borrar_dependientes(modelo, ids)
+    return consultas
+
+def _parametro(valor):
+    """Valor de un parámetro tal como lo guarda SQLite (fechas en texto ISO)"""
+    if isinstance(valor, datetime):
+        return valor.isoformat(' ')
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return valor
+
+def plan_de_consulta(conexion, sentencia):
+    """Pasos de EXPLAIN QUERY PLAN de una sentencia de SQLAlchemy (SQLite)"""
+    compilada = sentencia.compile(dialect=conexion.dialect, compile_kwargs={'render_postcompile': True})
+    parametros = tuple(_parametro(compilada.params[nombre]) for nombre in compilada.positiontup)
+    return [fila[-1] for fila in conexion.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compilada), parametros)]
+
+def verificar_planes():
+    """
+    Ejecuta EXPLAIN QUERY PLAN sobre las sentencias de ``consultas_frecuentes``.
+
+    Devuelve {nombre: (usa_indice, detalle)}. Una consulta falla si algún
+    paso recorre una tabla completa (``SCAN tabla`` sin índice) o si ordena
+    el resultado completo en una tabla temporal. Solo aplica a SQLite; con
+    otros motores devuelve un dict vacío. Requiere app_context.
+    """
+    resultados = {}
+    if db.engine.dialect.name != 'sqlite':
+        return resultados
+
+    with db.engine.connect() as conexion:
+        for nombre, sentencia in consultas_frecuentes().items():
+            try:
+                pasos = plan_de_consulta(conexion, sentencia)
+            except OperationalError as e:
+                # Tabla o columna inexistente: esquema sin migrar
+                resultados[nombre] = (False, f"error: {e.orig}")
+                continue
+            detalle = ' | '.join(pasos)
+            escaneo_completo = any(paso.startswith('SCAN') and 'USING' not in paso for paso in pasos)
+            orden_temporal = any(paso.startswith('USE TEMP B-TREE FOR ORDER BY') for paso in pasos)
+            resultados[nombre] = (not (escaneo_completo or orden_temporal), detalle)
+    return resultados
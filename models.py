@@ -12,6 +12,7 @@ Fecha: 2025
 
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import event
 from datetime import datetime
 
 db = SQLAlchemy()
@@ -41,12 +42,12 @@ class Usuario(UserMixin, db.Model):
     ultima_unidad_educativa = db.Column(db.String(100), nullable=True)  # Última institución educativa
     nivel_academico_actual = db.Column(db.String(50), nullable=True)  # Nivel académico actual
     nivel_academico_otro = db.Column(db.String(100), nullable=True) # Especificación para 'otro' nivel
-    intereses = db.Column(db.Text, nullable=True)  # Intereses académicos/profesionales
+    intereses = db.deferred(db.Column(db.Text, nullable=True), group='textos')  # Intereses académicos/profesionales
     whatsapp = db.Column(db.String(20), nullable=True)  # Opcional - para ofertas y anuncios
     ciudad = db.Column(db.String(50), nullable=True)  # Ciudad
     carrera_interes = db.Column(db.String(100), nullable=True)  # Carrera de interés
     materias_favoritas = db.Column(db.Text, nullable=True)  # JSON como string
-    preferencias = db.Column(db.Text, nullable=True)  # JSON como string
+    preferencias = db.deferred(db.Column(db.Text, nullable=True), group='textos')  # JSON como string
     acepta_anuncios = db.Column(db.Boolean, default=False)  # Si acepta recibir anuncios
     profile_completed = db.Column(db.Boolean, default=False) # Si el perfil ha sido completado
     
@@ -60,12 +61,22 @@ class Usuario(UserMixin, db.Model):
     # Campos para sistema de límites diarios
     ejercicios_vistos_hoy = db.Column(db.Integer, default=0)  # Contador de ejercicios vistos hoy
     ultima_fecha_conteo = db.Column(db.Date, nullable=True)  # Última fecha en que se contaron ejercicios
-    ejercicios_vistos_ids = db.Column(db.Text, nullable=True)  # IDs de ejercicios vistos hoy (JSON)
+    ejercicios_vistos_ids = db.deferred(db.Column(db.Text, nullable=True), group='textos')  # IDs de ejercicios vistos hoy (JSON)
     
     # Campos para sistema de límites de simulacros
     simulacros_realizados_hoy = db.Column(db.Integer, default=0)  # Contador de simulacros realizados hoy
     ultima_fecha_simulacro = db.Column(db.Date, nullable=True)  # Última fecha en que se realizó un simulacro
     
+    __table_args__ = (
+        # Expiración de premium: es_premium = 1 AND fecha_premium_fin < ahora
+        db.Index('ix_usuarios_premium_fin', 'es_premium', 'fecha_premium_fin'),
+        # Reinicio diario de límites: ultima_fecha_* < hoy
+        db.Index('ix_usuarios_ultima_fecha_conteo', 'ultima_fecha_conteo'),
+        db.Index('ix_usuarios_ultima_fecha_simulacro', 'ultima_fecha_simulacro'),
+        # Orden por defecto del listado de administración
+        db.Index('ix_usuarios_fecha_registro', 'fecha_registro'),
+    )
+    
     def __init__(self, username, email, password=None, nombre_completo=None, google_id=None, google_picture=None):
         self.username = username
         self.email = email
@@ -145,7 +156,12 @@ class Usuario(UserMixin, db.Model):
         return self.auth_provider == 'google'
     
     def is_premium_active(self):
-        """Verifica si el usuario tiene premium activo"""
+        """
+        Verifica si el usuario tiene premium activo.
+        
+        Solo lectura: un premium vencido se considera inactivo aquí y se
+        marca en la base de datos con ``Usuario.expirar_premium_vencidos``.
+        """
         if not self.es_premium:
             return False
         
@@ -155,12 +171,97 @@ class Usuario(UserMixin, db.Model):
         
         # Si tiene fecha de fin y ya expiró
         if self.fecha_premium_fin and datetime.utcnow() > self.fecha_premium_fin:
-            self.es_premium = False
-            db.session.commit()
             return False
         
         return True
     
+    @classmethod
+    def resumen_estadisticas(cls):
+        """
+        Totales de usuarios para el panel de administración en una sola
+        consulta agregada (sin cargar filas).
+        """
+        ahora = datetime.utcnow()
+        premium_activo = db.and_(
+            cls.es_premium.is_(True),
+            db.or_(cls.tipo_premium == 'permanente',
+                   cls.fecha_premium_fin.is_(None),
+                   cls.fecha_premium_fin >= ahora)
+        )
+        
+        def contar(condicion):
+            return db.func.coalesce(db.func.sum(db.case((condicion, 1), else_=0)), 0)
+        
+        fila = db.session.query(
+            db.func.count(cls.id),
+            contar(cls.es_activo.is_(True)),
+            contar(premium_activo),
+            contar(cls.es_admin.is_(True)),
+            contar(cls.auth_provider == 'google')
+        ).one()
+        
+        return dict(zip(('total', 'activos', 'premium', 'admin', 'google'), fila))
+    
+    @classmethod
+    def sentencia_expirar_premium(cls, ahora):
+        """UPDATE que desactiva los premium vencidos a la fecha ``ahora``"""
+        return (db.update(cls)
+                .where(cls.es_premium.is_(True),
+                       db.or_(cls.tipo_premium.is_(None), cls.tipo_premium != 'permanente'),
+                       cls.fecha_premium_fin.isnot(None),
+                       cls.fecha_premium_fin < ahora)
+                .values({cls.es_premium: False})
+                .execution_options(synchronize_session=False))
+    
+    @classmethod
+    def expirar_premium_vencidos(cls, ahora=None, commit=True):
+        """
+        Desactiva en un único UPDATE los premium con fecha de fin vencida.
+        
+        Devuelve la cantidad de usuarios actualizados.
+        """
+        ahora = ahora or datetime.utcnow()
+        actualizados = db.session.execute(cls.sentencia_expirar_premium(ahora)).rowcount
+        if commit:
+            db.session.commit()
+        return actualizados
+    
+    @classmethod
+    def sentencias_reiniciar_limites(cls, hoy):
+        """UPDATEs (cuotas, simulacros) que reinician los contadores anteriores a ``hoy``"""
+        cuotas = (db.update(cls)
+                  .where(cls.ultima_fecha_conteo.isnot(None), cls.ultima_fecha_conteo < hoy)
+                  .values({cls.ejercicios_vistos_hoy: 0,
+                           cls.ejercicios_vistos_ids: '[]',
+                           cls.ultima_fecha_conteo: hoy})
+                  .execution_options(synchronize_session=False))
+        simulacros = (db.update(cls)
+                      .where(cls.ultima_fecha_simulacro.isnot(None), cls.ultima_fecha_simulacro < hoy)
+                      .values({cls.simulacros_realizados_hoy: 0,
+                               cls.ultima_fecha_simulacro: hoy})
+                      .execution_options(synchronize_session=False))
+        return cuotas, simulacros
+    
+    @classmethod
+    def reiniciar_limites_diarios(cls, hoy=None, commit=True):
+        """
+        Reinicia en bloque los contadores diarios que quedaron de días anteriores.
+        
+        El filtro por fecha hace que sea seguro ejecutarlo con tráfico: las
+        filas que ya se actualizaron hoy no se tocan. Devuelve
+        (cuotas_reiniciadas, simulacros_reiniciados).
+        """
+        from datetime import date
+        hoy = hoy or date.today()
+        
+        sentencia_cuotas, sentencia_simulacros = cls.sentencias_reiniciar_limites(hoy)
+        cuotas = db.session.execute(sentencia_cuotas).rowcount
+        simulacros = db.session.execute(sentencia_simulacros).rowcount
+        
+        if commit:
+            db.session.commit()
+        return cuotas, simulacros
+    
     def grant_premium(self, tipo='mensual', duracion_dias=30, razon='Otorgado por administrador'):
         """Otorga premium al usuario"""
         from datetime import timedelta
@@ -187,7 +288,7 @@ class Usuario(UserMixin, db.Model):
         db.session.commit()
     
     def reset_daily_count(self):
-        """Reinicia el contador diario de ejercicios"""
+        """Reinicia el contador diario de ejercicios (en memoria, sin commit)"""
         from datetime import date
         today = date.today()
         
@@ -195,99 +296,38 @@ class Usuario(UserMixin, db.Model):
             self.ejercicios_vistos_hoy = 0
             self.ultima_fecha_conteo = today
             self.ejercicios_vistos_ids = '[]'
-            db.session.commit()
     
     def can_view_exercise(self, ejercicio_id):
         """Verifica si el usuario puede ver un ejercicio específico"""
-        import json
-        
-        # Si es premium, puede ver todo
-        if self.is_premium_active():
-            return True
-        
-        # Reiniciar contador si es un nuevo día
-        self.reset_daily_count()
-        
-        # Obtener límite según tipo de usuario
-        limite_diario = 15 if self.is_authenticated else 5
-        
-        # Verificar si ya vio este ejercicio hoy
-        ejercicios_vistos = []
-        if self.ejercicios_vistos_ids:
-            try:
-                ejercicios_vistos = json.loads(self.ejercicios_vistos_ids)
-            except:
-                ejercicios_vistos = []
-        
-        # Si ya vio este ejercicio, puede verlo
-        if ejercicio_id in ejercicios_vistos:
-            return True
-        
-        # Verificar si no ha alcanzado el límite
-        return self.ejercicios_vistos_hoy < limite_diario
+        from cuotas import CuotaDiaria
+        return CuotaDiaria(self).puede_ver(ejercicio_id)
     
     def mark_exercise_as_viewed(self, ejercicio_id):
         """Marca un ejercicio como visto"""
-        import json
-        
-        # Si es premium, no necesita contar
-        if self.is_premium_active():
-            return True
-        
-        # Reiniciar contador si es un nuevo día
-        self.reset_daily_count()
-        
-        # Obtener límite según tipo de usuario
-        limite_diario = 15 if self.is_authenticated else 5
-        
-        # Verificar si ya vio este ejercicio hoy
-        ejercicios_vistos = []
-        if self.ejercicios_vistos_ids:
-            try:
-                ejercicios_vistos = json.loads(self.ejercicios_vistos_ids)
-            except:
-                ejercicios_vistos = []
-        
-        # Si ya vio este ejercicio, no contar de nuevo
-        if ejercicio_id in ejercicios_vistos:
-            return True
-        
-        # Verificar si no ha alcanzado el límite
-        if self.ejercicios_vistos_hoy >= limite_diario:
-            return False
-        
-        # Marcar como visto
-        ejercicios_vistos.append(ejercicio_id)
-        self.ejercicios_vistos_hoy += 1
-        self.ejercicios_vistos_ids = json.dumps(ejercicios_vistos)
-        db.session.commit()
-        
-        return True
+        from cuotas import CuotaDiaria
+        cuota = CuotaDiaria(self)
+        resultado = cuota.marcar_visto(ejercicio_id)
+        cuota.guardar()
+        return resultado
     
     def get_daily_limit_info(self):
         """Obtiene información sobre los límites diarios"""
-        self.reset_daily_count()
-        
-        limite_diario = 15 if self.is_authenticated else 5
-        ejercicios_restantes = max(0, limite_diario - self.ejercicios_vistos_hoy)
-        
-        return {
-            'limite_diario': limite_diario,
-            'ejercicios_vistos': self.ejercicios_vistos_hoy,
-            'ejercicios_restantes': ejercicios_restantes,
-            'es_premium': self.is_premium_active(),
-            'tipo_usuario': 'registrado' if self.is_authenticated else 'sin_registro'
-        }
+        from cuotas import CuotaDiaria
+        return CuotaDiaria(self).info()
     
     def reset_simulacro_count(self):
-        """Reinicia el contador de simulacros si es un nuevo día"""
+        """
+        Reinicia el contador de simulacros si es un nuevo día (en memoria).
+        
+        Se persiste junto con el próximo cambio del usuario o con
+        ``Usuario.reiniciar_limites_diarios``.
+        """
         from datetime import date
         hoy = date.today()
         
         if self.ultima_fecha_simulacro != hoy:
             self.simulacros_realizados_hoy = 0
             self.ultima_fecha_simulacro = hoy
-            db.session.commit()
     
     def can_do_simulacro(self):
         """Verifica si el usuario puede realizar un simulacro hoy"""
@@ -390,8 +430,24 @@ class SesionUsuario(db.Model):
     ip_address = db.Column(db.String(45), nullable=True)  # IPv6 compatible
     user_agent = db.Column(db.Text, nullable=True)
     
-    # Relación con el usuario
-    usuario = db.relationship('Usuario', backref=db.backref('sesiones', lazy=True))
+    # Relación con el usuario. El borrado en cascada lo hace el ORM (y
+    # gestion_usuarios.eliminar_usuarios con DELETEs explícitos): SQLite no
+    # aplica las claves foráneas sin PRAGMA foreign_keys
+    usuario = db.relationship('Usuario', backref=db.backref(
+        'sesiones', lazy=True, cascade='all, delete-orphan'))
+    
+    __table_args__ = (
+        # Última sesión abierta de un usuario (logout): usuario_id, fecha_fin IS NULL, ORDER BY fecha_inicio
+        db.Index('ix_sesiones_usuario_usuario_fin', 'usuario_id', 'fecha_fin', 'fecha_inicio'),
+    )
+    
+    @classmethod
+    def consulta_sesion_abierta(cls, usuario_id):
+        """SELECT de la última sesión sin cerrar de un usuario (logout)"""
+        return (db.select(cls)
+                .where(cls.usuario_id == usuario_id, cls.fecha_fin.is_(None))
+                .order_by(cls.fecha_inicio.desc())
+                .limit(1))
     
     def __repr__(self):
         return f'<SesionUsuario {self.usuario_id} - {self.fecha_inicio}>'
@@ -411,7 +467,13 @@ class EjercicioVisto(db.Model):
     session_id = db.Column(db.String(100), nullable=True)  # Para usuarios sin registro
     
     # Relación con el usuario (opcional)
-    usuario = db.relationship('Usuario', backref=db.backref('ejercicios_vistos', lazy=True))
+    usuario = db.relationship('Usuario', backref=db.backref(
+        'ejercicios_vistos', lazy=True, cascade='all, delete-orphan'))
+    
+    __table_args__ = (
+        # Historial de un usuario por fecha
+        db.Index('ix_ejercicios_vistos_usuario_fecha', 'usuario_id', 'fecha_visto'),
+    )
     
     def __repr__(self):
         return f'<EjercicioVisto {self.ejercicio_id} - {self.fecha_visto}>'
@@ -426,13 +488,127 @@ class VisitaPagina(db.Model):
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuarios.id'), nullable=True)
     ip_address = db.Column(db.String(45), nullable=True)
     user_agent = db.Column(db.Text, nullable=True)
+    # Ya sumada a VisitaHora/VisitaDia/VisitaTotalDia (ver visitas.resumir_visitas)
+    resumida = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
 
     # Relación opcional con usuario
-    usuario = db.relationship('Usuario', backref=db.backref('visitas', lazy=True))
+    usuario = db.relationship('Usuario', backref=db.backref(
+        'visitas', lazy=True, cascade='all, delete-orphan'))
+
+    __table_args__ = (
+        # Métricas por rango de fechas y compactación de visitas antiguas
+        db.Index('ix_visitas_pagina_fecha', 'fecha'),
+        # Borrado de las visitas de un usuario
+        db.Index('ix_visitas_pagina_usuario', 'usuario_id'),
+        # Visitas pendientes de resumir, en orden de ID
+        db.Index('ix_visitas_pagina_resumida', 'resumida', 'id'),
+    )
 
     def __repr__(self):
         return f'<Visita {self.path} - {self.fecha}>'
 
+class VisitaHora(db.Model):
+    """Visitas agregadas por hora, ruta y tipo de visitante (se mantiene al registrar visitas)."""
+    __tablename__ = 'visitas_por_hora'
+
+    id = db.Column(db.Integer, primary_key=True)
+    hora = db.Column(db.DateTime, nullable=False)  # Fecha UTC truncada a la hora
+    path = db.Column(db.String(512), nullable=False)
+    anonima = db.Column(db.Boolean, nullable=False, default=True)  # Visitante sin sesión
+    visitas = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('hora', 'path', 'anonima', name='uq_visitas_por_hora'),
+    )
+
+    def __repr__(self):
+        return f'<VisitaHora {self.hora} {self.path}: {self.visitas}>'
+
+class VisitaDia(db.Model):
+    """Visitas agregadas por día, ruta y usuario (usuario_id 0 = visitantes anónimos)."""
+    __tablename__ = 'visitas_por_dia'
+
+    id = db.Column(db.Integer, primary_key=True)
+    fecha = db.Column(db.Date, nullable=False)  # Fecha UTC
+    path = db.Column(db.String(512), nullable=False)
+    usuario_id = db.Column(db.Integer, nullable=False, default=0)  # Sin FK para admitir 0
+    visitas = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('fecha', 'path', 'usuario_id', name='uq_visitas_por_dia'),
+    )
+
+    def __repr__(self):
+        return f'<VisitaDia {self.fecha} {self.path}: {self.visitas}>'
+
+class VisitaTotalDia(db.Model):
+    """Total de visitas por día: una fila por fecha para los totales del panel."""
+    __tablename__ = 'visitas_total_dia'
+
+    fecha = db.Column(db.Date, primary_key=True)  # Fecha UTC
+    visitas = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<VisitaTotalDia {self.fecha}: {self.visitas}>'
+
+class TareaAdmin(db.Model):
+    """
+    Tarea de administración en segundo plano (eliminación masiva de usuarios).
+
+    El estado vive en la base de datos, no en el worker que la ejecuta: con
+    varios workers cualquiera puede informar el progreso, y si el worker se
+    reinicia la tarea se retoma desde el último bloque confirmado.
+    """
+    __tablename__ = 'tareas_admin'
+
+    id = db.Column(db.String(32), primary_key=True)
+    tipo = db.Column(db.String(30), nullable=False, default='eliminar_usuarios')
+    estado = db.Column(db.String(20), nullable=False, default='pendiente')  # pendiente, en_progreso, completada, error
+    ids = db.deferred(db.Column(db.Text, nullable=False, default='[]'))  # IDs a procesar (JSON, en orden)
+    total = db.Column(db.Integer, nullable=False, default=0)
+    procesados = db.Column(db.Integer, nullable=False, default=0)
+    eliminados = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text, nullable=True)
+    fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
+    inicio = db.Column(db.DateTime, nullable=True)
+    fin = db.Column(db.DateTime, nullable=True)
+    actualizada = db.Column(db.DateTime, nullable=True)  # Último avance (detecta workers caídos)
+
+    def to_dict(self):
+        """Estado de la tarea para la API"""
+        return {
+            'id': self.id,
+            'estado': self.estado,
+            'total': self.total,
+            'procesados': self.procesados,
+            'eliminados': self.eliminados,
+            'porcentaje': round(100 * self.procesados / self.total, 1) if self.total else 100.0,
+            'error': self.error,
+            'inicio': self.inicio.isoformat() if self.inicio else None,
+            'fin': self.fin.isoformat() if self.fin else None
+        }
+
+    def __repr__(self):
+        return f'<TareaAdmin {self.id} {self.estado}>'
+
+def configurar_sqlite(app):
+    """
+    Aplica ``SQLITE_PRAGMAS`` (WAL, synchronous, busy_timeout, mmap) a cada
+    conexión nueva del motor SQLite. Con otros motores no hace nada.
+    """
+    pragmas = app.config.get('SQLITE_PRAGMAS') or {}
+    with app.app_context():
+        motor = db.engine
+    if motor.dialect.name != 'sqlite' or not pragmas:
+        return
+    
+    @event.listens_for(motor, 'connect')
+    def _aplicar_pragmas(conexion_dbapi, registro):
+        cursor = conexion_dbapi.cursor()
+        for nombre, valor in pragmas.items():
+            cursor.execute(f"PRAGMA {nombre}={valor}")
+        cursor.close()
+
 def init_db(app):
     """Inicializa la base de datos"""
     # Solo inicializar si no está ya inicializado
@@ -440,17 +616,10 @@ def init_db(app):
         db.init_app(app)
     
     with app.app_context():
-        # Crear todas las tablas
-        db.create_all()
-        
-        # Verificar que las tablas se crearon correctamente
-        try:
-            print(f"✅ Base de datos inicializada con {Usuario.query.count()} usuarios")
-            print("🔒 Sistema configurado para autenticación exclusiva con Google OAuth")
-        except Exception as e:
-            print(f"❌ Error al inicializar base de datos: {e}")
-            # Intentar recrear las tablas
-            db.drop_all()
-            db.create_all()
-            print("🔄 Tablas recreadas")
-            print("🔒 Sistema configurado para autenticación exclusiva con Google OAuth") 
\ No newline at end of file
+        # Crear las tablas que falten y aplicar migraciones pendientes
+        from migraciones import actualizar_esquema
+        actualizar_esquema()
+        
+        # Sin conteos ni recreación de tablas: arranque rápido y nunca destructivo
+        print("✅ Base de datos inicializada")
+        print("🔒 Sistema configurado para autenticación exclusiva con Google OAuth") 
\ No newline at end of file
@@ -17,8 +17,10 @@ from datetime import datetime, timedelta
 # Agregar el directorio actual al path para importar los módulos
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from app import app, db
-from models import Usuario
+from fabrica import crear_app_base
+from models import db, Usuario
+
+app = crear_app_base()
 
 def otorgar_premium_usuario(email, tipo='mensual', duracion_dias=30, razon='Otorgado por administrador'):
     """Otorga premium a un usuario por email"""
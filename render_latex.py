@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Renderizado LaTeX a HTML - Plataforma Preuniversitaria
+=====================================================
+
+Conversión del LaTeX de los ejercicios a HTML compatible con MathJax y
+caché persistente de los resultados.
+
+La caché se guarda junto al JSON de ejercicios y se indexa por ID de
+ejercicio y hash del contenido, de modo que solo se vuelven a renderizar
+los ejercicios que cambiaron desde la última exportación. El catálogo
+binario (``--binario`` del exportador) ya trae el HTML y el hash de cada
+ejercicio, y en ese caso esta caché no se usa.
+
+Autor: Plataforma Preuniversitaria
+Fecha: 2025
+"""
+
+import hashlib
+import json
+import os
+import re
+from pathlib import Path
+
+# Incrementar cuando cambie procesar_latex para invalidar las cachés guardadas
+VERSION_RENDER = 1
+
+# Directorio raíz de ejercicios y materias con prioridad al resolver imágenes
+DIRECTORIO_EJERCICIOS = 'ejercicios_nuevo'
+MATERIAS_PRINCIPALES = (
+    'matematicas_preuniversitaria',
+    'fisica_preuniversitaria',
+    'quimica_preuniversitaria',
+    'lenguaje_literatura'
+)
+
+class IndiceImagenes:
+    """
+    Índice nombre de archivo -> ruta web de las imágenes de los ejercicios.
+
+    Se construye recorriendo una sola vez ``ejercicios_nuevo/<materia>/<capitulo>/imagenes``,
+    de modo que resolver un ``\\includegraphics`` no toca el disco. Si un mismo
+    nombre aparece en varios capítulos se usa el primero (según el orden de
+    ``MATERIAS_PRINCIPALES``) y se reporta en ``duplicados``.
+    """
+
+    def __init__(self, directorio=DIRECTORIO_EJERCICIOS):
+        self.directorio = Path(directorio)
+        self.rutas = None
+        self.duplicados = {}
+
+    def _materias(self):
+        """Directorios de materia en orden de prioridad"""
+        if not self.directorio.is_dir():
+            return []
+        existentes = sorted(d.name for d in self.directorio.iterdir() if d.is_dir())
+        prioritarias = [m for m in MATERIAS_PRINCIPALES if m in existentes]
+        return prioritarias + [m for m in existentes if m not in prioritarias]
+
+    def reconstruir(self):
+        """Recorre el árbol de ejercicios y reconstruye el índice completo"""
+        rutas = {}
+        ubicaciones = {}
+
+        for materia in self._materias():
+            for capitulo_dir in sorted((self.directorio / materia).iterdir()):
+                imagenes_dir = capitulo_dir / 'imagenes'
+                if not imagenes_dir.is_dir():
+                    continue
+                for archivo in imagenes_dir.rglob('*'):
+                    if not archivo.is_file():
+                        continue
+                    nombre = archivo.relative_to(imagenes_dir).as_posix()
+                    ruta_web = f'/static/ejercicios_nuevo/{materia}/{capitulo_dir.name}/imagenes/{nombre}'
+                    ubicaciones.setdefault(nombre, []).append(ruta_web)
+                    rutas.setdefault(nombre, ruta_web)
+
+        self.rutas = rutas
+        self.duplicados = {n: r for n, r in ubicaciones.items() if len(r) > 1}
+        for nombre, candidatas in self.duplicados.items():
+            print(f"⚠️  Imagen ambigua '{nombre}' en {len(candidatas)} capítulos; se usa {candidatas[0]}")
+        return self
+
+    def firma(self):
+        """Hash del contenido del índice (cambia si se mueven o agregan imágenes)"""
+        if self.rutas is None:
+            self.reconstruir()
+        h = hashlib.sha1()
+        for nombre in sorted(self.rutas):
+            h.update(f'{nombre}\0{self.rutas[nombre]}\n'.encode('utf-8'))
+        return h.hexdigest()
+
+    def resolver(self, ruta_imagen):
+        """Devuelve la ruta web de una imagen referenciada desde LaTeX"""
+        if self.rutas is None:
+            self.reconstruir()
+
+        ruta_web = self.rutas.get(ruta_imagen)
+        if ruta_web is None and ruta_imagen.startswith('imagenes/'):
+            # Los .tex suelen referenciar la imagen relativa al capítulo
+            ruta_web = self.rutas.get(ruta_imagen[len('imagenes/'):])
+
+        # Si no se encuentra en la nueva estructura, devolver ruta por defecto
+        return ruta_web or f'/static/ejercicios_nuevo/{ruta_imagen}'
+
+# Índice compartido por el proceso; se reconstruye al recargar el catálogo
+indice_imagenes = IndiceImagenes()
+
+def procesar_latex(texto, indice=None):
+    """
+    Procesa el texto LaTeX para que sea compatible con MathJax y HTML.
+
+    Las imágenes se resuelven con ``indice`` (por defecto el índice
+    compartido del proceso).
+    """
+    if indice is None:
+        indice = indice_imagenes
+    if not texto:
+        return texto
+    
+    # Eliminar líneas de comentarios de LaTeX (que empiezan con %)
+    lineas = texto.split('\n')
+    lineas_filtradas = []
+    for linea in lineas:
+        linea_limpia = linea.strip()
+        if linea_limpia and not linea_limpia.startswith('%'):
+            lineas_filtradas.append(linea)
+    texto = '\n'.join(lineas_filtradas)
+    
+    # Procesar entornos figure
+    figure_pattern = r'\\begin\{figure\}\[([^\]]*)\](.*?)\\end\{figure\}'
+    
+    def procesar_figure(match):
+        opciones = match.group(1)
+        contenido = match.group(2).strip()
+        
+        # Extraer la imagen y el caption
+        imagen_match = re.search(r'\\includegraphics\[([^\]]*)\]\{([^}]+)\}', contenido)
+        caption_match = re.search(r'\\caption\{([^}]+)\}', contenido)
+        
+        if imagen_match:
+            opciones_img = imagen_match.group(1)
+            ruta_imagen = imagen_match.group(2)
+            
+            # Convertir ruta de imagen para web
+            ruta_web = indice.resolver(ruta_imagen)
+            
+            # Construir HTML para la imagen
+            html_img = f'<img src="{ruta_web}" alt="Diagrama" class="img-fluid rounded shadow-sm" style="max-width: 100%; height: auto;">'
+            
+            # Agregar caption si existe
+            caption_html = ""
+            if caption_match:
+                caption_text = caption_match.group(1)
+                caption_html = f'<figcaption class="text-center mt-2 text-muted"><small><em>{caption_text}</em></small></figcaption>'
+            
+            # Construir figure HTML completo
+            figure_html = f'<figure class="text-center my-4">{html_img}{caption_html}</figure>'
+            
+            return figure_html
+        
+        return match.group(0)
+    
+    # Aplicar procesamiento de figure
+    texto = re.sub(figure_pattern, procesar_figure, texto, flags=re.DOTALL)
+    
+    # Reemplazar \n con <br> para saltos de línea
+    texto = texto.replace('\n', '<br>')
+    
+    # Convertir comandos LaTeX de formato a HTML
+    texto = re.sub(r'\\textbf\{([^}]+)\}', r'<strong>\1</strong>', texto)
+    texto = re.sub(r'\\textit\{([^}]+)\}', r'<em>\1</em>', texto)
+    texto = re.sub(r'\\underline\{([^}]+)\}', r'<u>\1</u>', texto)
+    texto = re.sub(r'\\text\{([^}]+)\}', r'\1', texto)
+    
+    # Convertir listas numeradas con formato
+    texto = re.sub(r'(\d+\))\s*\\textbf\{([^}]+)\}', r'\1 <strong>\2</strong>', texto)
+    
+    # Convertir listas con itemize y enumerate
+    texto = re.sub(r'\\begin\{itemize\}(.*?)\\end\{itemize\}', r'<ul>\1</ul>', texto, flags=re.DOTALL)
+    texto = re.sub(r'\\begin\{enumerate\}(.*?)\\end\{enumerate\}', r'<ol>\1</ol>', texto, flags=re.DOTALL)
+    texto = re.sub(r'\\item\s*', r'<li>', texto)
+    # Cerrar las listas de manera más simple
+    texto = re.sub(r'</ul>\s*<ul>', r'', texto)
+    texto = re.sub(r'</ol>\s*<ol>', r'', texto)
+    
+    # Convertir respuestas y notas
+    texto = re.sub(r'\\textbf\{Respuesta:\}\s*([^<]+)', r'<div class="alert alert-success mt-3"><strong>Respuesta:</strong> \1</div>', texto)
+    texto = re.sub(r'\\textbf\{Nota:\}\s*([^<]+)', r'<div class="alert alert-info mt-2"><strong>Nota:</strong> \1</div>', texto)
+    
+    # Convertir símbolos matemáticos comunes
+    texto = re.sub(r'\\cdot', r'·', texto)
+    texto = re.sub(r'\\div', r'÷', texto)
+    texto = re.sub(r'\\to', r'→', texto)
+    texto = re.sub(r'\\infty', r'∞', texto)
+    
+    # Asegurar que las fórmulas estén bien formateadas
+    texto = re.sub(r'\$([^$]+)\$', r'$\1$', texto)
+    texto = re.sub(r'\$\$([^$]+)\$\$', r'$$\1$$', texto)
+    
+    return texto
+
+def ruta_cache_render(ruta_json):
+    """Ruta del archivo de caché asociado a un JSON de ejercicios"""
+    ruta = Path(ruta_json)
+    return ruta.with_name(f"{ruta.stem}.render.json")
+
+def firma_render(indice=None):
+    """
+    Identifica las condiciones del HTML renderizado: versión de
+    ``procesar_latex`` y firma del índice de imágenes. El HTML guardado
+    con otra firma ya no es válido.
+    """
+    return {'version': VERSION_RENDER, 'imagenes': (indice or indice_imagenes).firma()}
+
+def hash_contenido(ejercicio):
+    """Hash del LaTeX de un ejercicio (enunciado y solución)"""
+    h = hashlib.sha1()
+    h.update(str(VERSION_RENDER).encode())
+    for campo in ('enunciado', 'solucion'):
+        h.update(b'\0')
+        h.update((ejercicio.get(campo) or '').encode('utf-8'))
+    return h.hexdigest()
+
+class CacheRenderizado:
+    """
+    Caché persistente de HTML renderizado, indexada por ID y hash de contenido.
+
+    Formato del archivo::
+
+        {"version": 1, "imagenes": "<firma>", "entradas": {"<id>": {"hash": ..., "enunciado": ..., "solucion": ...}}}
+
+    Si cambia la firma del índice de imágenes, las rutas web guardadas ya no
+    son válidas y la caché se descarta completa.
+    """
+
+    def __init__(self, ruta):
+        self.ruta = Path(ruta)
+        self.entradas = {}
+        self.firma_imagenes = indice_imagenes.firma()
+
+    def cargar(self):
+        """Lee la caché del disco; si no existe o es inválida empieza vacía"""
+        try:
+            with open(self.ruta, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            self.entradas = {}
+            return self
+        if data.get('version') == VERSION_RENDER and data.get('imagenes') == self.firma_imagenes:
+            self.entradas = data.get('entradas', {})
+        else:
+            self.entradas = {}
+        return self
+
+    def guardar(self):
+        """Escribe la caché de forma atómica (archivo temporal + rename)"""
+        tmp = self.ruta.with_name(f".{self.ruta.name}.tmp")
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'version': VERSION_RENDER, 'imagenes': self.firma_imagenes,
+                           'entradas': self.entradas},
+                          f, ensure_ascii=False, separators=(',', ':'))
+            os.replace(tmp, self.ruta)
+        except OSError as e:
+            # Directorio de solo lectura: la caché sigue valiendo en memoria
+            print(f"⚠️  No se pudo guardar la caché de renderizado {self.ruta}: {e}")
+
+    def renderizar(self, ejercicios, hashes=None):
+        """
+        Devuelve {id: (enunciado_html, solucion_html)} para todos los ejercicios.
+
+        Solo se renderizan los ejercicios nuevos o modificados; si hubo
+        cambios la caché se vuelve a guardar en disco. ``hashes`` ({id: hash})
+        evita leer el LaTeX de los ejercicios que ya están en la caché.
+        """
+        resultado = {}
+        nuevas = {}
+        renderizados = 0
+
+        for ejercicio in ejercicios:
+            ejercicio_id = ejercicio.get('id')
+            if ejercicio_id is None:
+                continue
+            h = hashes.get(ejercicio_id) if hashes else None
+            if h is None:
+                h = hash_contenido(ejercicio)
+            entrada = self.entradas.get(ejercicio_id)
+            if not entrada or entrada.get('hash') != h:
+                entrada = {
+                    'hash': h,
+                    'enunciado': procesar_latex(ejercicio.get('enunciado')),
+                    'solucion': procesar_latex(ejercicio.get('solucion'))
+                }
+                renderizados += 1
+            nuevas[ejercicio_id] = entrada
+            resultado[ejercicio_id] = (entrada['enunciado'], entrada['solucion'])
+
+        # Guardar si hubo renderizados o si desaparecieron ejercicios
+        cambio = renderizados or len(nuevas) != len(self.entradas)
+        self.entradas = nuevas
+        if cambio:
+            self.guardar()
+            print(f"🧮 Renderizados {renderizados} ejercicios ({len(nuevas) - renderizados} desde caché)")
+
+        return resultado
@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+"""Configuración de pytest: los módulos de la aplicación viven en la raíz del proyecto"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
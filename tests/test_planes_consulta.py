@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Planes de consulta de las sentencias frecuentes
+==============================================
+
+Crea el esquema en una base SQLite en memoria con ``init_db`` y verifica
+con ``EXPLAIN QUERY PLAN`` que cada sentencia de
+``migraciones.consultas_frecuentes`` usa un índice: un índice eliminado o
+una consulta que deja de usarlo hace fallar la prueba.
+"""
+
+import pytest
+
+from fabrica import crear_app_base
+from migraciones import consultas_frecuentes, verificar_planes
+from models import init_db
+
+@pytest.fixture(scope='module')
+def app():
+    app = crear_app_base('testing')
+    init_db(app)
+    with app.app_context():
+        yield app
+
+def test_verifica_todas_las_consultas_frecuentes(app):
+    assert set(verificar_planes()) == set(consultas_frecuentes())
+
+@pytest.mark.parametrize('nombre', sorted(consultas_frecuentes()))
+def test_consulta_frecuente_usa_indice(app, nombre):
+    usa_indice, detalle = verificar_planes()[nombre]
+    assert usa_indice, f"{nombre} recorre la tabla completa: {detalle}"
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Registro de Visitas - Plataforma Preuniversitaria
+================================================
+
+Registro de visitas en segundo plano y por lotes.
+
+Las solicitudes solo encolan la visita en memoria; un hilo por proceso la
+escribe en la base de datos en lotes (``executemany``) cada ``tam_lote``
+visitas o cada ``intervalo`` segundos, lo que ocurra primero. Así la
+latencia de una página no incluye el commit ni el bloqueo de escritura
+de SQLite.
+
+La cola está acotada: si la base de datos no da abasto, las visitas que no
+caben se descartan y se cuentan en ``descartadas`` en lugar de frenar las
+solicitudes. Al terminar el proceso se escribe lo pendiente.
+
+Cada lote se inserta ya marcado como ``resumida`` y, en la misma
+transacción, se suma a los resúmenes por hora y por día (``VisitaHora`` /
+``VisitaDia``) y al total del día (``VisitaTotalDia``, una fila por fecha
+para los totales del panel) a partir del propio lote en memoria, sin volver a leer las
+visitas crudas. ``resumir_visitas`` solo recoge las visitas que hayan
+quedado sin resumir (filas antiguas o escritas por otra vía), así que cada
+visita se cuenta una sola vez y las antiguas se pueden podar con
+``compactar_visitas`` sin perder los totales.
+
+Autor: Plataforma Preuniversitaria
+Fecha: 2025
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, update
+
+from models import db, VisitaPagina, VisitaHora, VisitaDia, VisitaTotalDia
+
+# IDs por UPDATE al marcar visitas resumidas (SQLite limita los parámetros por consulta)
+TAM_BLOQUE_MARCAR = 500
+
+def _sumar_conteos(modelo, claves, conteos):
+    """
+    Suma ``conteos`` ({tupla_de_claves: visitas}) a la tabla de resumen con un
+    upsert por lotes (ON CONFLICT en SQLite/PostgreSQL).
+    """
+    if not conteos:
+        return
+    tabla = modelo.__table__
+    filas = [dict(zip(claves, clave), visitas=visitas) for clave, visitas in conteos.items()]
+    dialecto = db.session.get_bind().dialect.name
+
+    if dialecto in ('sqlite', 'postgresql'):
+        if dialecto == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(tabla)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(claves),
+            set_={'visitas': tabla.c.visitas + stmt.excluded.visitas}
+        )
+        db.session.execute(stmt, filas)
+        return
+
+    # Otros motores: UPDATE y, si no existía la fila, INSERT
+    for fila in filas:
+        condicion = [tabla.c[c] == fila[c] for c in claves]
+        resultado = db.session.execute(
+            update(tabla).where(*condicion).values(visitas=tabla.c.visitas + fila['visitas'])
+        )
+        if resultado.rowcount == 0:
+            db.session.execute(tabla.insert(), [fila])
+
+def _sumar_resumenes(visitas):
+    """Suma a VisitaHora/VisitaDia/VisitaTotalDia las visitas (path, fecha, usuario_id) indicadas"""
+    por_hora = Counter()
+    por_dia = Counter()
+    por_fecha = Counter()
+    for path, fecha, usuario_id in visitas:
+        if fecha is None:
+            continue
+        por_hora[(fecha.replace(minute=0, second=0, microsecond=0), path, usuario_id is None)] += 1
+        por_dia[(fecha.date(), path, usuario_id or 0)] += 1
+        por_fecha[(fecha.date(),)] += 1
+
+    _sumar_conteos(VisitaHora, ('hora', 'path', 'anonima'), por_hora)
+    _sumar_conteos(VisitaDia, ('fecha', 'path', 'usuario_id'), por_dia)
+    _sumar_conteos(VisitaTotalDia, ('fecha',), por_fecha)
+
+def consulta_visitas_pendientes(tam_bloque):
+    """SELECT del siguiente bloque de visitas crudas sin resumir, en orden de ID"""
+    return (db.select(VisitaPagina.id, VisitaPagina.path, VisitaPagina.fecha, VisitaPagina.usuario_id)
+            .where(VisitaPagina.resumida.is_(False))
+            .order_by(VisitaPagina.id)
+            .limit(tam_bloque))
+
+def consulta_visitas_pendientes_usuarios(usuario_ids):
+    """SELECT de las visitas crudas sin resumir de los usuarios indicados"""
+    return (db.select(VisitaPagina.id, VisitaPagina.path, VisitaPagina.fecha, VisitaPagina.usuario_id)
+            .where(VisitaPagina.usuario_id.in_(usuario_ids), VisitaPagina.resumida.is_(False)))
+
+def consulta_visitas_compactables(limite, tam_bloque):
+    """SELECT de IDs de visitas anteriores a ``limite`` ya incluidas en los resúmenes"""
+    return (db.select(VisitaPagina.id)
+            .where(VisitaPagina.fecha < limite, VisitaPagina.resumida.is_(True))
+            .limit(tam_bloque))
+
+def consulta_total_visitas(desde=None):
+    """SELECT del total de visitas (una fila por día, opcionalmente desde una fecha)"""
+    consulta = db.select(func.coalesce(func.sum(VisitaTotalDia.visitas), 0))
+    if desde is not None:
+        consulta = consulta.where(VisitaTotalDia.fecha >= desde)
+    return consulta
+
+def _marcar_resumidas(ids):
+    """
+    Marca como resumidas las visitas indicadas que aún no lo estaban.
+
+    Devuelve cuántas marcó; si es menos que ``len(ids)``, otro proceso ya
+    tomó parte del bloque.
+    """
+    marcadas = 0
+    for i in range(0, len(ids), TAM_BLOQUE_MARCAR):
+        marcadas += db.session.execute(
+            update(VisitaPagina)
+            .where(VisitaPagina.id.in_(ids[i:i + TAM_BLOQUE_MARCAR]), VisitaPagina.resumida.is_(False))
+            .values(resumida=True)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+    return marcadas
+
+def resumir_visitas(tam_bloque=5000):
+    """
+    Agrega a los resúmenes las visitas crudas que aún no están
+    resumidas y las marca como resumidas en la misma transacción. El
+    registro en segundo plano ya resume cada lote al insertarlo; esto
+    recoge lo que haya quedado pendiente (cron y ``compactar_visitas``).
+
+    Cada visita se cuenta exactamente una vez aunque los IDs se confirmen
+    fuera de orden (PostgreSQL) o varios procesos resuman a la vez: las
+    filas se marcan primero con un UPDATE condicionado a ``resumida`` y, si
+    otro proceso ya marcó alguna, se descarta el bloque.
+
+    Requiere app_context. Devuelve el número de visitas resumidas.
+    """
+    total = 0
+
+    while True:
+        filas = db.session.execute(consulta_visitas_pendientes(tam_bloque)).all()
+        if not filas:
+            break
+
+        if _marcar_resumidas([fila.id for fila in filas]) != len(filas):
+            db.session.rollback()
+            break
+
+        _sumar_resumenes((path, fecha, usuario_id) for _, path, fecha, usuario_id in filas)
+        db.session.commit()
+
+        total += len(filas)
+
+    return total
+
+def resumir_visitas_de_usuarios(usuario_ids):
+    """
+    Suma a los resúmenes y marca como resumidas las visitas pendientes de
+    los usuarios indicados, sin confirmar: se usa dentro de la transacción
+    que luego borra esas visitas. Requiere app_context.
+
+    Devuelve el número de visitas resumidas, o None si otro proceso marcó
+    parte de ellas a la vez (el llamador debe deshacer y reintentar).
+    """
+    filas = db.session.execute(consulta_visitas_pendientes_usuarios(usuario_ids)).all()
+    if not filas:
+        return 0
+    if _marcar_resumidas([fila.id for fila in filas]) != len(filas):
+        return None
+    _sumar_resumenes((path, fecha, usuario_id) for _, path, fecha, usuario_id in filas)
+    return len(filas)
+
+def compactar_visitas(dias=90, tam_bloque=5000):
+    """
+    Resume lo pendiente y elimina las visitas crudas con más de ``dias`` días
+    que ya están incluidas en los resúmenes. Requiere app_context.
+
+    Devuelve (visitas_resumidas, visitas_eliminadas).
+    """
+    resumidas = resumir_visitas(tam_bloque)
+    limite = datetime.utcnow() - timedelta(days=dias)
+    eliminadas = 0
+
+    while True:
+        ids = db.session.scalars(consulta_visitas_compactables(limite, tam_bloque)).all()
+        if not ids:
+            break
+        db.session.query(VisitaPagina).filter(VisitaPagina.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        eliminadas += len(ids)
+
+    return resumidas, eliminadas
+
+def contar_visitas(desde=None):
+    """Total de visitas según los totales por día (opcionalmente desde una fecha)"""
+    return db.session.execute(consulta_total_visitas(desde)).scalar()
+
+class RegistroVisitas:
+    """Buffer de visitas con escritura por lotes desde un hilo en segundo plano"""
+
+    def __init__(self, tam_lote=200, intervalo=2.0, max_cola=10000):
+        self.tam_lote = tam_lote
+        self.intervalo = intervalo
+        self.max_cola = max_cola
+
+        self.registradas = 0
+        self.descartadas = 0
+        self.errores = 0
+
+        self._app = None
+        self._cola = queue.Queue(maxsize=max_cola)
+        self._hilo = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._registrado_atexit = False
+
+    def init_app(self, app):
+        """Asocia el registro a la aplicación (necesario para abrir app_context)"""
+        self._app = app
+        self.tam_lote = app.config.get('VISITAS_TAM_LOTE', self.tam_lote)
+        self.intervalo = app.config.get('VISITAS_INTERVALO', self.intervalo)
+        app.extensions['registro_visitas'] = self
+        # Una sola vez aunque se creen varias aplicaciones en el mismo proceso
+        if not self._registrado_atexit:
+            atexit.register(self.detener)
+            self._registrado_atexit = True
+
+    def _asegurar_hilo(self):
+        """Arranca el hilo escritor en este proceso (también tras un fork)"""
+        if self._pid == os.getpid() and self._hilo is not None and self._hilo.is_alive():
+            return
+
+        with self._lock:
+            if self._pid == os.getpid() and self._hilo is not None and self._hilo.is_alive():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # Proceso hijo: la cola heredada pertenece al padre
+                self._cola = queue.Queue(maxsize=self.max_cola)
+            self._pid = os.getpid()
+            self._detener.clear()
+            self._hilo = threading.Thread(target=self._bucle, name='registro-visitas', daemon=True)
+            self._hilo.start()
+
+    def registrar(self, path, usuario_id=None, ip_address=None, user_agent=None):
+        """Encola una visita sin tocar la base de datos"""
+        self._asegurar_hilo()
+        try:
+            self._cola.put_nowait({
+                'path': path[:512],
+                'fecha': datetime.utcnow(),
+                'usuario_id': usuario_id,
+                'ip_address': (ip_address or '')[:45] or None,
+                'user_agent': user_agent
+            })
+        except queue.Full:
+            with self._lock:
+                self.descartadas += 1
+
+    def _tomar_lote(self, espera):
+        """Toma hasta tam_lote visitas esperando como máximo ``espera`` segundos"""
+        lote = []
+        limite = time.monotonic() + espera
+        while len(lote) < self.tam_lote:
+            restante = limite - time.monotonic()
+            try:
+                if restante > 0:
+                    lote.append(self._cola.get(timeout=restante))
+                else:
+                    lote.append(self._cola.get_nowait())
+            except queue.Empty:
+                break
+        return lote
+
+    def _escribir(self, lote):
+        """
+        Inserta un lote ya resumido con un único executemany y suma sus
+        conteos a los resúmenes, todo en un único commit
+        """
+        if not lote or self._app is None:
+            return
+        with self._app.app_context():
+            try:
+                db.session.execute(VisitaPagina.__table__.insert(),
+                                   [dict(visita, resumida=True) for visita in lote])
+                _sumar_resumenes((visita['path'], visita['fecha'], visita['usuario_id']) for visita in lote)
+                db.session.commit()
+                with self._lock:
+                    self.registradas += len(lote)
+            except Exception as e:
+                db.session.rollback()
+                with self._lock:
+                    self.errores += len(lote)
+                print(f"⚠️  No se pudieron registrar {len(lote)} visitas: {e}")
+
+    def _bucle(self):
+        """Bucle del hilo escritor"""
+        while not self._detener.is_set():
+            self._escribir(self._tomar_lote(self.intervalo))
+
+    def vaciar(self):
+        """Escribe inmediatamente todas las visitas pendientes"""
+        while True:
+            lote = self._tomar_lote(0)
+            if not lote:
+                break
+            self._escribir(lote)
+
+    def detener(self, espera=None):
+        """
+        Detiene el hilo escritor y escribe lo pendiente (se llama al salir).
+
+        Se espera a que el hilo termine el lote que tiene en curso (como
+        máximo ``espera`` segundos) y luego se escribe lo que quedó en la cola.
+        """
+        self._detener.set()
+        if self._pid != os.getpid():
+            return
+        hilo = self._hilo
+        if hilo is not None and hilo is not threading.current_thread():
+            hilo.join(timeout=self.intervalo + 5 if espera is None else espera)
+        self.vaciar()
+
+    def estadisticas(self):
+        """Contadores del registro para monitoreo"""
+        return {
+            'pendientes': self._cola.qsize(),
+            'registradas': self.registradas,
+            'descartadas': self.descartadas,
+            'errores': self.errores
+        }
+
+# Registro compartido por todas las solicitudes del proceso
+registro_visitas = RegistroVisitas()